@@ -4,6 +4,8 @@ Usage:
   fcreplay cli
   fcreplay config generate
   fcreplay config validate <config.json>
+  fcreplay db migrate
+  fcreplay db indexes
   fcreplay get game <gameid>
   fcreplay get ranked <gameid> [--playerid=<playerid>] [--pages=<pages>]
   fcreplay get replay <url> [--playerrequested]
@@ -13,6 +15,7 @@ Usage:
   fcreplay tasker start check_video_status
   fcreplay tasker start retry_failed_replays
   fcreplay tasker start delete_failed_replays
+  fcreplay tasker start submissions
   fcreplay tasker start recorder [--max_instances=<instances>]
   fcreplay (-h | --help)
   fcreplay --version
@@ -27,6 +30,7 @@ from docopt import docopt
 from fcreplay import fclogging
 from fcreplay.cli import Cli
 from fcreplay.config import Config
+from fcreplay.database import Database
 from fcreplay.getreplay import Getreplay
 from fcreplay.instance import Instance
 import os
@@ -62,6 +66,8 @@ def main():
                 Tasker().schedule_retry_failed_replays()
             if args['delete_failed_replays']:
                 Tasker().schedule_delete_failed_replays()
+            if args['submissions']:
+                Tasker().schedule_process_submissions()
 
     elif args['cli']:
         c = Cli()
@@ -73,6 +79,14 @@ def main():
         if args['generate']:
             Config().generate_config()
 
+    elif args['db']:
+        if args['migrate']:
+            applied = Database().migrate()
+            print(f"Applied migrations: {applied}" if applied else "Database is up to date")
+        if args['indexes']:
+            for i in Database().get_index_usage():
+                print(f"{i['table']:<20} {i['index']:<40} scans: {i['scans']}, tuples read: {i['tuples_read']}, size: {i['size']}")
+
     elif args['get']:
         if args['game']:
             Getreplay().get_game_replays(game=args['<gameid>'])
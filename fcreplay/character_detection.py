@@ -1,102 +1,96 @@
 """Character Detection.
 
-This class is used to take the overlay data from a pickle file
-and generate a list of times characters were detected
+This class is used to read the overlay event log written by
+OverlayDetection and generate a list of times characters were detected
 """
 
-import pickle
+from fcreplay.config import Config
+
 import datetime
+import json
 
 
-class CharacterDetection:
-    """Character detection class from pickle file."""
+# Seconds within which a character change replaces the previous one, eg
+# while a player is still picking. Games can set 'character_debounce' in
+# supported_games.json
+DEFAULT_DEBOUNCE_SECONDS = 5
 
-    def __init__(self):
-        """Initiliser."""
-        self.pickle_path = '/Fightcade/emulator/fbneo/avi/overlay.pickle'
-        self.video_start_time = None
-        self.timeline = []
+CHARACTER_OVERLAYS = ('p1character', 'p2character')
 
-    def _load_overlay_pickle(self) -> dict:
-        """Return a dict containing overlay data."""
-        with open(self.pickle_path, 'rb') as f:
-            overlay_data = pickle.load(f)
-            self.video_start_time = overlay_data.pop(0)['start_time']
 
-        return overlay_data
+class CharacterDetection:
+    """Character detection class from the overlay event log."""
 
-    def _characters_exist(self) -> bool:
-        """Check to see if p1character or p2character exists in overlay data.
+    def __init__(self, event_log_path: str = None, debounce: int = DEFAULT_DEBOUNCE_SECONDS):
+        """Initiliser.
 
-        Returns:
-            bool
+        Args:
+            event_log_path (str, optional): Path of the overlay event log. Defaults to the
+                overlay_event_log config key.
+            debounce (int, optional): Seconds within which a character change replaces the
+                previous one. Defaults to DEFAULT_DEBOUNCE_SECONDS.
         """
-        for event in self.overlay_data:
-            if any(event['overlay_type'] in i for i in ['p1character', 'p2character']):
-                return True
-
-        return False
+        self.event_log_path = event_log_path or Config().overlay_event_log
+        self.debounce = debounce
+        self.video_start_time = None
+        self.timeline = []
 
-    def _get_video_time(self, detection_time: datetime.datetime) -> str:
-        """Return the video time return as a string.
+    def _read_events(self):
+        """Yield character events from the event log, one line at a time.
 
-        Args:
-            detection_time (Datetime): Datetime of when a detection event happened
+        The first line of the log is the start time of the video. A last line
+        without a newline was cut off by a crash, and is skipped.
 
-        Returns:
-            str: String format of video time h:mm:ss
+        Yields:
+            dict: Overlay event, with 'date', 'overlay_type' and 'overlay_data'
         """
-        time_seconds = int((detection_time - self.video_start_time).total_seconds())
-        formatted_time = str(datetime.timedelta(seconds=time_seconds))
-        if self._time_too_soon(time_seconds):
-            del self.timeline[-1]
-            return formatted_time
-        else:
-            return formatted_time
+        with open(self.event_log_path, 'r') as f:
+            for line in f:
+                if not line.endswith('\n'):
+                    break
 
-    def _time_too_soon(self, new_time: int) -> bool:
-        """Check time against previous time, if it's within a 5 seconds, then return true else return false.
+                if self.video_start_time is None:
+                    self.video_start_time = datetime.datetime.fromisoformat(json.loads(line)['start_time'])
+                    continue
 
-        Args:
-            new_time (int): <seconds>
-        """
-        if len(self.timeline) == 0:
-            return False
+                event = json.loads(line)
+                if event['overlay_type'] in CHARACTER_OVERLAYS:
+                    yield event
 
-        pt_list = self.timeline[-1][2].split(':')
-        pt_list = list(map(int, pt_list))
+    @staticmethod
+    def _format_time(seconds: int) -> str:
+        """Return seconds formatted as h:mm:ss."""
+        return str(datetime.timedelta(seconds=seconds))
 
-        pt_seconds = (((pt_list[0] * 60) + pt_list[1]) * 60) + pt_list[2]
+    def _create_timeline(self, events) -> list:
+        """Create a timeline of character changes in a single pass.
 
-        if (new_time - pt_seconds) < 5:
-            return True
-        else:
-            return False
+        Times are kept in seconds and only formatted for the result. A change
+        within debounce seconds of the previous one replaces it.
 
-    def _create_timeline(self) -> list:
-        """Create a timeline of character changes.
+        Args:
+            events (iterable): Character events, oldest first
 
         Returns:
             list: [[str: p1character, str: p2character, str: time]...]
         """
-        p1character = None
-        p2character = None
-        overlay_time = None
-
-        for event in self.overlay_data:
-            set_characters = [p1character, p2character]
+        characters = {'p1character': None, 'p2character': None}
+        timeline = []
 
-            if 'p1character' == event['overlay_type']:
-                p1character = event['overlay_data']
-                overlay_time = event['date']
+        for event in events:
+            if characters[event['overlay_type']] == event['overlay_data']:
+                continue
+            characters[event['overlay_type']] = event['overlay_data']
 
-            elif 'p2character' == event['overlay_type']:
-                p2character = event['overlay_data']
-                overlay_time = event['date']
+            if None in characters.values():
+                continue
 
-            if (None not in [p1character, p2character, overlay_time]) and [p1character, p2character] != set_characters:
-                self.timeline.append([p1character, p2character, self._get_video_time(overlay_time)])
+            seconds = int((datetime.datetime.fromisoformat(event['date']) - self.video_start_time).total_seconds())
+            if timeline and seconds - timeline[-1][2] < self.debounce:
+                timeline.pop()
+            timeline.append([characters['p1character'], characters['p2character'], seconds])
 
+        self.timeline = [[p1, p2, self._format_time(seconds)] for p1, p2, seconds in timeline]
         return self.timeline
 
     def get_characters(self):
@@ -106,10 +100,4 @@ class CharacterDetection:
             list: Returns a nested list of characters and the time they were discovered,
                   eg: [['p1char', 'p2char', '0:01']]
         """
-        self.overlay_data = self._load_overlay_pickle()
-
-        if self._characters_exist():
-            return self._create_timeline()
-
-        else:
-            return []
+        return self._create_timeline(self._read_events())
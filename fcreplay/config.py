@@ -3,11 +3,45 @@ import base64
 import json
 import os
 import sys
+import threading
 
 
-class Config:
+class _CachedConfig(type):
+    """Metaclass that shares one validated Config instance per config file.
+
+    The file is only re-read and re-validated when its mtime or size changes.
+    """
+
+    _instances: dict = {}
+    _lock = threading.Lock()
+
+    def __call__(cls):
+        path = cls._config_path()
+
+        try:
+            st = os.stat(path)
+            signature = (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            # Let __init__ report the missing file
+            return super().__call__()
+
+        with cls._lock:
+            cached = cls._instances.get(path)
+            if cached is not None and cached[0] == signature:
+                return cached[1]
+
+            instance = super().__call__()
+            object.__setattr__(instance, '_frozen', True)
+            cls._instances[path] = (signature, instance)
+            return instance
+
+
+class Config(metaclass=_CachedConfig):
     """ Configuration class.
     This class is used to load and validate the configuration file.
+
+    Config() returns a shared, read-only instance. The file is loaded and
+    validated once per process and again only when it changes on disk.
     """
 
     def __init__(self):
@@ -20,9 +54,18 @@ class Config:
         self.fcreplay_dir: str = str()
         "Path to the fcreplay directory"
 
+        self.fightcade_api: dict = dict()
+        "Fightcade api client settings"
+
+        self.fulltext_search: bool = True
+        "If true, the site searches descriptions with the full text index"
+
         self.get_weekly_replay_pages: int = int()
         "Number of pages to get from the fcadedbneo website"
 
+        self.frame_stall_timeout: float = 2.0
+        "Seconds without a new frame before a recording is treated as finished, the only end of recording detection"
+
         self.ia_settings: dict = dict()
         "Settings for the IA"
 
@@ -44,12 +87,18 @@ class Config:
         self.max_replay_length: int = int()
         "Maximum length of a replay"
 
+        self.overlay_event_log: str = str()
+        "Path of the overlay event log written while recording, defaults to overlay_events.jsonl in fcadefbneo_path"
+
         self.player_replay_first: bool = bool()
         "If true, player replays will be encoded first"
 
         self.random_replay: bool = bool()
         "If true, a random replay will be selected"
 
+        self.random_replay_strategy: str = 'random_key'
+        "How random replays are selected, 'random_key' or 'order_by_random'"
+
         self.record_timeout: int = int()
         "Timeout for the record command"
 
@@ -59,12 +108,24 @@ class Config:
         self.remove_old_avi_files: bool = bool()
         "If true, old avi files will be removed"
 
+        self.response_cache: dict = dict()
+        "Cache settings for rendered site pages"
+
         self.secret_key: str = str()
         "Secret key for the flask app"
 
+        self.site_url: str = 'https://fightcadevids.com'
+        "Canonical url of the site"
+
+        self.sitemap_dir: str = '/tmp/fcreplay-sitemaps'
+        "Directory the site writes video sitemaps to"
+
         self.sql_baseurl: str = str()
         "Base url for the sql database"
 
+        self.sql_pool: dict = dict()
+        "Connection pool settings for the sql database"
+
         self.upload_to_ia: bool = bool()
         "If true, replays will be uploaded to the IA"
 
@@ -99,6 +160,30 @@ class Config:
             else:
                 setattr(self, k, c[k])
 
+        if not self.overlay_event_log:
+            self.overlay_event_log = os.path.join(self.fcadefbneo_path, 'overlay_events.jsonl')
+
+    def __setattr__(self, name, value):
+        if self.__dict__.get('_frozen', False):
+            raise AttributeError(f"Config is read-only, unable to set '{name}'")
+        super().__setattr__(name, value)
+
+    @staticmethod
+    def _config_path() -> str:
+        """Return the absolute path of the config file in use."""
+        return os.path.abspath(os.environ.get('FCREPLAY_CONFIG', 'config.json'))
+
+    @classmethod
+    def reload(cls) -> 'Config':
+        """Drop the cached config and load it again from disk.
+
+        Returns:
+            Config: The newly loaded config
+        """
+        with _CachedConfig._lock:
+            _CachedConfig._instances.pop(cls._config_path(), None)
+        return cls()
+
     def _validate_config(self) -> dict:
         """ Private function to validate config
         """
@@ -127,6 +212,106 @@ class Config:
                     'description': 'Path of where to run fcreplay',
                 }
             },
+            'fightcade_api': {
+                'type': 'dict',
+                'required': False,
+                'schema': {
+                    'url': {
+                        'type': 'string',
+                        'required': False,
+                    },
+                    'concurrency': {
+                        'type': 'integer',
+                        'min': 1,
+                        'required': False,
+                    },
+                    'requests_per_second': {
+                        'type': 'number',
+                        'min': 0,
+                        'required': False,
+                    },
+                    'retries': {
+                        'type': 'integer',
+                        'min': 1,
+                        'required': False,
+                    },
+                    'retry_wait_ms': {
+                        'type': 'integer',
+                        'required': False,
+                    },
+                    'retry_wait_max_ms': {
+                        'type': 'integer',
+                        'required': False,
+                    },
+                    'cache': {
+                        'type': 'dict',
+                        'required': False,
+                        'schema': {
+                            'backend': {
+                                'type': 'string',
+                                'allowed': ['memory', 'sqlite', 'none'],
+                                'required': False,
+                            },
+                            'maxsize': {
+                                'type': 'integer',
+                                'min': 1,
+                                'required': False,
+                            },
+                            'path': {
+                                'type': 'string',
+                                'required': False,
+                            },
+                            'ttl': {
+                                'type': 'dict',
+                                'required': False,
+                                'valuesrules': {
+                                    'type': 'number',
+                                    'min': 0
+                                }
+                            }
+                        }
+                    }
+                },
+                'meta': {
+                    'default': {
+                        'url': 'https://www.fightcade.com/api/',
+                        'concurrency': 4,
+                        'requests_per_second': 5,
+                        'retries': 3,
+                        'retry_wait_ms': 1000,
+                        'retry_wait_max_ms': 30000,
+                        'cache': {
+                            'backend': 'memory',
+                            'maxsize': 1024,
+                            'path': 'fightcade_api_cache.sqlite',
+                            'ttl': {
+                                'quarkid': 3600,
+                                'searchquarks': 300
+                            }
+                        }
+                    },
+                    'description': 'Fightcade api url, number of pages fetched concurrently, rate limit, retry backoff and response cache'
+                }
+            },
+            'fulltext_search': {
+                'type': 'boolean',
+                'required': False,
+                'meta': {
+                    'default': True,
+                    'description': "Search descriptions with the full text index, otherwise use the slower 'ilike' search"
+                }
+            },
+            'frame_stall_timeout': {
+                'type': 'number',
+                'min': 0.1,
+                'required': False,
+                'meta': {
+                    'default': 2.0,
+                    'description': 'Seconds without a new frame before a recording is treated as finished. This is the only '
+                                   'way the end of a recording is detected, lower values stop sooner but can cut off a '
+                                   'replay that stutters'
+                }
+            },
             'get_weekly_replay_pages': {
                 'type': 'number',
                 'meta': {
@@ -228,6 +413,15 @@ class Config:
                     'description': 'Minimum replay length to accept in seconds',
                 }
             },
+            'overlay_event_log': {
+                'type': 'string',
+                'required': False,
+                'meta': {
+                    'description': 'Path of the overlay event log written while recording, and read for character detection. '
+                                   'Defaults to overlay_events.jsonl in fcadefbneo_path, outside the avi directory that is '
+                                   'cleaned when an instance starts'
+                }
+            },
             'player_replay_first': {
                 'type': 'boolean',
                 'required': True,
@@ -244,6 +438,15 @@ class Config:
                     'description': 'Encode a random replay, otherwise encode the oldest'
                 }
             },
+            'random_replay_strategy': {
+                'type': 'string',
+                'allowed': ['random_key', 'order_by_random'],
+                'required': False,
+                'meta': {
+                    'default': 'random_key',
+                    'description': "Use an indexed random key ('random_key') or sort the queue with random() ('order_by_random') to pick a random replay"
+                }
+            },
             'record_timeout': {
                 'type': 'number',
                 'required': True,
@@ -268,6 +471,45 @@ class Config:
                     'description': 'Remove old raw avi files.'
                 }
             },
+            'response_cache': {
+                'type': 'dict',
+                'required': False,
+                'schema': {
+                    'backend': {
+                        'type': 'string',
+                        'allowed': ['memory', 'redis', 'none'],
+                        'required': False,
+                    },
+                    'maxsize': {
+                        'type': 'integer',
+                        'min': 1,
+                        'required': False,
+                    },
+                    'redis_url': {
+                        'type': 'string',
+                        'required': False,
+                    },
+                    'ttl': {
+                        'type': 'number',
+                        'min': 0,
+                        'required': False,
+                    },
+                    'max_age': {
+                        'type': 'integer',
+                        'min': 0,
+                        'required': False,
+                    }
+                },
+                'meta': {
+                    'default': {
+                        'backend': 'memory',
+                        'maxsize': 1024,
+                        'ttl': 300,
+                        'max_age': 60
+                    },
+                    'description': "Cache of rendered site pages, 'memory', 'redis' or 'none', and the Cache-Control max-age sent to browsers"
+                }
+            },
             'secret_key': {
                 'type': 'string',
                 'required': True,
@@ -276,6 +518,22 @@ class Config:
                     'description': 'Secret key used for flask/site cookies'
                 }
             },
+            'site_url': {
+                'type': 'string',
+                'required': False,
+                'meta': {
+                    'default': 'https://fightcadevids.com',
+                    'description': 'Canonical url of the site, without a trailing slash, used for the urls in sitemaps'
+                }
+            },
+            'sitemap_dir': {
+                'type': 'string',
+                'required': False,
+                'meta': {
+                    'default': '/tmp/fcreplay-sitemaps',
+                    'description': 'Directory the site writes gzipped sitemaps of the video pages to'
+                }
+            },
             'sql_baseurl': {
                 'type': 'string',
                 'required': True,
@@ -284,6 +542,32 @@ class Config:
                     'description': 'URL of database'
                 }
             },
+            'sql_pool': {
+                'type': 'dict',
+                'required': False,
+                'schema': {
+                    'pool_size': {
+                        'type': 'integer',
+                        'required': False,
+                    },
+                    'max_overflow': {
+                        'type': 'integer',
+                        'required': False,
+                    },
+                    'pool_recycle': {
+                        'type': 'integer',
+                        'required': False,
+                    }
+                },
+                'meta': {
+                    'default': {
+                        'pool_size': 5,
+                        'max_overflow': 10,
+                        'pool_recycle': 1800
+                    },
+                    'description': 'Database connection pool size, overflow and recycle time in seconds'
+                }
+            },
             'upload_to_ia': {
                 'type': 'boolean',
                 'required': True,
@@ -378,12 +662,8 @@ class Config:
             dict Config dictionary
         """
         try:
-            if 'FCREPLAY_CONFIG' in os.environ:
-                with open(os.environ['FCREPLAY_CONFIG'], 'r') as json_data_file:
-                    return json.load(json_data_file)
-            else:
-                with open("config.json", 'r') as json_data_file:
-                    return json.load(json_data_file)
+            with open(self._config_path(), 'r') as json_data_file:
+                return json.load(json_data_file)
 
         except FileNotFoundError:
             print("Unable to find config file, please generate one using `fcreplay config generate`")
@@ -2,14 +2,81 @@
 
 from fcreplay.config import Config
 from fcreplay.models import Base
-from fcreplay.models import Job, Replays, Character_detect, Descriptions, Youtube_day_log
-from sqlalchemy import create_engine, func
-from sqlalchemy.orm import sessionmaker
+from fcreplay.models import Job, Replays, Character_detect, Descriptions, Youtube_day_log, Schema_version, Crawl_cursor, Submissions, \
+    Cache_generation, Players, Character_catalogue
+from fcreplay.migrations import MIGRATIONS, TEXT_SEARCH_CONFIG
+from fcreplay.status import status
+from sqlalchemy import and_, create_engine, func, inspect, or_, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import scoped_session, sessionmaker
 import datetime
 import logging
+import random
+import threading
 
 log = logging.getLogger('fcreplay')
 
+_engines = {}
+"""Engines and session registries shared by every Database instance, keyed by sql_baseurl"""
+
+_engines_lock = threading.Lock()
+
+INSERT_BATCH_SIZE = 500
+"""Maximum number of rows inserted by a single INSERT statement"""
+
+SUBMISSION_CLAIM_TIMEOUT = datetime.timedelta(minutes=10)
+"""Time after which a submission left in CHECKING, eg by a killed worker, is claimed again"""
+
+POOL_DEFAULTS = {
+    'pool_size': 5,
+    'max_overflow': 10,
+    'pool_recycle': 1800
+}
+
+
+def get_engine(config: Config):
+    """Return the shared engine and scoped session registry for a config.
+
+    The engine (and its connection pool) is created the first time a
+    sql_baseurl is seen and reused afterwards.
+
+    Args:
+        config (Config): fcreplay config
+
+    Returns:
+        tuple: (sqlalchemy.engine.Engine, sqlalchemy.orm.scoped_session)
+    """
+    with _engines_lock:
+        if config.sql_baseurl not in _engines:
+            if 'DEBUG' in config.loglevel:
+                sql_echo = True
+            else:
+                logging.getLogger('sqlalchemy').setLevel(logging.ERROR)
+                sql_echo = False
+
+            engine_args = {'echo': sql_echo, 'pool_pre_ping': True}
+
+            # SQLite uses a single connection pool that doesn't accept sizing options
+            if make_url(config.sql_baseurl).get_backend_name() != 'sqlite':
+                for k, v in POOL_DEFAULTS.items():
+                    engine_args[k] = config.sql_pool.get(k, v)
+
+            log.debug(f"Creating DB engine with: {config.sql_baseurl}")
+            engine = create_engine(config.sql_baseurl, **engine_args)
+            _engines[config.sql_baseurl] = (engine, scoped_session(sessionmaker(bind=engine)))
+
+        return _engines[config.sql_baseurl]
+
+
+def dispose_engines():
+    """Close all sessions and connection pools, eg: after forking."""
+    with _engines_lock:
+        for engine, session in _engines.values():
+            session.remove()
+            engine.dispose()
+        _engines.clear()
+
 
 class Database:
     """Database class to manage queries."""
@@ -22,23 +89,117 @@ class Database:
         """
         config = Config()
 
-        if 'DEBUG' in config.loglevel:
-            sql_echo = True
-        else:
-            logging.getLogger('sqlalchemy').setLevel(logging.ERROR)
-            sql_echo = False
-
-        """Create Engine"""
         try:
-            log.debug(f"Creating DB Instance with: {config.sql_baseurl}")
-            self.engine = create_engine(config.sql_baseurl, echo=sql_echo, pool_pre_ping=True)
-            Base.metadata.create_all(self.engine)
+            self.engine, self.Session = get_engine(config)
         except Exception as e:
             log.error(f"Unable to connect to {config.sql_baseurl}: {e}")
             raise e
 
-        self.Session = sessionmaker(bind=self.engine)
-        self.session = self.Session()
+        # The scoped session proxies to a session local to the calling thread
+        self.session = self.Session
+
+    def migrate(self) -> list:
+        """Create any missing database tables and apply pending migrations.
+
+        Returns:
+            list: Versions of the migrations that were applied
+        """
+        log.info('Creating database schema')
+        Base.metadata.create_all(self.engine)
+
+        applied = []
+        current_version = self.get_schema_version()
+        for version, description, upgrade in MIGRATIONS:
+            if version <= current_version:
+                continue
+
+            log.info(f"Applying migration {version}: {description}")
+            with self.engine.begin() as connection:
+                upgrade(connection)
+                connection.execute(
+                    Schema_version.__table__.insert().values(
+                        version=version,
+                        description=description,
+                        applied=datetime.datetime.utcnow()
+                    )
+                )
+            applied.append(version)
+
+        return applied
+
+    def get_schema_version(self) -> int:
+        """Return the version of the last applied migration.
+
+        Returns:
+            int: Schema version, 0 if no migrations have been applied
+        """
+        version = self.session.query(func.max(Schema_version.version)).scalar()
+        return version or 0
+
+    def get_index_usage(self) -> list:
+        """Return index usage statistics.
+
+        Scan counts are only available on postgres, other databases only
+        list the indexes that exist.
+
+        Returns:
+            list: List of dicts containing table, index, scans, tuples_read and size
+        """
+        if self.engine.dialect.name == 'postgresql':
+            rows = self.session.execute(
+                "select relname, indexrelname, idx_scan, idx_tup_read, pg_relation_size(indexrelid) "
+                "from pg_stat_user_indexes where schemaname = current_schema() order by relname, indexrelname"
+            ).all()
+            return [
+                {'table': r[0], 'index': r[1], 'scans': r[2], 'tuples_read': r[3], 'size': r[4]} for r in rows
+            ]
+
+        inspector = inspect(self.engine)
+        usage = []
+        for table in inspector.get_table_names():
+            for index in inspector.get_indexes(table):
+                usage.append({'table': table, 'index': index['name'], 'scans': None, 'tuples_read': None, 'size': None})
+        return usage
+
+    def _bump_cache_generation(self, name='replays'):
+        """Increment a cache generation, so the site knows cached data is stale.
+
+        Runs in the current transaction, the caller commits.
+
+        Args:
+            name (str, optional): Name of the cached data. Defaults to 'replays'.
+        """
+        dialect = self.session.get_bind().dialect.name
+        values = {'name': name, 'generation': 1, 'updated': datetime.datetime.utcnow()}
+
+        if dialect in ('postgresql', 'sqlite'):
+            insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+            statement = insert(Cache_generation).values(values).on_conflict_do_update(
+                index_elements=['name'],
+                set_={'generation': Cache_generation.generation + 1, 'updated': values['updated']}
+            )
+            self.session.execute(statement)
+            return
+
+        updated = self.session.query(Cache_generation).filter_by(name=name).update({
+            'generation': Cache_generation.generation + 1,
+            'updated': values['updated']
+        }, synchronize_session=False)
+        if updated == 0:
+            self.session.add(Cache_generation(**values))
+
+    def get_cache_generation(self, name='replays'):
+        """Get the current generation of cached data.
+
+        Args:
+            name (str, optional): Name of the cached data. Defaults to 'replays'.
+
+        Returns:
+            int: Generation, 0 if the data has never changed
+        """
+        return self.session.query(Cache_generation.generation).filter_by(
+            name=name
+        ).scalar() or 0
 
     def add_replay(self, challenge_id,
                    p1_loc, p2_loc,
@@ -92,12 +253,74 @@ class Database:
                 emulator=emulator,
                 video_processed=video_processed,
                 ia_filename=ia_filename,
-                fail_count=fail_count
+                fail_count=fail_count,
+                random_key=random.random()
             )
         )
+        self._add_players([p1, p2])
         self.session.commit()
         # self.session.close()
 
+    def add_replays(self, replays: list):
+        """Add multiple replays to the database.
+
+        Rows are inserted in batches of INSERT_BATCH_SIZE with a single
+        multi-row INSERT ... ON CONFLICT DO NOTHING, so replays that
+        already exist are skipped.
+
+        Args:
+            replays (list): List of dicts containing the Replays columns, see add_replay
+        """
+        for i in range(0, len(replays), INSERT_BATCH_SIZE):
+            batch = [{'random_key': random.random(), **r} for r in replays[i:i + INSERT_BATCH_SIZE]]
+            self.session.execute(self._insert_ignore(Replays, batch, ['id']))
+
+        self._add_players([p for r in replays for p in (r.get('p1'), r.get('p2'))])
+        self.session.commit()
+
+    def _insert_ignore(self, model, rows: list, keys: list):
+        """Build a multi-row INSERT that skips rows whose key already exists.
+
+        Args:
+            model (sqlalchemy.object): Model to insert into
+            rows (list): List of dicts containing the model columns
+            keys (list): Primary key columns
+
+        Returns:
+            sqlalchemy.sql.Insert: Insert statement
+        """
+        dialect = self.session.get_bind().dialect.name
+        if dialect == 'postgresql':
+            return postgresql.insert(model).values(rows).on_conflict_do_nothing(index_elements=keys)
+        elif dialect == 'sqlite':
+            return sqlite.insert(model).values(rows).on_conflict_do_nothing(index_elements=keys)
+        return model.__table__.insert().values(rows)
+
+    def _add_players(self, names: list):
+        """Add players to the players table, used by the site player list.
+
+        Runs in the current transaction, the caller commits. The 'players'
+        cache generation is bumped when a new player is added.
+
+        Args:
+            names (list): Player names, may contain duplicates and existing players
+        """
+        names = list(dict.fromkeys(n for n in names if n))
+        if not names:
+            return
+
+        new_players = 0
+        for i in range(0, len(names), INSERT_BATCH_SIZE):
+            batch = names[i:i + INSERT_BATCH_SIZE]
+            existing = set(r.name for r in self.session.query(Players.name).filter(Players.name.in_(batch)))
+            missing = [{'name': n} for n in batch if n not in existing]
+            if missing:
+                self.session.execute(self._insert_ignore(Players, missing, ['name']))
+                new_players += len(missing)
+
+        if new_players:
+            self._bump_cache_generation('players')
+
     def add_ia_filename(self, challenge_id, filename):
         """Add an IA filename to the database.
 
@@ -126,6 +349,24 @@ class Database:
 
         return(replay)
 
+    def get_existing_replays(self, challenge_ids: list) -> dict:
+        """Find which replays already exist with a single query.
+
+        Args:
+            challenge_ids (list): Challenge ids to look for
+
+        Returns:
+            dict: Maps the challenge ids that exist to their player_requested value
+        """
+        existing = {}
+        for i in range(0, len(challenge_ids), INSERT_BATCH_SIZE):
+            rows = self.session.query(Replays.id, Replays.player_requested).filter(
+                Replays.id.in_(challenge_ids[i:i + INSERT_BATCH_SIZE])
+            ).all()
+            existing.update({r.id: r.player_requested for r in rows})
+
+        return existing
+
     def update_player_requested(self, challenge_id):
         """Update whether replay is player requested.
 
@@ -157,8 +398,32 @@ class Database:
             vid_time=vid_time,
             game=game
         ))
+        self._add_characters(game, [p1_char, p2_char])
         self.session.commit()
 
+    def _add_characters(self, game, characters: list):
+        """Add characters to the character catalogue, used by the site advanced search.
+
+        Runs in the current transaction, the caller commits. The 'characters'
+        cache generation is bumped when a new character is added.
+
+        Args:
+            game (str): Game name
+            characters (list): Character names, may contain duplicates and existing characters
+        """
+        characters = list(dict.fromkeys(c for c in characters if c))
+        if not characters:
+            return
+
+        existing = set(r.character for r in self.session.query(Character_catalogue.character).filter(
+            Character_catalogue.game == game,
+            Character_catalogue.character.in_(characters)
+        ))
+        missing = [{'game': game, 'character': c} for c in characters if c not in existing]
+        if missing:
+            self.session.execute(self._insert_ignore(Character_catalogue, missing, ['game', 'character']))
+            self._bump_cache_generation('characters')
+
     def add_job(self, challenge_id, start_time, length):
         """Add a new encoding job to the database.
 
@@ -291,9 +556,42 @@ class Database:
             id=challenge_id,
             description=description
         ))
+        self.session.flush()
+        self._index_description(challenge_id, description)
         self.session.commit()
         # self.session.close()
 
+    def _index_description(self, challenge_id, description):
+        """Add a description to the full text search index, see migration 5.
+
+        Args:
+            challenge_id (str): Challenge id
+            description (str): Description
+        """
+        dialect = self.session.get_bind().dialect.name
+        if dialect == 'postgresql':
+            self.session.execute(
+                text(f"update descriptions set search_vector = to_tsvector('{TEXT_SEARCH_CONFIG}', :description) where id = :id"),
+                {'id': challenge_id, 'description': description}
+            )
+        elif dialect == 'sqlite':
+            self._unindex_description(challenge_id)
+            self.session.execute(
+                text('insert into descriptions_fts (id, description) values (:id, :description)'),
+                {'id': challenge_id, 'description': description}
+            )
+
+    def _unindex_description(self, challenge_id):
+        """Remove a description from the sqlite full text search index.
+
+        On postgres the index is a column of descriptions, so it is removed with the row.
+
+        Args:
+            challenge_id (str): Challenge id
+        """
+        if self.session.get_bind().dialect.name == 'sqlite':
+            self.session.execute(text('delete from descriptions_fts where id = :id'), {'id': challenge_id})
+
     def update_youtube_day_log_count(self, count, date):
         """Update youtube day log.
 
@@ -346,24 +644,47 @@ class Database:
         # self.session.close()
         return replay
 
-    def get_random_replay(self):
+    def _random_replay_queries(self, strategy='random_key') -> list:
+        """Return the queries used to pick a random queued replay, to be tried in order.
+
+        The 'random_key' strategy seeks to the first replay with a random_key
+        greater than a random number using ix_replays_queued_random, then wraps
+        around to the start. This stays fast as the queue grows. The
+        'order_by_random' strategy sorts the whole queue with random().
+
+        Args:
+            strategy (str, optional): 'random_key' or 'order_by_random'. Defaults to 'random_key'.
+
+        Returns:
+            list: List of sqlalchemy queries
+        """
+        if strategy == 'order_by_random':
+            return [self._queued_replays().order_by(func.random())]
+
+        if strategy != 'random_key':
+            raise ValueError(f"Unknown random replay strategy: {strategy}")
+
+        r = random.random()
+        return [
+            self._queued_replays().filter(Replays.random_key >= r).order_by(Replays.random_key.asc()),
+            self._queued_replays().filter(Replays.random_key < r).order_by(Replays.random_key.asc())
+        ]
+
+    def get_random_replay(self, strategy='random_key'):
         """Get a random replay.
 
+        Args:
+            strategy (str, optional): 'random_key' or 'order_by_random'. Defaults to 'random_key'.
+
         Returns:
             sqlalchemy.object: Contains the replay as a sqlalchemy.object
         """
-        replay = self.session.query(
-            Replays
-        ).filter_by(
-            failed=False,
-            created=False,
-            status='ADDED'
-        ).order_by(
-            func.random()
-        ).first()
-        # self.session.close()
+        for query in self._random_replay_queries(strategy):
+            replay = query.first()
+            if replay is not None:
+                return replay
 
-        return replay
+        return None
 
     def get_oldest_replay(self):
         """Get the oldest replay waiting to be encoded.
@@ -384,6 +705,86 @@ class Database:
 
         return replay
 
+    def _queued_replays(self, **kwargs):
+        """Return a query for replays waiting to be encoded."""
+        return self.session.query(Replays).filter_by(
+            failed=False,
+            created=False,
+            status=status.ADDED,
+            **kwargs
+        )
+
+    def has_queued_replay(self) -> bool:
+        """Check if any replay is waiting to be encoded.
+
+        Returns:
+            bool: True if there is a replay waiting to be encoded
+        """
+        return self.session.query(self._queued_replays().exists()).scalar()
+
+    def claim_next_replay(self, worker_id, player_replay_first=True, random_replay=False,
+                          random_replay_strategy='random_key', attempts=5):
+        """Atomically select the next replay to encode and add a job for it.
+
+        On postgres the row is locked with SELECT ... FOR UPDATE SKIP LOCKED, so
+        concurrent workers skip replays that are being claimed. Other databases
+        fall back to a conditional update on the status, and retry if another
+        worker claimed the replay first.
+
+        Args:
+            worker_id (str): Id of the worker claiming the replay, stored in the job
+            player_replay_first (bool, optional): Look for player replays first. Defaults to True.
+            random_replay (bool, optional): Claim a random replay instead of the oldest. Defaults to False.
+            random_replay_strategy (str, optional): How to pick a random replay, see _random_replay_queries.
+                Defaults to 'random_key'.
+            attempts (int, optional): Number of times to retry when a replay is claimed by another worker. Defaults to 5.
+
+        Returns:
+            sqlalchemy.object: The claimed replay, or None if there are no replays to encode
+        """
+        queries = []
+        if player_replay_first:
+            queries.append(self._queued_replays(player_requested=True).order_by(Replays.date_added.desc()))
+        if random_replay:
+            queries.extend(self._random_replay_queries(random_replay_strategy))
+        else:
+            queries.append(self._queued_replays().order_by(Replays.date_added.desc()))
+
+        for query in queries:
+            for _ in range(attempts):
+                try:
+                    replay = query.with_for_update(skip_locked=True, of=Replays).first()
+                    if replay is None:
+                        self.session.rollback()
+                        break
+
+                    claimed = self.session.query(Replays).filter_by(
+                        id=replay.id,
+                        failed=False,
+                        created=False,
+                        status=status.ADDED
+                    ).update({'status': status.JOB_ADDED}, synchronize_session='fetch')
+
+                    if claimed != 1:
+                        log.debug(f"Replay {replay.id} was claimed by another worker")
+                        self.session.rollback()
+                        continue
+
+                    self.session.merge(Job(
+                        id=replay.id,
+                        start_time=datetime.datetime.utcnow(),
+                        instance=worker_id
+                    ))
+                    self.session.commit()
+                except Exception:
+                    self.session.rollback()
+                    raise
+
+                log.info(f"Worker {worker_id} claimed replay {replay.id}")
+                return replay
+
+        return None
+
     def update_failed_replay(self, challenge_id):
         """Increments the failed replay count for a replay.
 
@@ -422,6 +823,7 @@ class Database:
                 'created': True
             }
         )
+        self._bump_cache_generation()
         self.session.commit()
         # self.session.close()
 
@@ -452,6 +854,7 @@ class Database:
         ).update(
             {'video_processed': True, "date_added": datetime.datetime.now()}
         )
+        self._bump_cache_generation()
         self.session.commit()
         # self.session.close()
 
@@ -497,12 +900,14 @@ class Database:
         ).update(
             {'failed': False, 'created': False, 'status': 'ADDED'}
         )
+        self._bump_cache_generation()
         self.session.commit()
 
         # Remove description if it exists
         self.session.query(Descriptions).filter_by(
             id=challenge_id
         ).delete()
+        self._unindex_description(challenge_id)
         self.session.commit()
 
         # Remove job if it exists
@@ -528,12 +933,14 @@ class Database:
         self.session.query(Replays).filter_by(
             id=challenge_id,
         ).delete()
+        self._bump_cache_generation()
         self.session.commit()
 
         # Remove description if it exists
         self.session.query(Descriptions).filter_by(
             id=challenge_id
         ).delete()
+        self._unindex_description(challenge_id)
         self.session.commit()
 
         # Remove job if it exists
@@ -665,3 +1072,90 @@ class Database:
         ).first()
         # self.session.close()
         return description
+
+    def get_crawl_cursor(self, name):
+        """Get the high-water mark of a crawl.
+
+        Args:
+            name (str): Name of the crawl
+
+        Returns:
+            sqlalchemy.object: Crawl cursor, or None if the crawl hasn't run
+        """
+        return self.session.query(Crawl_cursor).filter_by(
+            id=name
+        ).first()
+
+    def set_crawl_cursor(self, name, last_date):
+        """Set the high-water mark of a crawl.
+
+        Args:
+            name (str): Name of the crawl
+            last_date (int): Date of the newest replay seen, in milliseconds
+        """
+        self.session.merge(Crawl_cursor(
+            id=name,
+            last_date=last_date,
+            updated=datetime.datetime.utcnow()
+        ))
+        self.session.commit()
+
+    def claim_next_submission(self, claim_timeout: datetime.timedelta = SUBMISSION_CLAIM_TIMEOUT):
+        """Atomically take the oldest pending player submission.
+
+        Uses SELECT ... FOR UPDATE SKIP LOCKED and a conditional update, the
+        same way as claim_next_replay, so several workers can run at once.
+        Submissions claimed longer than claim_timeout ago that are still
+        CHECKING are claimed again.
+
+        Args:
+            claim_timeout (datetime.timedelta, optional): Time after which a claim is abandoned.
+                Defaults to SUBMISSION_CLAIM_TIMEOUT.
+
+        Returns:
+            sqlalchemy.object: The submission, marked as CHECKING, or None if there are none pending
+        """
+        while True:
+            now = datetime.datetime.utcnow()
+            claimable = or_(
+                Submissions.status == status.SUBMITTED,
+                and_(Submissions.status == status.CHECKING, Submissions.date_claimed < now - claim_timeout)
+            )
+            try:
+                submission = self.session.query(Submissions).filter(
+                    claimable
+                ).order_by(Submissions.id).with_for_update(skip_locked=True).first()
+                if submission is None:
+                    self.session.rollback()
+                    return None
+
+                claimed = self.session.query(Submissions).filter(
+                    Submissions.id == submission.id,
+                    claimable
+                ).update({'status': status.CHECKING, 'date_claimed': now}, synchronize_session='fetch')
+
+                if claimed != 1:
+                    self.session.rollback()
+                    continue
+
+                self.session.commit()
+            except Exception:
+                self.session.rollback()
+                raise
+
+            return submission
+
+    def set_submission_result(self, submission_id, result):
+        """Store the result of checking a player submission.
+
+        Args:
+            submission_id (int): Submission id
+            result (str): Status returned by Getreplay.get_replay
+        """
+        self.session.query(Submissions).filter_by(
+            id=submission_id
+        ).update({
+            'status': result,
+            'date_processed': datetime.datetime.utcnow()
+        })
+        self.session.commit()
@@ -0,0 +1,357 @@
+"""Fightcade API client.
+
+Requests are made through a pooled keep-alive session, limited to a
+number of requests per second per host, and retried with exponential
+backoff. Multiple pages of a query can be fetched concurrently.
+
+Successful responses are cached, keyed by the normalised query json, so
+repeated lookups of the same replay or overlapping crawls don't cost a
+round-trip. The cache is in memory by default, or in a sqlite file so it
+is shared between processes. One cache is kept per process for each api url
+and cache settings, and shared by every client, so clients that are created
+again for each task still get cache hits.
+"""
+from cachetools import TLRUCache
+from concurrent.futures import ThreadPoolExecutor
+from fcreplay.config import Config
+from requests.adapters import HTTPAdapter
+from retrying import Retrying
+from urllib.parse import urlparse
+
+import json
+import logging
+import requests
+import sqlite3
+import threading
+import time
+
+log = logging.getLogger('fcreplay')
+
+API_DEFAULTS = {
+    'url': 'https://www.fightcade.com/api/',
+    'concurrency': 4,
+    'requests_per_second': 5,
+    'retries': 3,
+    'retry_wait_ms': 1000,
+    'retry_wait_max_ms': 30000,
+    'page_size': 15,
+    'cache': {
+        'backend': 'memory',
+        'maxsize': 1024,
+        'path': 'fightcade_api_cache.sqlite',
+        'ttl': {
+            'quarkid': 3600,
+            'searchquarks': 300
+        }
+    }
+}
+
+
+def query_key(query: dict) -> str:
+    """Normalise a query so equal queries share a cache entry.
+
+    Args:
+        query (dict): Query to pass to fightcade API
+
+    Returns:
+        str: Query json with sorted keys
+    """
+    return json.dumps(query, sort_keys=True, separators=(',', ':'))
+
+
+def query_type(query: dict) -> str:
+    """Get the request type of a query, used to pick the cache ttl.
+
+    Lookups of a single replay are 'quarkid', everything else is the
+    name of the request, eg 'searchquarks'.
+
+    Args:
+        query (dict): Query to pass to fightcade API
+
+    Returns:
+        str: Request type
+    """
+    if 'quarkid' in query:
+        return 'quarkid'
+    return query.get('req', '')
+
+
+def cacheable(query: dict, response: dict) -> bool:
+    """Check if a response can be cached.
+
+    Only successful responses are cached. A quarkid lookup is only cached
+    when it found the replay, so a replay that fightcade hasn't indexed yet
+    is looked up again when it is resubmitted.
+
+    Args:
+        query (dict): Query passed to the fightcade api
+        response (dict): Response from the fightcade api
+
+    Returns:
+        bool: True if the response can be cached
+    """
+    if response.get('res') != 'OK':
+        return False
+    if query_type(query) == 'quarkid':
+        results = response.get('results', {}).get('results', [])
+        return any(r.get('quarkid') == query['quarkid'] for r in results)
+    return True
+
+
+class ResponseCache:
+    """Base class for api response caches, counting hits and misses."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        """Get a cached response.
+
+        Args:
+            key (str): Normalised query
+
+        Returns:
+            dict: Cached response, or None if missing or expired
+        """
+        with self._lock:
+            value = self._get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def set(self, key: str, value: dict, ttl: float):
+        """Cache a response.
+
+        Args:
+            key (str): Normalised query
+            value (dict): Response from the fightcade api
+            ttl (float): Seconds to keep the response for
+        """
+        with self._lock:
+            self._set(key, value, ttl)
+
+    def stats(self) -> dict:
+        """Return the hit and miss counters."""
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def _get(self, key):
+        raise NotImplementedError
+
+    def _set(self, key, value, ttl):
+        raise NotImplementedError
+
+
+class MemoryCache(ResponseCache):
+    """In memory LRU cache with a ttl per entry."""
+
+    def __init__(self, maxsize: int):
+        super().__init__()
+        self._cache = TLRUCache(maxsize=maxsize, ttu=lambda key, value, now: now + value[0])
+
+    def _get(self, key):
+        value = self._cache.get(key)
+        return None if value is None else value[1]
+
+    def _set(self, key, value, ttl):
+        self._cache[key] = (ttl, value)
+
+
+class SqliteCache(ResponseCache):
+    """Cache stored in a sqlite file, shared between processes."""
+
+    def __init__(self, path: str):
+        super().__init__()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS api_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)'
+        )
+        self._conn.execute('DELETE FROM api_cache WHERE expires < ?', (time.time(),))
+
+    def _get(self, key):
+        row = self._conn.execute(
+            'SELECT value FROM api_cache WHERE key = ? AND expires >= ?', (key, time.time())
+        ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def _set(self, key, value, ttl):
+        self._conn.execute(
+            'INSERT OR REPLACE INTO api_cache (key, value, expires) VALUES (?, ?, ?)',
+            (key, json.dumps(value), time.time() + ttl)
+        )
+
+
+def make_cache(settings: dict):
+    """Create the response cache for the cache settings.
+
+    Args:
+        settings (dict): The 'cache' key of the fightcade_api settings
+
+    Raises:
+        ValueError: Raised for an unknown backend
+
+    Returns:
+        ResponseCache: Cache, or None when the backend is 'none'
+    """
+    backend = settings['backend']
+    if backend == 'none':
+        return None
+    if backend == 'memory':
+        return MemoryCache(int(settings['maxsize']))
+    if backend == 'sqlite':
+        return SqliteCache(settings['path'])
+    raise ValueError(f"Unknown cache backend: {backend}")
+
+
+_shared_caches = {}
+_shared_caches_lock = threading.Lock()
+
+
+def shared_cache(url: str, settings: dict):
+    """Get the response cache shared by clients of url with the same cache settings.
+
+    Args:
+        url (str): Url of the fightcade api
+        settings (dict): The 'cache' key of the fightcade_api settings
+
+    Returns:
+        ResponseCache: Cache, or None when the backend is 'none'
+    """
+    # The ttls are passed to each set, they don't need a cache of their own
+    key = (url, settings['backend'], int(settings['maxsize']), settings['path'])
+    with _shared_caches_lock:
+        if key not in _shared_caches:
+            _shared_caches[key] = make_cache(settings)
+        return _shared_caches[key]
+
+
+class HostRateLimiter:
+    """Limit the number of requests per second made to each host."""
+
+    def __init__(self, requests_per_second: float):
+        """Initialise the rate limiter.
+
+        Args:
+            requests_per_second (float): Maximum requests per second per host, 0 to disable
+        """
+        self.interval = 1 / requests_per_second if requests_per_second > 0 else 0
+        self._next_request = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url: str):
+        """Block until a request can be made to the host of url.
+
+        Args:
+            url (str): Url that is going to be requested
+        """
+        if self.interval == 0:
+            return
+
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            request_time = max(now, self._next_request.get(host, now))
+            self._next_request[host] = request_time + self.interval
+
+        if request_time > now:
+            time.sleep(request_time - now)
+
+
+class FightcadeApi:
+    """Client for the fightcade api."""
+
+    def __init__(self, settings: dict = None):
+        """Initialise the client.
+
+        Args:
+            settings (dict, optional): Overrides for API_DEFAULTS. Defaults to the
+                fightcade_api config key.
+        """
+        if settings is None:
+            settings = Config().fightcade_api
+        self.settings = {**API_DEFAULTS, **settings}
+        cache_settings = {**API_DEFAULTS['cache'], **settings.get('cache', {})}
+        cache_settings['ttl'] = {**API_DEFAULTS['cache']['ttl'], **cache_settings['ttl']}
+        self.settings['cache'] = cache_settings
+
+        self.url = self.settings['url']
+        self.concurrency = int(self.settings['concurrency'])
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self.rate_limiter = HostRateLimiter(self.settings['requests_per_second'])
+        self.cache = shared_cache(self.url, cache_settings)
+
+    def _post(self, query: dict) -> dict:
+        self.rate_limiter.wait(self.url)
+        r = self.session.post(self.url, json=query)
+
+        if r.status_code >= 500 or r.status_code == 429:
+            log.error(f"{r.status_code} Code for query {query}")
+            raise IOError("Unable to get data")
+
+        return r.json()
+
+    def get_data(self, query: dict) -> dict:
+        """Post a query to the fightcade api.
+
+        Successful responses are returned from the cache when possible, see cacheable.
+        Failed requests are retried with exponential backoff, up to the
+        configured number of retries.
+
+        Args:
+            query (dict): Query to pass to fightcade API
+
+        Raises:
+            IOError: Raised when unable to get data after retrying
+
+        Returns:
+            dict: Response from the fightcade api
+        """
+        ttl = self.settings['cache']['ttl'].get(query_type(query), 0)
+        if self.cache is not None and ttl > 0:
+            key = query_key(query)
+            cached = self.cache.get(key)
+            if cached is not None:
+                log.debug(f"Cache hit for query {key}")
+                return cached
+
+        response = Retrying(
+            stop_max_attempt_number=self.settings['retries'],
+            wait_exponential_multiplier=self.settings['retry_wait_ms'],
+            wait_exponential_max=self.settings['retry_wait_max_ms'],
+            retry_on_exception=lambda e: isinstance(e, (IOError, requests.exceptions.RequestException))
+        ).call(self._post, query)
+
+        if self.cache is not None and ttl > 0 and cacheable(query, response):
+            self.cache.set(key, response, ttl)
+
+        return response
+
+    def get_pages(self, query: dict, pages: int, first_page: int = 0) -> list:
+        """Fetch multiple pages of a query concurrently.
+
+        Each page is retried on its own, so one failing page doesn't delay
+        the others.
+
+        Args:
+            query (dict): Query to pass to fightcade API, without an offset
+            pages (int): Number of pages to fetch
+            first_page (int, optional): Page to start from. Defaults to 0.
+
+        Returns:
+            list: Responses, in page order
+        """
+        queries = [{**query, 'offset': page * self.settings['page_size']} for page in range(first_page, first_page + pages)]
+
+        if len(queries) <= 1:
+            return [self.get_data(q) for q in queries]
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            return list(executor.map(self.get_data, queries))
@@ -1,14 +1,13 @@
 from datetime import timedelta
 from fcreplay.config import Config
 from fcreplay.database import Database
+from fcreplay.fightcade_api import FightcadeApi
+from fcreplay.replay_url import REPLAY_URL_PATTERN
 from fcreplay.status import status
-from retrying import retry
 import datetime
 import json
 import logging
 import pkg_resources
-import re
-import requests
 
 log = logging.getLogger('fcreplay')
 
@@ -20,14 +19,16 @@ class Getreplay:
         """Initialize the Getreplay class."""
         self.config = Config()
         self.db = Database()
+        self.api = FightcadeApi(self.config.fightcade_api)
 
         with open(pkg_resources.resource_filename('fcreplay', 'data/supported_games.json')) as f:
             self.supported_games = json.load(f)
 
-    @retry(wait_random_min=5000, wait_random_max=10000, stop_max_attempt_number=3)
     def get_data(self, query):
         """Get data from fightcade api.
 
+        Requests are retried with exponential backoff, see FightcadeApi.get_data
+
         Args:
             query (dict): Query to pass to fightcade API
 
@@ -71,15 +72,7 @@ class Getreplay:
             }
         """
 
-        r = requests.post(
-            "https://www.fightcade.com/api/",
-            json=query
-        )
-        if r.status_code == 500:
-            log.error("500 Code, trying up to 3 times")
-            raise IOError("Unable to get data")
-        else:
-            return r.json()
+        return self.api.get_data(query)
 
     def check_banned_user(self, player):
         """Check if player is banned.
@@ -95,34 +88,18 @@ class Getreplay:
         else:
             return False
 
-    def add_replay(self, replay, emulator, game, player_replay=True):
-        """Add replay to the database.
+    def _replay_row(self, replay, emulator, game, player_replay) -> dict:
+        """Convert a fightcade api result into a Replays row.
 
         Args:
-            replay ([type]): [description]
-            emulator ([type]): [description]
-            game ([type]): [description]
-            player_replay (bool, optional): [description]. Defaults to True.
-        """
-        challenge_id = replay['quarkid']
-        p1_loc = replay['players'][0]['country']
-        p2_loc = replay['players'][1]['country']
-        p1 = replay['players'][0]['name']
-        p2 = replay['players'][1]['name']
-        date_replay = datetime.datetime.fromtimestamp(replay['date'] // 1000)
-        length = replay['duration']
-        created = False
-        failed = False
-        local_status = status.ADDED
-        date_added = datetime.datetime.utcnow()
-        player_requested = player_replay
-        fail_count = 0
-
-        # Check if player is banned:
-        for p in replay['players']:
-            if p['name'] in self.config.banned_users:
-                return status.BANNED_USER
+            replay (dict): Replay returned by the fightcade api
+            emulator (str): Emulator name
+            game (str): Game id
+            player_replay (bool): Is this a player requested replay
 
+        Returns:
+            dict: Replays column values
+        """
         if 'rank' in replay['players'] or 'rank' in replay['players'][1]:
             if replay['players'][0]['rank'] is None:
                 p1_rank = '0'
@@ -136,6 +113,52 @@ class Getreplay:
             p1_rank = '0'
             p2_rank = '0'
 
+        return {
+            'id': replay['quarkid'],
+            'p1_loc': replay['players'][0]['country'],
+            'p2_loc': replay['players'][1]['country'],
+            'p1_rank': p1_rank,
+            'p2_rank': p2_rank,
+            'p1': replay['players'][0]['name'],
+            'p2': replay['players'][1]['name'],
+            'date_replay': datetime.datetime.fromtimestamp(replay['date'] // 1000),
+            'length': replay['duration'],
+            'created': False,
+            'failed': False,
+            'status': status.ADDED,
+            'date_added': datetime.datetime.utcnow(),
+            'player_requested': player_replay,
+            'game': game,
+            'emulator': emulator,
+            'video_processed': False,
+            'ia_filename': 'EMPTY',
+            'fail_count': 0
+        }
+
+    def _is_banned(self, replay) -> bool:
+        """Check if any player in a replay is banned."""
+        return any(p['name'] in self.config.banned_users for p in replay['players'])
+
+    def _valid_length(self, replay) -> bool:
+        """Check the replay length is within the configured limits."""
+        return int(self.config.min_replay_length) < replay['duration'] < int(self.config.max_replay_length)
+
+    def add_replay(self, replay, emulator, game, player_replay=True):
+        """Add replay to the database.
+
+        Args:
+            replay ([type]): [description]
+            emulator ([type]): [description]
+            game ([type]): [description]
+            player_replay (bool, optional): [description]. Defaults to True.
+        """
+        challenge_id = replay['quarkid']
+        length = replay['duration']
+
+        # Check if player is banned:
+        if self._is_banned(replay):
+            return status.BANNED_USER
+
         # Insert into database
         log.info(f"Looking for {challenge_id}")
 
@@ -143,29 +166,11 @@ class Getreplay:
         data = self.db.get_single_replay(challenge_id=challenge_id)
         if data is None:
             # Limit the length of videos
-            if length > int(self.config.min_replay_length) and \
-               length < int(self.config.max_replay_length):
+            if self._valid_length(replay):
                 log.info(f"Adding {challenge_id} to queue")
-                self.db.add_replay(
-                    challenge_id=challenge_id,
-                    p1_loc=p1_loc,
-                    p2_loc=p2_loc,
-                    p1_rank=p1_rank,
-                    p2_rank=p2_rank,
-                    p1=p1,
-                    p2=p2,
-                    date_replay=date_replay,
-                    length=length,
-                    created=created,
-                    failed=failed,
-                    status=local_status,
-                    date_added=date_added,
-                    player_requested=player_requested,
-                    game=game,
-                    emulator=emulator,
-                    video_processed=False,
-                    fail_count=fail_count
-                )
+                row = self._replay_row(replay, emulator, game, player_replay)
+                row['challenge_id'] = row.pop('id')
+                self.db.add_replay(**row)
                 return(status.ADDED)
             else:
                 log.info(f"{challenge_id} is only {length} not adding")
@@ -183,6 +188,50 @@ class Getreplay:
                     return(status.MARKED_PLAYER)
             return(status.ALREADY_EXISTS)
 
+    def add_replays(self, replays) -> dict:
+        """Add a list of fightcade api results to the database in bulk.
+
+        Unsupported games, banned users and replays that are too long or short
+        are filtered out first. The remaining replays are checked for existence
+        with one query and inserted in batches.
+
+        Args:
+            replays (list): List of replays returned by the fightcade api
+
+        Returns:
+            dict: Status of each replay, keyed by challenge id
+        """
+        statuses = {}
+        rows = {}
+
+        for replay in replays:
+            challenge_id = replay['quarkid']
+            if replay['gameid'] not in self.supported_games:
+                statuses[challenge_id] = status.UNSUPPORTED_GAME
+            elif self._is_banned(replay):
+                statuses[challenge_id] = status.BANNED_USER
+            elif not self._valid_length(replay):
+                statuses[challenge_id] = status.TOO_SHORT
+            else:
+                rows[challenge_id] = self._replay_row(replay, replay['emulator'], replay['gameid'], player_replay=False)
+
+        for challenge_id in self.db.get_existing_replays(list(rows)):
+            statuses[challenge_id] = status.ALREADY_EXISTS
+            del rows[challenge_id]
+
+        if rows:
+            log.info(f"Adding {len(rows)} replays to queue")
+            self.db.add_replays(list(rows.values()))
+
+        for challenge_id in rows:
+            statuses[challenge_id] = status.ADDED
+
+        for challenge_id, replay_status in statuses.items():
+            if replay_status != status.ADDED:
+                log.info(f"Not adding replay {challenge_id}, Status: {replay_status}")
+
+        return statuses
+
     def get_game_replays(self, game):
         """Get a list of games for a game.
 
@@ -196,49 +245,51 @@ class Getreplay:
 
         r = self.get_data(query)
 
-        for i in r['results']['results']:
-            if i['emulator'] == 'fbneo' and i['live'] is False:
-                local_status = self.add_replay(
-                    replay=i,
-                    emulator=i['emulator'],
-                    game=game,
-                    player_replay=False
-                )
-                if local_status != status.ADDED:
-                    log.info(f'Not adding game, Status: {local_status}')
+        self.add_replays([i for i in r['results']['results'] if i['emulator'] == 'fbneo' and i['live'] is False])
 
         return(status.ADDED)
 
     def get_top_weekly(self):
         """Get the most recent games and add them to the database.
 
+        The date of the newest replay seen is stored as a crawl cursor. The
+        next run only asks for replays since then, and stops paging once a
+        page contains only replays it already knows about.
+
         Returns:
             str: Returns the status of the request
         """
         today = datetime.datetime.today()
         start_week = today - timedelta(days=today.weekday())
         start_week_ms = int(start_week.timestamp() * 1000)
-        query = {'req': 'searchquarks', 'best': True, 'since': start_week_ms}
 
-        replays = []
-        pages = self.config.get_weekly_replay_pages
-        for i in range(0, pages):
-            query['offset'] = i * 15
-            r = self.get_data(query)
-            replays += r['results']['results']
+        cursor = self.db.get_crawl_cursor('top_weekly')
+        since = max(cursor.last_date, start_week_ms) if cursor is not None else start_week_ms
+
+        query = {'req': 'searchquarks', 'best': True, 'since': since}
+        log.info(f"Getting weekly replays since {since}")
+
+        newest_date = since
+        pages = int(self.config.get_weekly_replay_pages)
+        page = 0
+        finished = False
+
+        while page < pages and not finished:
+            batch = min(self.api.concurrency, pages - page)
+            for r in self.api.get_pages(query, batch, first_page=page):
+                results = r['results']['results']
+                statuses = self.add_replays(results)
+
+                newest_date = max([newest_date] + [i['date'] for i in results])
+
+                known = [statuses[i['quarkid']] == status.ALREADY_EXISTS or i['date'] < since for i in results]
+                if len(results) < self.api.settings['page_size'] or all(known):
+                    log.info(f"Stopping weekly crawl at page {page}")
+                    finished = True
+                    break
+                page += 1
 
-        for i in replays:
-            if i['gameid'] not in self.supported_games:
-                log.info(f"Game {i['gameid']} not supported for replay {i['quarkid']}")
-                continue
-            local_status = self.add_replay(
-                replay=i,
-                emulator=i['emulator'],
-                game=i['gameid'],
-                player_replay=False
-            )
-            if local_status != status.ADDED:
-                log.info(f"Not adding replay {i['quarkid']}, Status: {local_status}")
+        self.db.set_crawl_cursor('top_weekly', newest_date)
 
         return status.ADDED
 
@@ -261,27 +312,14 @@ class Getreplay:
         if username is not None:
             query['username'] = username
 
-        replays = []
         if pages is None:
-            query['offset'] = 0
-            r = self.get_data(query)
+            pages = 1
+
+        replays = []
+        for r in self.api.get_pages(query, int(pages)):
             replays += r['results']['results']
-        else:
-            for page in range(0, pages):
-                query['offset'] = page
-                r = self.get_data(query)
-                replays += r['results']['results']
-
-        for i in replays:
-            if i['emulator'] == 'fbneo' and i['live'] is False:
-                local_status = self.add_replay(
-                    replay=i,
-                    emulator=i['emulator'],
-                    game=game,
-                    player_replay=False
-                )
-                if local_status != status.ADDED:
-                    log.info(f'Not adding game, Status: {local_status}')
+
+        self.add_replays([i for i in replays if i['emulator'] == 'fbneo' and i['live'] is False])
 
         return status.ADDED
 
@@ -296,8 +334,7 @@ class Getreplay:
             str: Returns the string status of the request
         """
         # Validate url, this could probably be done better
-        pattern = re.compile(r'^https://replay\.fightcade\.com/fbneo/.*/[0-9]*-[0-9]*$')
-        if not pattern.match(url):
+        if not REPLAY_URL_PATTERN.match(url):
             return(status.INVALID_URL)
 
         # Parse url
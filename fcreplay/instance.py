@@ -5,6 +5,7 @@ import sys
 import time
 
 from fcreplay.config import Config
+from fcreplay.pipeline import Pipeline
 from fcreplay.replay import Replay
 
 log = logging.getLogger('fcreplay')
@@ -33,6 +34,38 @@ class Instance:
             log.info('Created tmp dir')
             os.mkdir(f"{self.config.fcreplay_dir}/tmp")
 
+    def pipeline(self, replay: Replay) -> Pipeline:
+        """Create the pipeline of stages to process a replay.
+
+        Thumbnails, the description and the uploads only wait for the stages
+        they use, so they run at the same time once the video is encoded.
+
+        Args:
+            replay (Replay): Replay to process
+
+        Returns:
+            Pipeline: Stages to process the replay
+        """
+        def upload_to_yt():
+            if replay.check_bad_words():
+                replay.upload_to_yt()
+
+        # Stages run on worker threads, each with its own scoped session
+        pipeline = Pipeline(teardown=replay.db.Session.remove)
+        pipeline.add('record', replay.record)
+        pipeline.add('get_characters', replay.get_characters, needs=['record'])
+        pipeline.add('encode', replay.encode, needs=['record'])
+        if self.config.remove_old_avi_files:
+            pipeline.add('remove_old_avi_files', replay.remove_old_avi_files, needs=['encode'])
+        pipeline.add('create_thumbnail', replay.create_thumbnail, needs=['encode'])
+        pipeline.add('update_thumbnail', replay.update_thumbnail, needs=['create_thumbnail'])
+        pipeline.add('set_description', replay.set_description, needs=['get_characters'])
+        if self.config.upload_to_ia:
+            pipeline.add('upload_to_ia', replay.upload_to_ia, needs=['encode', 'set_description'])
+        if self.config.upload_to_yt:
+            pipeline.add('upload_to_yt', upload_to_yt, needs=['encode', 'set_description', 'update_thumbnail'])
+        return pipeline
+
     def main(self):
         """The main loop for processing one or more replays
         """
@@ -42,20 +75,15 @@ class Instance:
         replay = Replay()
         if replay.replay is not None:
             try:
-                replay.add_job()
-                replay.record()
-                replay.get_characters()
-                replay.encode()
-                if self.config.remove_old_avi_files:
-                    replay.remove_old_avi_files()
-                replay.create_thumbnail()
-                replay.update_thumbnail()
-                replay.set_description()
-                if self.config.upload_to_ia:
-                    replay.upload_to_ia()
-                if self.config.upload_to_yt:
-                    if replay.check_bad_words():
-                        replay.upload_to_yt()
+                # Stages commit on their own thread's session. Detach the loaded replay and end
+                # this thread's transaction, so its connection isn't left idle in a transaction
+                # holding locks on replays while the replay is processed
+                replay.db.session.refresh(replay.replay)
+                replay.db.session.expunge(replay.replay)
+                replay.db.session.close()
+
+                timings = self.pipeline(replay).run()
+                log.info(f"Stage timings: {', '.join(f'{k}: {v:.2f}s' for k, v in timings.items())}")
                 replay.remove_job()
                 replay.db.update_created_replay(challenge_id=replay.replay.id)
                 replay.set_created()
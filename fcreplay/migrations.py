@@ -0,0 +1,133 @@
+"""Versioned database migrations.
+
+Tables are created by `Base.metadata.create_all`, which doesn't change
+tables that already exist. Changes to existing tables (indexes, columns,
+backfills) are added here as numbered migrations. Each migration runs
+once, in its own transaction, and is recorded in the schema_version table.
+
+To add a migration, append a function decorated with
+@migration(<next version>, '<description>'). It is passed a sqlalchemy
+connection and must be safe to run against a database created from the
+current models.
+"""
+from fcreplay.models import Character_detect, Replays
+from sqlalchemy import Index, inspect, text
+
+import logging
+
+log = logging.getLogger('fcreplay')
+
+MIGRATIONS = []
+
+TEXT_SEARCH_CONFIG = 'simple'
+"""Postgres text search configuration for descriptions. 'simple' doesn't stem, descriptions are mostly names"""
+
+
+def migration(version: int, description: str):
+    """Register a migration.
+
+    Args:
+        version (int): Schema version the migration upgrades to
+        description (str): Short description of the migration
+    """
+    def decorator(f):
+        MIGRATIONS.append((version, description, f))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return f
+    return decorator
+
+
+def _table_index(table, name: str) -> Index:
+    for index in table.indexes:
+        if index.name == name:
+            return index
+    raise LookupError(f"Index {name} not found on {table.name}")
+
+
+@migration(1, 'Add replay queue, finished replay and character detection indexes')
+def _replay_indexes(connection):
+    for index in [
+        _table_index(Replays.__table__, 'ix_replays_queued'),
+        _table_index(Replays.__table__, 'ix_replays_finished'),
+        _table_index(Character_detect.__table__, 'ix_character_detect_challenge_id'),
+    ]:
+        index.create(connection, checkfirst=True)
+
+
+@migration(2, 'Add replays.random_key for random replay selection')
+def _replay_random_key(connection):
+    columns = [c['name'] for c in inspect(connection).get_columns('replays')]
+    if 'random_key' not in columns:
+        connection.execute(text('alter table replays add column random_key float'))
+
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text('update replays set random_key = random() where random_key is null'))
+    else:
+        # sqlite random() returns a signed 64 bit integer
+        connection.execute(text('update replays set random_key = abs(random()) / 9223372036854775808.0 where random_key is null'))
+
+    _table_index(Replays.__table__, 'ix_replays_queued_random').create(connection, checkfirst=True)
+
+
+@migration(3, 'Fill the players table from existing replays')
+def _players(connection):
+    connection.execute(text(
+        'insert into players (name) '
+        'select p1 from replays where p1 is not null '
+        'union select p2 from replays where p2 is not null '
+        'except select name from players'
+    ))
+
+
+@migration(4, 'Add player name indexes for autocomplete')
+def _players_autocomplete(connection):
+    # sqlite falls back to an in memory index in the site, see fcreplay.site.autocomplete
+    if connection.dialect.name != 'postgresql':
+        return
+
+    connection.execute(text('create extension if not exists pg_trgm'))
+    connection.execute(text('create index if not exists ix_players_name_trgm on players using gin (lower(name) gin_trgm_ops)'))
+    connection.execute(text('create index if not exists ix_players_name_prefix on players (lower(name) text_pattern_ops)'))
+
+
+@migration(5, 'Add full text search for descriptions')
+def _description_search(connection):
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text('alter table descriptions add column if not exists search_vector tsvector'))
+        connection.execute(text(
+            f"update descriptions set search_vector = to_tsvector('{TEXT_SEARCH_CONFIG}', coalesce(description, '')) "
+            "where search_vector is null"
+        ))
+        connection.execute(text('create index if not exists ix_descriptions_search_vector on descriptions using gin (search_vector)'))
+    elif connection.dialect.name == 'sqlite':
+        connection.execute(text('create virtual table if not exists descriptions_fts using fts5(id unindexed, description)'))
+        connection.execute(text(
+            'insert into descriptions_fts (id, description) '
+            'select id, description from descriptions where id not in (select id from descriptions_fts)'
+        ))
+
+
+@migration(6, 'Add (sort column, id) indexes for keyset pagination of finished replays')
+def _replay_keyset_indexes(connection):
+    # ix_replays_finished was on date_added only
+    connection.execute(text('drop index if exists ix_replays_finished'))
+    for name in ['ix_replays_finished', 'ix_replays_finished_date_replay', 'ix_replays_finished_length']:
+        _table_index(Replays.__table__, name).create(connection, checkfirst=True)
+
+
+@migration(7, 'Fill the character catalogue from detected characters')
+def _character_catalogue(connection):
+    connection.execute(text(
+        'insert into character_catalogue (game, character) '
+        'select game, p1_char from character_detect where game is not null and p1_char is not null '
+        'union select game, p2_char from character_detect where game is not null and p2_char is not null '
+        'except select game, character from character_catalogue'
+    ))
+
+
+@migration(8, 'Add submissions.date_claimed so abandoned submission checks are claimed again')
+def _submission_claimed(connection):
+    columns = [c['name'] for c in inspect(connection).get_columns('submissions')]
+    if 'date_claimed' not in columns:
+        connection.execute(text('alter table submissions add column date_claimed timestamp'))
+    connection.execute(text("update submissions set date_claimed = date_added where status = 'CHECKING' and date_claimed is null"))
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, DateTime, Boolean, Text
+from sqlalchemy import Column, String, Integer, BigInteger, DateTime, Boolean, Text, Index, Float
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
@@ -43,6 +43,46 @@ class Replays(Base):
     video_youtube_id = Column(String)
     fail_count = Column(Integer)
     ia_filename = Column(String)
+    random_key = Column(Float)  # Uniform random number in [0, 1), used to pick random replays
+
+
+# Used by the recorder to find the next replay to encode
+Index(
+    'ix_replays_queued',
+    Replays.status, Replays.player_requested, Replays.date_added,
+    postgresql_where=(Replays.created == False) & (Replays.failed == False),  # noqa: E712
+    sqlite_where=(Replays.created == False) & (Replays.failed == False)  # noqa: E712
+)
+
+# Used to pick a random replay to encode
+Index(
+    'ix_replays_queued_random',
+    Replays.status, Replays.random_key,
+    postgresql_where=(Replays.created == False) & (Replays.failed == False),  # noqa: E712
+    sqlite_where=(Replays.created == False) & (Replays.failed == False)  # noqa: E712
+)
+
+# Used by the site to list finished replays, with keyset pagination on (sort column, id)
+Index(
+    'ix_replays_finished',
+    Replays.date_added, Replays.id,
+    postgresql_where=(Replays.created == True) & (Replays.failed == False) & (Replays.video_processed == True),  # noqa: E712
+    sqlite_where=(Replays.created == True) & (Replays.failed == False) & (Replays.video_processed == True)  # noqa: E712
+)
+
+Index(
+    'ix_replays_finished_date_replay',
+    Replays.date_replay, Replays.id,
+    postgresql_where=(Replays.created == True) & (Replays.failed == False) & (Replays.video_processed == True),  # noqa: E712
+    sqlite_where=(Replays.created == True) & (Replays.failed == False) & (Replays.video_processed == True)  # noqa: E712
+)
+
+Index(
+    'ix_replays_finished_length',
+    Replays.length, Replays.id,
+    postgresql_where=(Replays.created == True) & (Replays.failed == False) & (Replays.video_processed == True),  # noqa: E712
+    sqlite_where=(Replays.created == True) & (Replays.failed == False) & (Replays.video_processed == True)  # noqa: E712
+)
 
 
 class Youtube_day_log(Base):
@@ -58,8 +98,65 @@ class Character_detect(Base):
     __tablename__ = 'character_detect'
 
     id = Column(Integer, primary_key=True)
-    challenge_id = Column(String)
+    challenge_id = Column(String, index=True)
     p1_char = Column(String)
     p2_char = Column(String)
     vid_time = Column(String)
     game = Column(String)
+
+
+class Schema_version(Base):
+    __tablename__ = 'schema_version'
+
+    version = Column(Integer, primary_key=True)
+    description = Column(String)
+    applied = Column(DateTime)
+
+
+class Crawl_cursor(Base):
+    __tablename__ = 'crawl_cursor'
+
+    id = Column(String, primary_key=True)  # Name of the crawl, eg: top_weekly
+    last_date = Column(BigInteger)  # Newest replay date seen, in milliseconds
+    updated = Column(DateTime)
+
+
+class Character_catalogue(Base):
+    __tablename__ = 'character_catalogue'
+
+    game = Column(String, primary_key=True)
+    character = Column(String, primary_key=True)  # Every character detected for the game
+
+
+class Players(Base):
+    __tablename__ = 'players'
+
+    name = Column(String, primary_key=True)  # Every player seen in a replay, as p1 or p2
+
+
+class Cache_generation(Base):
+    __tablename__ = 'cache_generation'
+
+    name = Column(String, primary_key=True)  # Name of the cached data, eg: replays
+    generation = Column(Integer)  # Incremented every time the data changes
+    updated = Column(DateTime)
+
+
+class Submissions(Base):
+    __tablename__ = 'submissions'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    url = Column(String)
+    status = Column(String)  # SUBMITTED, CHECKING, then the result of Getreplay.get_replay
+    date_added = Column(DateTime)
+    date_claimed = Column(DateTime)
+    date_processed = Column(DateTime)
+
+
+# Used by the submission worker to find the next submission to check
+Index(
+    'ix_submissions_pending',
+    Submissions.id,
+    postgresql_where=(Submissions.status == 'SUBMITTED'),
+    sqlite_where=(Submissions.status == 'SUBMITTED')
+)
@@ -1,25 +1,53 @@
+"""Watch the overlay files fcadefbneo writes to the fightcade directory.
+
+Changes are picked up with inotify, using inotify_simple, which is only
+installed on Linux. Otherwise the directory is polled, and only files with
+a new modification time or size are read. Events are timestamped with the time
+the file was written, or the start of the recording for files that were
+already there, and the number of notifications, directory scans and
+file reads is counted in OverlayDetection.counters.
+
+Events are appended to the overlay event log as they happen, one json
+object per line. The first line has the start_time of the recording, the
+rest are overlay events, see CharacterDetection.
+"""
+from collections import Counter
 from fcreplay.config import Config
 import logging
 import datetime
+import json
 import os
-import pickle
 import threading
-import glob
 import time
 
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
+
 log = logging.getLogger('fcreplay')
 
+# Overlay files that don't change during a replay
+IGNORED_OVERLAYS = ['p1country', 'p2country']
+
 
 class OverlayDetection:
-    def __init__(self):
+    def __init__(self, poll_interval: float = 0.1):
         log.debug('Creating character detection instance')
         self.config = Config()
-        self.events = [{'start_time': datetime.datetime.now()}]
         self.finished = False
-        self.overlay_pickle_path = f"{self.config.fcadefbneo_path}/avi/overlay.pickle"
+        self.event_log_path = self.config.overlay_event_log
+        self.overlay_dir = f"{self.config.fcadefbneo_path}/fightcade"
+        self.poll_interval = poll_interval
+        self.counters = Counter()
+        self._monitor = {}
+        self.start_time = None
 
     def start(self):
         log.info('Starting character detection')
+        self._event_log = open(self.event_log_path, 'w')
+        self.start_time = datetime.datetime.now()
+        self._write_event({'start_time': self.start_time.isoformat()})
         self.overlay_thread = threading.Thread(target=self.watch_files)
         self.overlay_thread.start()
 
@@ -27,47 +55,97 @@ class OverlayDetection:
         log.info('Stopping character detection')
         self.finished = True
         self.overlay_thread.join()
-
-        with open(self.overlay_pickle_path, 'wb') as f:
-            pickle.dump(self.events, f, pickle.HIGHEST_PROTOCOL)
+        log.info(f"Overlay watcher counters: {dict(self.counters)}")
+        self._event_log.close()
 
     def watch_files(self):
-        monitor = {}
-
         log.info("Starting to watch files in fightacde directory")
-        while True:
-            if self.finished:
-                break
+        inotify = None
+        if INotify is not None:
+            try:
+                inotify = INotify()
+                inotify.add_watch(self.overlay_dir, flags.CLOSE_WRITE | flags.MOVED_TO)
+            except OSError as e:
+                log.warning(f"Unable to watch {self.overlay_dir} with inotify, polling instead: {e}")
+                inotify = None
 
-            for file_path in glob.glob(f"{self.config.fcadefbneo_path}/fightcade/*"):
-                base_name = os.path.basename(file_path)
-                overlay_type = os.path.splitext(base_name)[0]
+        if inotify is None:
+            self._poll_files()
+            return
 
-                if overlay_type in ['p1country', 'p2country']:
-                    continue
+        with inotify:
+            # Files written before the watch was added
+            self._poll_once({})
+            while not self.finished:
+                self.counters['waits'] += 1
+                for event in inotify.read(timeout=int(self.poll_interval * 1000)):
+                    self.counters['notifications'] += 1
+                    self._check_file(os.path.join(self.overlay_dir, event.name))
 
-                overlay_data = self.get_file_data(file_path)
+    def _poll_files(self):
+        """Poll the overlay directory, reading files whose mtime or size changed."""
+        seen = {}
+        while not self.finished:
+            self._poll_once(seen)
+            time.sleep(self.poll_interval)
 
-                if overlay_type not in monitor:
-                    monitor[overlay_type] = overlay_data
-                    self.add_event(overlay_type, overlay_data)
-                else:
-                    if monitor[overlay_type] != overlay_data:
-                        monitor[overlay_type] = overlay_data
-                        self.add_event(overlay_type, overlay_data)
+    def _poll_once(self, seen: dict):
+        self.counters['scans'] += 1
+        try:
+            entries = list(os.scandir(self.overlay_dir))
+        except FileNotFoundError:
+            return
 
-            time.sleep(0.5)
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+            if seen.get(entry.name) != (stat.st_mtime_ns, stat.st_size):
+                seen[entry.name] = (stat.st_mtime_ns, stat.st_size)
+                self._check_file(entry.path, stat.st_mtime)
+
+    def _check_file(self, file_path: str, mtime: float = None):
+        """Add an event if the overlay data in file_path changed.
+
+        Args:
+            file_path (str): Path of the overlay file
+            mtime (float, optional): Modification time of the file. Defaults to now.
+        """
+        overlay_type = os.path.splitext(os.path.basename(file_path))[0]
+        if overlay_type in IGNORED_OVERLAYS:
+            return
+
+        try:
+            overlay_data = self.get_file_data(file_path)
+        except FileNotFoundError:
+            return
+
+        if self._monitor.get(overlay_type) != overlay_data:
+            self._monitor[overlay_type] = overlay_data
+            date = None
+            if mtime is not None:
+                # Files left from an earlier replay were written before this
+                # recording started, their data is only shown from the start
+                date = max(datetime.datetime.fromtimestamp(mtime), self.start_time)
+            self.add_event(overlay_type, overlay_data, date)
 
     def get_file_data(self, file_path: str):
+        self.counters['reads'] += 1
         with open(file_path, 'rb') as f:
             return f.read().decode('ascii').strip()
 
-    def add_event(self, overlay_type: str, overlay_data: str):
+    def add_event(self, overlay_type: str, overlay_data: str, date: datetime.datetime = None):
         log.info(f"Adding overlay event '{overlay_type}': '{overlay_data}'")
-        self.events.append(
+        self.counters['events'] += 1
+        self._write_event(
             {
-                'date': datetime.datetime.now(),
+                'date': (date or datetime.datetime.now()).isoformat(),
                 'overlay_type': overlay_type,
                 'overlay_data': overlay_data
             }
         )
+
+    def _write_event(self, event: dict):
+        """Append an event to the event log, flushed so it survives a crash."""
+        self._event_log.write(json.dumps(event) + '\n')
+        self._event_log.flush()
@@ -0,0 +1,117 @@
+"""Run stages that depend on each other on a thread pool.
+
+Each stage names the stages it needs. A stage starts as soon as all of them
+have finished, so stages that don't depend on each other run at the same
+time. The time each stage took is kept in Pipeline.timings.
+"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import logging
+import time
+
+log = logging.getLogger('fcreplay')
+
+
+class Pipeline:
+    def __init__(self, max_workers: int = 4, teardown=None):
+        """Initialise the pipeline.
+
+        Args:
+            max_workers (int, optional): Number of stages that can run at once. Defaults to 4.
+            teardown (function, optional): Function run on the stage's thread after each stage,
+                eg to remove the thread's database session. Defaults to None.
+        """
+        self.max_workers = max_workers
+        self.teardown = teardown
+        self.stages = {}
+        self.timings = {}
+
+    def add(self, name: str, func, needs: list = ()):
+        """Add a stage.
+
+        Args:
+            name (str): Name of the stage
+            func (function): Function to run, without arguments
+            needs (list, optional): Names of the stages that must finish first. Defaults to ().
+
+        Raises:
+            ValueError: Raised if a stage with the same name was already added
+        """
+        if name in self.stages:
+            raise ValueError(f"Stage '{name}' was already added")
+        self.stages[name] = (func, list(needs))
+
+    def _check(self):
+        """Check every needed stage exists and there are no cycles.
+
+        Raises:
+            ValueError: Raised for an unknown stage or a cycle
+        """
+        for name, (_, needs) in self.stages.items():
+            for need in needs:
+                if need not in self.stages:
+                    raise ValueError(f"Stage '{name}' needs unknown stage '{need}'")
+
+        finished = set()
+        remaining = dict(self.stages)
+        while remaining:
+            ready = [name for name, (_, needs) in remaining.items() if finished.issuperset(needs)]
+            if not ready:
+                raise ValueError(f"Stages {sorted(remaining)} depend on each other")
+            for name in ready:
+                finished.add(name)
+                del remaining[name]
+
+    def _run_stage(self, name: str):
+        log.info(f"Starting stage '{name}'")
+        start = time.perf_counter()
+        try:
+            return self.stages[name][0]()
+        finally:
+            self.timings[name] = time.perf_counter() - start
+            log.info(f"Finished stage '{name}' in {self.timings[name]:.2f}s")
+            if self.teardown is not None:
+                self.teardown()
+
+    def run(self) -> dict:
+        """Run every stage once the stages it needs have finished.
+
+        When a stage raises, stages that haven't started are skipped, the
+        running stages are waited for, and the exception is raised again.
+
+        Raises:
+            ValueError: Raised for an unknown stage or a cycle
+
+        Returns:
+            dict: Seconds each stage took
+        """
+        self._check()
+
+        finished = set()
+        pending = dict(self.stages)
+        running = {}
+        error = None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                if error is None:
+                    for name in [n for n, (_, needs) in pending.items() if finished.issuperset(needs)]:
+                        del pending[name]
+                        running[executor.submit(self._run_stage, name)] = name
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    if future.exception() is not None:
+                        log.error(f"Stage '{name}' failed: {future.exception()}")
+                        error = error or future.exception()
+                    else:
+                        finished.add(name)
+
+        if error is not None:
+            raise error
+
+        return self.timings
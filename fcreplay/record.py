@@ -6,7 +6,6 @@ import os
 import subprocess
 import threading
 import time
-import collections
 
 from fcreplay.config import Config
 from fcreplay.overlay_detection import OverlayDetection
@@ -17,10 +16,51 @@ if 'DISPLAY' in os.environ:
 log = logging.getLogger('fcreplay')
 
 
+class FramecountLog:
+    """Reader of the frame count log written by framecount.lua.
+
+    The log is append only, one frame count per line. The log is kept open
+    and each read continues from where the last one stopped. A line that is still being
+    written is kept until the rest of it is read.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.frames = 0
+        self._file = None
+        self._partial = b''
+
+    def read(self) -> bool:
+        """Read the records written since the last read.
+
+        Returns:
+            bool: True if there were new records
+        """
+        if self._file is None:
+            try:
+                self._file = open(self.path, 'rb')
+            except FileNotFoundError:
+                return False
+
+        data = self._partial + self._file.read()
+        lines = data.split(b'\n')
+        self._partial = lines.pop()
+
+        for line in lines:
+            line = line.decode().strip()
+            if line:
+                self.frames = int(line)
+        return len(lines) > 0
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
 class Record:
     def __init__(self):
         self.config = Config()
-        self._last_good_frame_count = 0
 
     def _start_fcadefbneo(self, challenge_id: str, game_id: str):
         """Start fcadefbneo.
@@ -73,57 +113,6 @@ class Record:
                     return True
         return False
 
-    def get_framecount(self, replay_length_seconds) -> int:
-        """Get the number of frames rendered.
-
-        Args:
-            replay_length_seconds (int): Length of the replay in seconds
-              This is used to calculate if we are 'close enough' to the
-              end of the replay.
-
-        Raises:
-            TypeError: If a non-integer is found in the framecount
-            ValueError: If a non-integer is found in the framecount
-
-        Returns:
-            int: The number of frames rendered
-        """
-        # Number of times to try and get the frame count
-        retry = 5
-
-        while retry >= 1:
-            with open(f"{self.config.fcadefbneo_path}/lua/framecount.txt", 'r') as f:
-                frame_count_str = f.readline().strip()
-
-            try:
-                frame_count = int(frame_count_str)
-                break
-            except (TypeError, ValueError) as e:
-                # Sometimes, when a recording is finished a newline will be written to the
-                # framecount file. In this case the number of frames recorded will be 'pretty close'
-                # to length of the replay multiplyed by the framerate
-
-                # If the last good frame count is within say, 10% of the length multiplied by then
-                # framerate, then return the last good frame count
-                if self._last_good_frame_count >= (replay_length_seconds * 60 * 0.9):
-                    return self._last_good_frame_count
-
-                # Otherwise, we probably have encoutered a read error where the file was being written
-                # to at the same time we tried to read it. I'm not 100% sure about this. But it seems possible
-                retry -= 1
-                if retry <= 0:
-                    # If we fail to get the frame count after 5 tries, then raise an error
-                    log.error(f"Failed to get frame count, frame_count: {frame_count_str}")
-                    raise e
-                time.sleep(0.1)
-                continue
-            except Exception as e:
-                # This is to capture any other errrors that might occur
-                log.exception(f"Unexpected error: {e}")
-
-        self._last_good_frame_count = frame_count
-        return frame_count
-
     def _start_pulseaudio(self):
         """Start pulseaudio."""
         log.info("Starting pulseaudio")
@@ -198,9 +187,11 @@ class Record:
         # Get start time
         self.begin_time = datetime.datetime.now()
 
-        # Make sure 'started.inf' is missing
+        # Make sure 'started.inf' and the frame count log from the last replay are missing
         if os.path.exists(f"{self.config.fcadefbneo_path}/fightcade/started.inf"):
             os.remove(f"{self.config.fcadefbneo_path}/fightcade/started.inf")
+        if os.path.exists(f"{self.config.fcadefbneo_path}/lua/framecount.log"):
+            os.remove(f"{self.config.fcadefbneo_path}/lua/framecount.log")
 
         # Start fightcade fbneo thread
         self._start_ggpo_thread(challenge_id=challenge_id, game_id=game_id)
@@ -226,32 +217,30 @@ class Record:
         self.begin_time = datetime.datetime.now()
         minute_time = -1
 
-        # Initalise the framecount. Do this by setting up a 'queue' with a
-        # maximum length of 10. Then append each time to it. The 'last'
-        # element of the queue is the current frame. If all the elements
-        # of the queue are the same, then the rendering is finished
-        frame_counts = collections.deque(maxlen=10)
-
-        # Append two elements so that the queue isn't empty
-        frame_counts.append(-1)
-        frame_counts.append(0)
+        framecount_log = FramecountLog(f"{self.config.fcadefbneo_path}/lua/framecount.log")
+        last_frame_time = None
 
         while True:
-            # Add the current running time to the queue
-            frame_counts.append(self.get_framecount(replay_length_seconds))
+            if framecount_log.read():
+                last_frame_time = time.monotonic()
+            frame_count = framecount_log.frames
 
             # Debug the framecount
-            log.debug(f"Frame count is: {frame_counts[-1]}, or {int((frame_counts[-1] / 60) / 60)} of {(int(replay_length_seconds / 60))} minutes")
+            log.debug(f"Frame count is: {frame_count}, or {int((frame_count / 60) / 60)} of {(int(replay_length_seconds / 60))} minutes")
 
             # Only display the minute time every minute, and never display 0 minutes
-            if int(frame_counts[-1] / 60 / 60) != minute_time:
+            if int(frame_count / 60 / 60) != minute_time:
                 # Log the minute
-                log.info(f'Minute: {int((frame_counts[-1] / 60) / 60)} of {(int(replay_length_seconds / 60))}')
+                log.info(f'Minute: {int((frame_count / 60) / 60)} of {(int(replay_length_seconds / 60))}')
 
-            minute_time = int((frame_counts[-1] / 60) / 60)
+            minute_time = int((frame_count / 60) / 60)
 
-            # Finished recording video if all elements of the queue are the same
-            if len(set(frame_counts)) == 1:
+            # Finished recording video when the frame count stops increasing. The emulator doesn't
+            # report the end of a stream, so this is the only way the end is detected
+            stalled = last_frame_time is not None and \
+                time.monotonic() - last_frame_time > self.config.frame_stall_timeout
+            if stalled:
+                framecount_log.close()
                 overlay_detection.stop()
 
                 log.info("Stopping recording")
@@ -288,9 +277,14 @@ class Record:
                 return True
 
             # Kill Timeout reached
-            if int(frame_counts[-1] / 60) > (replay_length_seconds + kill_time):
-                log.error(f"Recording time was {frame_counts[-1] / 60} and went on longer than '{replay_length_seconds} + {kill_time}'")
+            if int(frame_count / 60) > (replay_length_seconds + kill_time):
+                log.error(f"Recording time was {frame_count / 60} and went on longer than '{replay_length_seconds} + {kill_time}'")
+                raise TimeoutError
+
+            if last_frame_time is None and (datetime.datetime.now() - self.begin_time).seconds > kill_time:
+                log.error(f"No frames were recorded after {kill_time} seconds")
+                self._cleanup_tasks()
                 raise TimeoutError
 
-            # So sleeping for 0.1 seconds doesn't work. The file only gets updated every 0.2 seconds or something
-            time.sleep(0.2)
+            # framecount.lua writes a record every 10 frames
+            time.sleep(0.05)
@@ -4,7 +4,7 @@ from fcreplay.record import Record
 from fcreplay.status import status
 from fcreplay.thumbnail import Thumbnail
 from fcreplay.updatethumbnail import UpdateThumbnail
-from fcreplay.character_detection import CharacterDetection
+from fcreplay.character_detection import CharacterDetection, DEFAULT_DEBOUNCE_SECONDS
 from fcreplay.upload_youtube import UploadYouTube
 from fcreplay.models import Replays
 
@@ -18,12 +18,29 @@ import logging
 import os
 import pkg_resources
 import re
+import socket
 import subprocess
+import threading
 import time
 import sys
 
 log = logging.getLogger('fcreplay')
 
+# Statuses in the order of the pipeline stages that set them, see Instance.pipeline
+STATUS_ORDER = [
+    status.RECORDING,
+    status.RECORDED,
+    status.THUMBNAIL_CREATED,
+    status.DESCRIPTION_CREATED,
+    status.UPLOADING_TO_IA,
+    status.UPLOADED_TO_IA,
+    status.BAD_WORDS_CHECKED,
+    status.UPLOADING_TO_YOUTUBE,
+    status.UPLOADED_TO_YOUTUBE,
+    status.REMOVED_JOB,
+    status.FINISHED,
+]
+
 
 class Replay:
     """Class for FightCade replays."""
@@ -35,6 +52,8 @@ class Replay:
         self.replay = self.get_replay()
         self.description_text = ""
         self.detected_characters = []
+        self._status_lock = threading.Lock()
+        self._status = None
 
         with open(pkg_resources.resource_filename('fcreplay', 'data/supported_games.json')) as f:
             self.supported_games = json.load(f)
@@ -66,29 +85,31 @@ class Replay:
         sys.exit(1)
 
     def get_replay(self) -> Replays:
-        """Get a replay from the database."""
+        """Claim a replay from the database.
+
+        The replay is marked as JOB_ADDED and a job is added for it in the
+        same transaction, so other instances can't pick the same replay.
+        """
         log.info('Getting replay from database')
-        if self.config.player_replay_first:
-            replay = self.db.get_oldest_player_replay()
-            if replay is not None:
-                log.info('Found player replay to encode')
-                return replay
-            else:
-                log.info('No more player replays')
+        replay = self.db.claim_next_replay(
+            worker_id=socket.gethostname(),
+            player_replay_first=self.config.player_replay_first,
+            random_replay=self.config.random_replay,
+            random_replay_strategy=self.config.random_replay_strategy
+        )
 
-        if self.config.random_replay:
-            log.info('Getting random replay')
-            replay = self.db.get_random_replay()
-            return replay
+        if replay is not None:
+            log.info(f"Claimed replay {replay.id}, player requested: {replay.player_requested}")
         else:
-            log.info('Getting oldest replay')
-            replay = self.db.get_oldest_replay()
+            log.info('No replays to encode')
 
         return replay
 
     def get_characters(self):
-        """Get characters (if they exist) from pickle file."""
-        c = CharacterDetection()
+        """Get characters (if they exist) from the overlay event log."""
+        c = CharacterDetection(
+            debounce=self.supported_games[self.replay.game].get('character_debounce', DEFAULT_DEBOUNCE_SECONDS)
+        )
         self.detected_characters = c.get_characters()
 
         for i in self.detected_characters:
@@ -100,31 +121,34 @@ class Replay:
                 game=self.replay.game
             )
 
-    def add_job(self):
-        """Update jobs database table with the current replay."""
-        start_time = datetime.datetime.utcnow()
-        self.update_status(status.JOB_ADDED)
-        self.db.add_job(
-            challenge_id=self.replay.id,
-            start_time=start_time,
-            length=self.replay.length
-        )
-
     def remove_job(self):
         """Remove job from database."""
         self.update_status(status.REMOVED_JOB)
         self.db.remove_job(challenge_id=self.replay.id)
 
-    def update_status(self, status):
-        """Update the replay status."""
-        log.info(f"Set status to {status}")
-        # This file is legacy?
-        with open('/tmp/fcreplay_status', 'w') as f:
-            f.write(f"{self.replay.id} {status}")
-        self.db.update_status(
-            challenge_id=self.replay.id,
-            status=status
-        )
+    def update_status(self, new_status):
+        """Update the replay status.
+
+        Stages that run at the same time set their status in any order. A
+        status earlier in STATUS_ORDER than the current one is skipped, so
+        the recorded status doesn't depend on which stage finished last.
+        FAILED is always set.
+        """
+        with self._status_lock:
+            if new_status in STATUS_ORDER and self._status in STATUS_ORDER and \
+                    STATUS_ORDER.index(new_status) < STATUS_ORDER.index(self._status):
+                log.info(f"Not setting status to {new_status}, already {self._status}")
+                return
+
+            log.info(f"Set status to {new_status}")
+            self._status = new_status
+            # This file is legacy?
+            with open('/tmp/fcreplay_status', 'w') as f:
+                f.write(f"{self.replay.id} {new_status}")
+            self.db.update_status(
+                challenge_id=self.replay.id,
+                status=new_status
+            )
 
     def record(self):
         """Start recording a replay."""
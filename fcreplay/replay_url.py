@@ -0,0 +1,5 @@
+"""Fightcade replay urls, shared by the crawler and the site."""
+import re
+
+REPLAY_URL_PATTERN = re.compile(r'^https://replay\.fightcade\.com/fbneo/.*/[0-9]*-[0-9]*$')
+"""Pattern a replay url must match, Eg: https://replay.fightcade.com/fbneo/sfiii3nr1/1234567890123-1234"""
@@ -0,0 +1,95 @@
+"""Player name autocomplete.
+
+On postgres names are matched with the trigram and prefix indexes added by
+migration 4. Other databases use an in memory PlayerIndex built from the
+cached player list. Results are ranked exact match first, then prefix
+matches, then by where the term appears in the name, and cached until the
+'players' cache generation changes.
+"""
+from bisect import bisect_left
+from cachetools import LRUCache
+from fcreplay.site import queries
+from fcreplay.site.cache import cache, current_generation
+from fcreplay.site.database import db
+
+import heapq
+import threading
+
+AUTOCOMPLETE_LIMIT = 20
+"""Maximum number of names returned"""
+
+MIN_SUBSTRING_LENGTH = 3
+"""Shorter terms are only matched as a prefix, trigram indexes need at least 3 characters"""
+
+_results = LRUCache(maxsize=4096)
+_results_lock = threading.Lock()
+
+
+class PlayerIndex:
+    """Sorted, lower cased player names, searched with bisect."""
+
+    def __init__(self, names):
+        self._entries = sorted((n.lower(), n) for n in names if n)
+        self._keys = [e[0] for e in self._entries]
+
+    def search(self, term, limit=AUTOCOMPLETE_LIMIT):
+        """Find player names containing term.
+
+        Args:
+            term (str): Text to search for
+            limit (int, optional): Maximum number of names. Defaults to AUTOCOMPLETE_LIMIT.
+
+        Returns:
+            list: Ranked player names
+        """
+        term = term.lower()
+        if not term:
+            return []
+
+        results = []
+        i = bisect_left(self._keys, term)
+        while i < len(self._keys) and len(results) < limit and self._keys[i].startswith(term):
+            results.append(self._entries[i][1])
+            i += 1
+
+        if len(results) < limit and len(term) >= MIN_SUBSTRING_LENGTH:
+            matches = (
+                (key.find(term), key, name) for key, name in self._entries
+                if not key.startswith(term) and term in key
+            )
+            results += [m[2] for m in heapq.nsmallest(limit - len(results), matches)]
+
+        return results
+
+
+def _search(term, limit):
+    if db.engine.dialect.name == 'postgresql':
+        return queries.playerlist_search(term, limit, substring=len(term) >= MIN_SUBSTRING_LENGTH)
+
+    index = cache.get('player_index', lambda: PlayerIndex(queries.playerlist()), generation_name='players')
+    return index.search(term, limit)
+
+
+def search_players(term, limit=AUTOCOMPLETE_LIMIT):
+    """Find player names for autocomplete.
+
+    Args:
+        term (str): Text typed so far
+        limit (int, optional): Maximum number of names. Defaults to AUTOCOMPLETE_LIMIT.
+
+    Returns:
+        list: Ranked player names
+    """
+    term = term.strip().lower()
+    if not term:
+        return []
+
+    key = (current_generation('players'), term, limit)
+    with _results_lock:
+        results = _results.get(key)
+    if results is None:
+        results = _search(term, limit)
+        with _results_lock:
+            _results[key] = results
+
+    return results
@@ -1,16 +1,23 @@
+from fcreplay.replay_url import REPLAY_URL_PATTERN
 from fcreplay.site import queries
-from fcreplay.site.database import db
+from fcreplay.site.autocomplete import search_players
+from fcreplay.site.cache import cache
 from fcreplay.site.forms import AdvancedSearchForm, SearchForm, SubmitForm
-from fcreplay.site.feed import Feed
+from fcreplay.site.pagination import KeysetPagination
+from fcreplay.site.response_cache import cached_response
+from fcreplay.site.feed import rendered_feed
+from fcreplay.site.sitemap import sitemap_filename, update_sitemaps
+from fcreplay.site.status import Status
+from fcreplay.status import status
 
 from flask import Blueprint
-from flask import abort, jsonify, render_template, request, session, redirect, send_from_directory, url_for
+from flask import abort, current_app, jsonify, make_response, render_template, request, session, redirect, send_from_directory, url_for
+from urllib.parse import urlencode
 
-import datetime
+import hashlib
 import json
 import logging
 import pkg_resources
-import pytz
 
 app = Blueprint('blueprint', __name__, static_folder='static')
 
@@ -18,11 +25,23 @@ with open(pkg_resources.resource_filename('fcreplay', 'data/supported_games.json
     supported_games = json.load(f)
 
 
+def _paginate(listing):
+    """Get the page of a listing from the cursor or legacy page number in the request."""
+    args = sorted((k, v) for k, v in request.args.items(multi=True) if k not in ('page', 'cursor'))
+    return KeysetPagination(
+        listing,
+        cursor=request.args.get('cursor'),
+        page=request.args.get('page', 1, type=int),
+        per_page=9,
+        count_key=f"{request.path}?{urlencode(args)}"
+    )
+
+
 @app.route('/')
+@cached_response
 def index():
     searchForm = SearchForm()
-    page = request.args.get('page', 1, type=int)
-    pagination = queries.all_replays().paginate(page, per_page=9)
+    pagination = _paginate(queries.all_replays())
     replays = pagination.items
 
     return render_template('start.j2.html', pagination=pagination, replays=replays, form=searchForm, games=supported_games)
@@ -43,24 +62,59 @@ def videolinks():
 
 
 @app.route('/api/supportedgames')
+@cached_response
 def supportedgames():
     return jsonify(supported_games)
 
 
+def _playerlist():
+    playerlist = queries.playerlist()
+    body = json.dumps(playerlist).encode()
+    return playerlist, body, hashlib.sha1(body).hexdigest()
+
+
 @app.route('/api/playerlist')
 def playerList():
-    playerlist = queries.playerlist()
-    playerlist = sorted(playerlist)
-    return jsonify(playerlist)
+    playerlist, body, etag = cache.get('playerlist', _playerlist, generation_name='players')
+
+    response = make_response(body)
+    response.content_type = 'application/json'
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+
+def _characters():
+    characters = queries.character_catalogue()
+    bodies = {game: json.dumps(chars).encode() for game, chars in characters.items()}
+    bodies[None] = json.dumps(characters).encode()
+    return {game: (body, hashlib.sha1(body).hexdigest()) for game, body in bodies.items()}
+
 
+@app.route('/api/characters')
+@app.route('/api/characters/<game>')
+def characters(game=None):
+    body, etag = cache.get('characters', _characters, generation_name='characters').get(game, (b'[]', None))
 
-@app.route('/api/playerlist/search', methods=['POST'])
+    response = make_response(body)
+    response.content_type = 'application/json'
+    if etag is not None:
+        response.set_etag(etag)
+    return response.make_conditional(request)
+
+
+@app.route('/api/playerlist/search', methods=['GET', 'POST'])
 def playerListSearch():
+    if request.method == 'GET':
+        if 'q' not in request.args:
+            abort(404)
+        response = jsonify(search_players(request.args['q']))
+        response.cache_control.public = True
+        response.cache_control.max_age = 60
+        return response
+
     if 'player_id' not in request.json:
         abort(404)
-    playerlist = queries.playerlist_search(request.json['player_id'])
-    playerlist = sorted(playerlist)
-    return jsonify(playerlist)
+    return jsonify(search_players(request.json['player_id']))
 
 
 @app.route('/submit')
@@ -77,23 +131,44 @@ def submitResult():
     if request.method == 'POST':
         result = SubmitForm(request.form)
 
-        challenge_id = result.challenge_url.data
-        session['challenge_url'] = result.challenge_url.data
+        challenge_url = result.challenge_url.data
+        session['challenge_url'] = challenge_url
+        session.pop('submission_id', None)
 
-        from fcreplay.getreplay import Getreplay
-        replay_result = Getreplay().get_replay(challenge_id, player_requested=True)
+        # Submissions are checked against the fightcade api by 'fcreplay tasker start submissions',
+        # only the url is validated here so the request returns straight away
+        if REPLAY_URL_PATTERN.match(challenge_url or ''):
+            session['submission_id'] = queries.add_submission(challenge_url).id
+            session['replay_result'] = status.SUBMITTED
+        else:
+            session['replay_result'] = status.INVALID_URL
 
-        session['replay_result'] = replay_result
-        logging.info(f"Submit replay: {challenge_id} status is: {replay_result}")
+        logging.info(f"Submit replay: {challenge_url} status is: {session['replay_result']}")
 
-        # Add replay and get status here
         return redirect(url_for('blueprint.submitResult'))
     else:
         searchForm = SearchForm()
         if 'replay_result' not in session:
             return index()
         result = session['replay_result']
-        return render_template('submitResult.j2.html', form=searchForm, result=result, submt_active=True)
+        return render_template('submitResult.j2.html', form=searchForm, result=result,
+                               description=Status().status_description.get(result, result),
+                               submission_id=session.get('submission_id'), submt_active=True)
+
+
+@app.route('/api/submission/<int:submission_id>')
+def submissionStatus(submission_id):
+    submission = queries.submission(submission_id)
+    if submission is None:
+        abort(404)
+
+    return jsonify({
+        'id': submission.id,
+        'url': submission.url,
+        'status': submission.status,
+        'description': Status().status_description.get(submission.status, submission.status),
+        'finished': submission.status not in (status.SUBMITTED, status.CHECKING)
+    })
 
 
 @app.route('/search/assets/<path:path>')
@@ -102,21 +177,33 @@ def send_js(path):
     return send_from_directory('templates/assets', path)
 
 
+def _about_counts():
+    counts = {}
+    numberOfReplays = 0
+    toProcess = 0
+
+    for row in queries.replay_counts_by_game():
+        counts[row.game] = int(row.created or 0)
+        numberOfReplays += int(row.created or 0)
+        toProcess += int(row.queued or 0)
+
+    return counts, numberOfReplays, toProcess
+
+
 @app.route('/about')
+@cached_response
 def about():
     searchForm = SearchForm()
 
+    counts, numberOfReplays, toProcess = cache.get('about_counts', _about_counts)
+
     sortedGames = sorted(supported_games.items(), key=lambda item: item[1]['game_name'])
     supportedGames = {}
     for game in sortedGames:
         supportedGames[game[0]] = {
             'game_name': supported_games[game[0]]['game_name'],
+            'count': counts.get(game[0], 0)
         }
-        supportedGames[game[0]]['count'] = db.session.execute(f"select count(id) from replays where created = true and game = '{game[0]}'").first()[0]
-
-    numberOfReplays = db.session.execute('select count(id) from replays where created = true').first()[0]
-
-    toProcess = db.session.execute('select count(id) from replays where created = false and failed = false').first()[0]
 
     return render_template('about.j2.html', about_active=True, form=searchForm, supportedGames=supportedGames, numberOfReplays=numberOfReplays, toProcess=toProcess)
 
@@ -126,24 +213,12 @@ def advancedSearch():
     searchForm = SearchForm()
     advancedSearchForm = AdvancedSearchForm()
 
-    all_characters_sql = db.session.execute('select p1_char as char,game from character_detect union select p2_char as char,game from character_detect')
-    all_characters_dict = {}
-
-    for row in all_characters_sql:
-        if row.game not in all_characters_dict:
-            all_characters_dict[row.game] = []
-        all_characters_dict[row.game].append(row.char)
-
-    players_list = queries.playerlist()
-    players_list = sorted(players_list)
-
-    advancedSearchForm.p1_name.choices = players_list
-    advancedSearchForm.p2_name.choices = players_list
-
-    return render_template('advancedSearch.j2.html', advancedsearch_active=True, form=searchForm, advancedSearchForm=advancedSearchForm, character_dict=all_characters_dict, players_list=players_list)
+    # Characters are loaded from /api/characters/<game> when a game is selected
+    return render_template('advancedSearch.j2.html', advancedsearch_active=True, form=searchForm, advancedSearchForm=advancedSearchForm)
 
 
 @app.route('/advancedSearchResult')
+@cached_response
 def advancedSearchResult():
     search = request.args.get('search')
     p1_name = request.args.get('p1_name', default='', type=str)
@@ -154,11 +229,10 @@ def advancedSearchResult():
     p2_rank = request.args.get('p2_rank')
     order_by = request.args.get('order_by', default='date_added')
     game = request.args.get('game')
-    page = request.args.get('page', 1, type=int)
 
     searchForm = SearchForm()
 
-    pagination = queries.advanced_search(game_id=game,
+    pagination = _paginate(queries.advanced_search(game_id=game,
                                          p1_rank=p1_rank,
                                          p2_rank=p2_rank,
                                          search_query=search,
@@ -167,18 +241,18 @@ def advancedSearchResult():
                                          char2=char2,
                                          p1_name=p1_name,
                                          p2_name=p2_name
-                                         ).paginate(page, per_page=9)
+                                         ))
     replays = pagination.items
 
     return render_template('start.j2.html', pagination=pagination, replays=replays, form=searchForm, games=supported_games)
 
 
 @app.route('/search', )
+@cached_response
 def search():
     search = request.args.get('search')
     order_by = request.args.get('order_by', default='date_added')
     game = request.args.get('game')
-    page = request.args.get('page', 1, type=int)
 
     searchForm = SearchForm(request.form,
                             search=search,
@@ -187,18 +261,18 @@ def search():
     if game == 'Any':
         game = '%'
 
-    pagination = queries.basic_search(game, search, order_by).paginate(page, per_page=9)
+    pagination = _paginate(queries.basic_search(game, search, order_by))
     replays = pagination.items
 
     return render_template('start.j2.html', pagination=pagination, replays=replays, form=searchForm, games=supported_games)
 
 
 @app.route('/search/player')
+@cached_response
 def search_player():
     searchForm = SearchForm()
     player = request.args.get('player')
-    page = request.args.get('page', 1, type=int)
-    pagination = queries.player_search(player).paginate(page, per_page=9)
+    pagination = _paginate(queries.player_search(player))
     replays = pagination.items
 
     return render_template('start.j2.html', pagination=pagination, replays=replays, form=searchForm, games=supported_games)
@@ -210,15 +284,53 @@ def robots():
     return send_from_directory(app.static_folder, request.path[1:])
 
 
+def _site_url():
+    # The configured url, not the Host header, which anyone can set
+    return current_app.config['SITE_URL'].rstrip('/')
+
+
+def _video_sitemaps():
+    return update_sitemaps(current_app.config['SITEMAP_DIR'], _site_url())
+
+
+def _xml_response(body):
+    response = make_response(body)
+    response.mimetype = 'application/xml'
+    return response
+
+
 @app.route('/sitemap.xml')
 def sitemap():
-    tz = pytz.timezone("Pacific/Auckland")
-    aware_dt = tz.localize(datetime.datetime.now())
-    update_date = aware_dt.isoformat()
-    return render_template('sitemap.j2.xml', update_date=update_date)
+    sitemaps = _video_sitemaps()['sitemaps']
+    lastmod = sitemaps[-1]['lastmod'] if sitemaps else None
+    return _xml_response(render_template(
+        'sitemap_index.j2.xml',
+        base_url=_site_url(),
+        lastmod=lastmod,
+        sitemaps=sitemaps,
+        sitemap_filename=sitemap_filename
+    ))
+
+
+@app.route('/sitemap-pages.xml')
+def sitemap_pages():
+    sitemaps = _video_sitemaps()['sitemaps']
+    lastmod = sitemaps[-1]['lastmod'] if sitemaps else None
+    return _xml_response(render_template('sitemap.j2.xml', base_url=_site_url(), lastmod=lastmod))
+
+
+@app.route('/sitemap-videos-<int:number>.xml.gz')
+def sitemap_videos(number):
+    if number >= len(_video_sitemaps()['sitemaps']):
+        abort(404)
+    return send_from_directory(
+        current_app.config['SITEMAP_DIR'], sitemap_filename(number),
+        mimetype='application/gzip', conditional=True
+    )
 
 
 @app.route('/video/<challenge_id>')
+@cached_response
 def videopage(challenge_id):
     searchForm = SearchForm()
 
@@ -244,11 +356,22 @@ def videopage(challenge_id):
     return render_template('video.j2.html', replay=replay, characters=characters, seek=seek, form=searchForm, games=supported_games)
 
 
+def _feed_response(name, content_type):
+    body, etag, last_modified = rendered_feed(name)
+
+    response = make_response(body)
+    response.content_type = content_type
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    return response.make_conditional(request)
+
+
 @app.route('/feed/atom')
 def feed_atom():
-    return Feed().render_atom()
+    return _feed_response('atom', 'application/atom+xml')
 
 
 @app.route('/feed/rss')
 def feed_rss():
-    return Feed().render_rss()
+    return _feed_response('rss', 'application/rss+xml')
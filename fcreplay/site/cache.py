@@ -0,0 +1,69 @@
+"""In-process cache for data that is expensive to query.
+
+Entries are tagged with a cache generation from the cache_generation table.
+fcreplay increments the generation when replays are created, processed or
+removed, so cached entries are dropped as soon as the data changes, and
+after CACHE_TTL seconds at the latest. The least recently used entries are
+dropped once the cache is full.
+"""
+from cachetools import LRUCache
+from fcreplay.site.database import db
+from fcreplay.site.models import Cache_generation
+from flask import current_app
+
+import threading
+import time
+
+DEFAULT_TTL = 300
+
+
+def current_generation(name='replays'):
+    """Get the current generation of cached data.
+
+    Args:
+        name (str, optional): Name of the cached data. Defaults to 'replays'.
+
+    Returns:
+        int: Generation, 0 if the data has never changed
+    """
+    return db.session.query(Cache_generation.generation).filter(
+        Cache_generation.name == name
+    ).scalar() or 0
+
+
+class GenerationCache:
+    def __init__(self, maxsize=1024):
+        self._entries = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+
+    def get(self, key, loader, generation_name='replays'):
+        """Get a cached value, calling loader to refresh it when stale.
+
+        Args:
+            key (str): Cache key
+            loader (function): Function returning the value
+            generation_name (str, optional): Cache generation the value depends on. Defaults to 'replays'.
+
+        Returns:
+            The cached value
+        """
+        generation = current_generation(generation_name)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and entry[0] == generation and entry[1] > now:
+            return entry[2]
+
+        value = loader()
+        ttl = current_app.config.get('CACHE_TTL', DEFAULT_TTL)
+        with self._lock:
+            self._entries[key] = (generation, now + ttl, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+cache = GenerationCache()
@@ -1,11 +1,23 @@
 from feedgen.feed import FeedGenerator
-from fcreplay.database import Database
+from fcreplay.site import queries
+from fcreplay.site.cache import cache
+
+import hashlib
 import json
 import pkg_resources
 
+with open(pkg_resources.resource_filename('fcreplay', 'data/supported_games.json')) as f:
+    supported_games = json.load(f)
+
 
 class Feed:
-    def __init__(self):
+    """Atom and RSS feeds of the latest finished replays.
+
+    Feeds are rendered once and cached as bytes until the replays cache
+    generation changes, ie when a replay is created or processed.
+    """
+
+    def __init__(self, replays):
         self.fg = FeedGenerator()
         self.fg.id('https://fightcadevids.com/feeds')
         self.fg.title('FightcadeVids')
@@ -15,18 +27,10 @@ class Feed:
         self.fg.subtitle('Fightcade Videos')
         self.fg.language('en')
 
-        self.atomfeed = self.fg.atom_str(pretty=True)
-        self.rssfeed = self.fg.rss_str(pretty=True)
-
-        with open(pkg_resources.resource_filename('fcreplay', 'data/supported_games.json')) as f:
-            self.supported_games = json.load(f)
-
-        self.db = Database()
-
-    def generate_feed(self):
-        # Read lates videos from database
-        replays = self.db.get_all_finished_replays(limit=25)
+        self.last_modified = None
+        self.generate_feed(replays)
 
+    def generate_feed(self, replays):
         dates = []
 
         for r in replays:
@@ -35,7 +39,7 @@ class Feed:
             else:
                 link = f'http://archive.org/details/{r.id.replace("@", "-")}'
 
-            description = f"{self.supported_games[r.game]['game_name']} - ({r.p1_loc}) {r.p1} vs {r.p2_loc}) {r.p2}"
+            description = f"{supported_games[r.game]['game_name']} - ({r.p1_loc}) {r.p1} vs {r.p2_loc}) {r.p2}"
 
             fe = self.fg.add_entry()
             fe.title(description)
@@ -48,17 +52,35 @@ class Feed:
 
             dates.append(r.date_added)
 
-        # Get newest date from list
-        newest_date = max(dates)
-
-        self.fg.updated(newest_date.strftime('%a, %e %b %Y %H:%M:%S UTC'))
+        if dates:
+            # Get newest date from list
+            self.last_modified = max(dates)
+            self.fg.updated(self.last_modified.strftime('%a, %e %b %Y %H:%M:%S UTC'))
+            # feedgen defaults lastBuildDate to now, which changes the rss etag every render
+            self.fg.lastBuildDate(self.last_modified.strftime('%a, %e %b %Y %H:%M:%S UTC'))
 
     def render_atom(self):
-        self.generate_feed()
-        atom = self.fg.atom_str(pretty=True)
-        return atom
+        return self.fg.atom_str(pretty=True)
 
     def render_rss(self):
-        self.generate_feed()
-        rss = self.fg.rss_str(pretty=True)
-        return rss
+        return self.fg.rss_str(pretty=True)
+
+
+def _render_feeds():
+    feed = Feed(queries.latest_finished_replays(limit=25))
+    feeds = {}
+    for name, body in [('atom', feed.render_atom()), ('rss', feed.render_rss())]:
+        feeds[name] = (body, hashlib.sha1(body).hexdigest(), feed.last_modified)
+    return feeds
+
+
+def rendered_feed(name):
+    """Get a rendered feed.
+
+    Args:
+        name (str): 'atom' or 'rss'
+
+    Returns:
+        tuple: (body, etag, last_modified)
+    """
+    return cache.get('feeds', _render_feeds)[name]
@@ -15,7 +15,8 @@ class AdvancedSearchForm(FlaskForm):
     orderby_list = [
         ('date_added', 'Date Added'),
         ('date_replay', 'Replay Date'),
-        ('length', 'Length')
+        ('length', 'Length'),
+        ('relevance', 'Relevance')
     ]
 
     rank_list = [
@@ -62,7 +63,8 @@ class SearchForm(FlaskForm):
     orderby_list = [
         ('date_replay', 'Replay Date'),
         ('date_added', 'Date Added'),
-        ('length', 'Length')
+        ('length', 'Length'),
+        ('relevance', 'Relevance')
     ]
 
     # Generate supported games
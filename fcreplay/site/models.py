@@ -24,6 +24,30 @@ class Replays(db.Model):
     ia_filename = db.Column(db.String)
 
 
+class Character_catalogue(db.Model):
+    game = db.Column(db.String, primary_key=True)
+    character = db.Column(db.String, primary_key=True)
+
+
+class Players(db.Model):
+    name = db.Column(db.String, primary_key=True)
+
+
+class Cache_generation(db.Model):
+    name = db.Column(db.String, primary_key=True)
+    generation = db.Column(db.Integer)
+    updated = db.Column(db.DateTime)
+
+
+class Submissions(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    url = db.Column(db.String)
+    status = db.Column(db.String)
+    date_added = db.Column(db.DateTime)
+    date_claimed = db.Column(db.DateTime)
+    date_processed = db.Column(db.DateTime)
+
+
 class Descriptions(db.Model):
     id = db.Column(db.Text, primary_key=True)
     description = db.Column(db.Text)
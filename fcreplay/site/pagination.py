@@ -0,0 +1,134 @@
+"""Keyset pagination for replay listings.
+
+Pages are fetched with WHERE (sort_column, id) < (last value, last id)
+instead of an OFFSET, so deep pages cost the same as the first one. The
+position is passed between pages as an opaque cursor. The total is counted
+once and cached until the replays cache generation changes.
+
+Legacy ?page=N links still work, using an OFFSET for that page only.
+Invalid cursors, or cursors for a different sort column, show the first page.
+"""
+from fcreplay.site.cache import cache
+from fcreplay.site.models import Replays
+from flask import request, url_for
+from sqlalchemy import tuple_
+
+import base64
+import datetime
+import json
+
+
+def encode_cursor(direction, value, challenge_id):
+    """Encode a position in a listing.
+
+    Args:
+        direction (str): 'next' for the rows after the position, 'prev' for the rows before it
+        value: Sort column value at the position
+        challenge_id (str): Replay id at the position
+
+    Returns:
+        str: Url safe cursor
+    """
+    if isinstance(value, datetime.datetime):
+        value = {'dt': value.isoformat()}
+    data = json.dumps([direction, value, challenge_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor created by encode_cursor.
+
+    Args:
+        cursor (str): Cursor
+
+    Returns:
+        tuple: (direction, value, challenge_id), or None if the cursor is invalid
+    """
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        direction, value, challenge_id = data
+        if isinstance(value, dict):
+            value = datetime.datetime.fromisoformat(value['dt'])
+    except (ValueError, TypeError, KeyError):
+        return None
+
+    if direction not in ('next', 'prev'):
+        return None
+    return direction, value, challenge_id
+
+
+def _matches_column(sort_column, position):
+    """Check a decoded cursor has a value of the sort column's type, eg for a cursor edited by hand."""
+    _, value, challenge_id = position
+    if not isinstance(challenge_id, str) or isinstance(value, bool):
+        return False
+
+    try:
+        expected = sort_column.type.python_type
+    except NotImplementedError:
+        # Computed columns, eg search rank
+        expected = float
+    if expected is float:
+        expected = (int, float)
+    return isinstance(value, expected)
+
+
+class KeysetPagination:
+    def __init__(self, listing, cursor=None, page=None, per_page=9, count_key=None):
+        """Fetch one page of a listing.
+
+        Args:
+            listing (fcreplay.site.queries.Listing): Query and the column it is sorted by
+            cursor (str, optional): Cursor from a previous page. Defaults to the first page.
+            page (int, optional): Legacy page number, used when there is no cursor. Defaults to None.
+            per_page (int, optional): Replays per page. Defaults to 9.
+            count_key (str, optional): Key to cache the total under. Defaults to not counting.
+        """
+        self.per_page = per_page
+        sort_column = listing.sort_column
+        query = listing.query.add_columns(sort_column.label('sort_value'))
+        position = decode_cursor(cursor) if cursor else None
+        if position is not None and not _matches_column(sort_column, position):
+            position = None
+
+        if position is None:
+            offset = (page - 1) * per_page if page and page > 1 else 0
+            rows = query.offset(offset).limit(per_page + 1).all()
+            self.has_prev = offset > 0
+            self.has_next = len(rows) > per_page
+            rows = rows[:per_page]
+        elif position[0] == 'next':
+            rows = query.filter(
+                tuple_(sort_column, Replays.id) < tuple_(position[1], position[2])
+            ).limit(per_page + 1).all()
+            self.has_prev = True
+            self.has_next = len(rows) > per_page
+            rows = rows[:per_page]
+        else:
+            rows = query.order_by(None).order_by(sort_column.asc(), Replays.id.asc()).filter(
+                tuple_(sort_column, Replays.id) > tuple_(position[1], position[2])
+            ).limit(per_page + 1).all()
+            self.has_prev = len(rows) > per_page
+            self.has_next = True
+            rows = list(reversed(rows[:per_page]))
+
+        self.items = [r[0] for r in rows]
+        self.next_cursor = encode_cursor('next', rows[-1].sort_value, rows[-1][0].id) if rows and self.has_next else None
+        self.prev_cursor = encode_cursor('prev', rows[0].sort_value, rows[0][0].id) if rows and self.has_prev else None
+
+        self.total = None
+        if count_key is not None:
+            self.total = cache.get(f'count:{count_key}', lambda: listing.query.order_by(None).count())
+
+    def url_for_cursor(self, cursor):
+        """Url of the current page with a different cursor."""
+        args = {k: v for k, v in request.args.items() if k not in ('page', 'cursor')}
+        return url_for(request.endpoint, cursor=cursor, **request.view_args, **args)
+
+    @property
+    def next_url(self):
+        return self.url_for_cursor(self.next_cursor) if self.next_cursor else None
+
+    @property
+    def prev_url(self):
+        return self.url_for_cursor(self.prev_cursor) if self.prev_cursor else None
@@ -1,24 +1,112 @@
-from fcreplay.site.models import Replays, Descriptions, Character_detect
+from collections import namedtuple
+from fcreplay.site.models import Replays, Descriptions, Character_detect, Character_catalogue, Submissions, Players
 from fcreplay.site.database import db
+from fcreplay.migrations import TEXT_SEARCH_CONFIG
+from fcreplay.status import status
+from flask import current_app
+from sqlalchemy import and_, case, column, func, literal, literal_column, or_, table, text, tuple_
 
+import datetime
 
-def _order(order_string):
+
+Listing = namedtuple('Listing', ['query', 'sort_column'])
+"""A query of replays ordered by sort_column then id, newest first, without NULL sort values. See fcreplay.site.pagination"""
+
+
+def _sort_column(order_string, matches=None):
     if order_string == 'date_replay':
-        return Replays.date_replay.desc()
+        return Replays.date_replay
     elif order_string == 'date_added':
-        return Replays.date_added.desc()
+        return Replays.date_added
     elif order_string == 'length':
-        return Replays.length.desc()
+        return Replays.length
+    elif order_string == 'relevance':
+        return Replays.date_added if matches is None else matches.c.rank
     else:
         raise LookupError
 
 
+def _listing(query, sort_column):
+    # Keyset pages can't step past a NULL sort value, (NULL, id) < (value, id) is never true
+    query = query.filter(sort_column.isnot(None))
+    return Listing(query.order_by(sort_column.desc(), Replays.id.desc()), sort_column)
+
+
+def _fts5_query(search_query):
+    # Quote every word, so FTS5 operators in the search are matched literally
+    return ' '.join('"' + word.replace('"', '""') + '"' for word in search_query.split())
+
+
+def _description_matches(search_query):
+    """Find descriptions matching a search, as a subquery of (id, rank).
+
+    Uses the full text index created by migration 5 when FULLTEXT_SEARCH is
+    enabled, otherwise descriptions are matched with ilike and all ranked 0.
+    Returns None for an empty search.
+    """
+    search_query = (search_query or '').strip()
+    if not search_query:
+        return None
+
+    dialect = db.engine.dialect.name
+    if current_app.config.get('FULLTEXT_SEARCH', True):
+        if dialect == 'postgresql':
+            search_vector = literal_column('descriptions.search_vector')
+            tsquery = func.websearch_to_tsquery(TEXT_SEARCH_CONFIG, search_query)
+            return db.session.query(
+                Descriptions.id.label('id'),
+                func.ts_rank(search_vector, tsquery).label('rank')
+            ).filter(search_vector.op('@@')(tsquery)).subquery()
+        elif dialect == 'sqlite':
+            descriptions_fts = table('descriptions_fts', column('id'))
+            return db.session.query(
+                descriptions_fts.c.id.label('id'),
+                (-func.bm25(literal_column('descriptions_fts'))).label('rank')
+            ).filter(
+                text('descriptions_fts match :fts_query').bindparams(fts_query=_fts5_query(search_query))
+            ).subquery()
+
+    return db.session.query(
+        Descriptions.id.label('id'),
+        literal(0).label('rank')
+    ).filter(
+        Descriptions.description.ilike(f'%{search_query}%')
+    ).subquery()
+
+
 def all_replays():
-    return Replays.query.filter(
+    return _listing(Replays.query.filter(
         Replays.created == True,
         Replays.failed == False,
         Replays.video_processed == True
-    ).order_by(Replays.date_added.desc())
+    ), Replays.date_added)
+
+
+def latest_finished_replays(limit):
+    return Replays.query.filter(
+        Replays.created == True,
+        Replays.failed == False
+    ).order_by(Replays.date_added.desc()).limit(limit).all()
+
+
+def finished_replay_dates(after=None):
+    """Get the id and date_added of finished replays, oldest first.
+
+    Args:
+        after (tuple, optional): (date_added, id) of the replay to start after. Defaults to None.
+
+    Returns:
+        Query: Query of (id, date_added) rows
+    """
+    query = db.session.query(Replays.id, Replays.date_added).filter(
+        Replays.created == True,
+        Replays.failed == False,
+        Replays.video_processed == True,
+        Replays.date_added.isnot(None)
+    )
+    if after is not None:
+        query = query.filter(tuple_(Replays.date_added, Replays.id) > tuple_(*after))
+    return query.order_by(Replays.date_added.asc(), Replays.id.asc())
 
 
 def multiple_replays(challenge_ids):
@@ -36,6 +124,32 @@ def single_replay(challenge_id):
     ).first()
 
 
+def replay_counts_by_game():
+    """Count encoded and queued replays for every game in one query."""
+    return db.session.query(
+        Replays.game,
+        func.sum(case((Replays.created == True, 1), else_=0)).label('created'),
+        func.sum(case(((Replays.created == False) & (Replays.failed == False), 1), else_=0)).label('queued')
+    ).group_by(Replays.game).all()
+
+
+def submission(submission_id):
+    return Submissions.query.filter(
+        Submissions.id == submission_id
+    ).first()
+
+
+def add_submission(url):
+    submission = Submissions(
+        url=url,
+        status=status.SUBMITTED,
+        date_added=datetime.datetime.utcnow()
+    )
+    db.session.add(submission)
+    db.session.commit()
+    return submission
+
+
 def character_detect(challenge_id):
     return Character_detect.query.filter(
         Character_detect.challenge_id == challenge_id
@@ -43,134 +157,115 @@ def character_detect(challenge_id):
 
 
 def player_search(player_id):
-    return Replays.query.filter(
+    return _listing(Replays.query.filter(
         (Replays.p1 == player_id) | (Replays.p2 == player_id)
+    ), Replays.date_added)
+
+
+def _join_matches(query, matches):
+    if matches is None:
+        return query
+    return query.join(matches, matches.c.id == Replays.id)
+
+
+def _symmetric(column1, column2, value1, value2):
+    """Match a pair of values in either order, eg P1 vs P2 or P2 vs P1, ignoring case.
+
+    Values that are None are unconstrained. Returns None if neither is constrained.
+    """
+    if value1 is None and value2 is None:
+        return None
+    column1, column2 = func.lower(column1), func.lower(column2)
+    value1 = value1.lower() if value1 is not None else None
+    value2 = value2.lower() if value2 is not None else None
+    if value1 is None or value2 is None:
+        value = value1 if value2 is None else value2
+        return or_(column1 == value, column2 == value)
+    return or_(
+        and_(column1 == value1, column2 == value2),
+        and_(column1 == value2, column2 == value1)
     )
 
 
 def basic_search(game_id, search_query, order_string):
-    return Replays.query.filter(
+    matches = _description_matches(search_query)
+    return _listing(_join_matches(Replays.query, matches).filter(
         Replays.created == True,
         Replays.failed == False,
         Replays.game.ilike(f'{game_id}'),
-        Replays.id.in_(
-            Descriptions.query.with_entities(Descriptions.id).filter(
-                Descriptions.description.ilike(f'%{search_query}%')
-            )
-        ),
         Replays.video_processed == True
-    ).order_by(_order(order_string))
-
-
-def playerlist():
-    players = []
-
-    p1_query = db.session.query(Replays.p1.label('player'))
-    p2_query = db.session.query(Replays.p2.label('player'))
-
-    union_players = p1_query.union(p2_query)
+    ), _sort_column(order_string, matches))
 
-    for p in union_players:
-        players.append(p.player)
 
-    return players
+def character_catalogue():
+    characters = {}
+    for row in db.session.query(Character_catalogue).order_by(Character_catalogue.game, Character_catalogue.character):
+        characters.setdefault(row.game, []).append(row.character)
+    return characters
 
 
-def playerlist_search(player_id):
-    players = []
-
-    p1_query = db.session.query(Replays.p1.label('player')).filter(
-        Replays.p1.ilike(f'%{player_id}%')
-    )
+def playerlist():
+    return [p.name for p in db.session.query(Players.name).order_by(Players.name)]
 
-    p2_query = db.session.query(Replays.p2.label('player')).filter(
-        Replays.p2.ilike(f'%{player_id}%')
-    )
 
-    union_players = p1_query.union(p2_query)
+def playerlist_search(player_id, limit, substring=True):
+    term = player_id.lower()
+    escaped = term.replace('!', '!!').replace('%', '!%').replace('_', '!_')
+    name = func.lower(Players.name)
 
-    for p in union_players:
-        players.append(p.player)
+    if substring:
+        match = name.like(f'%{escaped}%', escape='!')
+    else:
+        match = name.like(f'{escaped}%', escape='!')
 
-    return players
+    return [p.name for p in db.session.query(Players.name).filter(match).order_by(
+        case((name == term, 0), (name.like(f'{escaped}%', escape='!'), 1), else_=2),
+        func.strpos(name, term),
+        name
+    ).limit(limit)]
 
 
 def advanced_search(game_id, p1_rank, p2_rank, search_query, order_by, char1='Any', char2='Any', p1_name='_anyplayersearch_', p2_name='_anyplayersearch_'):
-    if p1_name.strip() == '':
-        p1_name = '%'
-    if p2_name.strip() == '':
-        p2_name = '%'
-
-    if char1 == 'Any':
-        char1 = '%'
-    if char2 == 'Any':
-        char2 = '%'
-
-    if game_id == 'Any':
-        game_id = '%'
-
-    if p1_rank == 'any':
-        p1_rank = '%'
-    if p2_rank == 'any':
-        p2_rank = '%'
-
-    query = [
+    """Search finished replays, only adding predicates for the fields that are set.
+
+    Player names, ranks and characters are matched in either order, ignoring
+    case, with a single OR'd predicate, characters with an EXISTS on
+    character_detect.
+    """
+    def value(v, *unconstrained):
+        if v is None or v.strip() == '' or v in unconstrained:
+            return None
+        return v
+
+    game_id = value(game_id, 'Any', '%')
+    p1_name, p2_name = value(p1_name, '_anyplayersearch_'), value(p2_name, '_anyplayersearch_')
+    p1_rank, p2_rank = value(p1_rank, 'any'), value(p2_rank, 'any')
+    char1, char2 = value(char1, 'Any'), value(char2, 'Any')
+
+    matches = _description_matches(search_query)
+    query = _join_matches(Replays.query, matches).filter(
         Replays.created == True,
         Replays.failed == False,
-        Replays.game.ilike(f'{game_id}'),
         Replays.video_processed == True
-    ]
-
-    query.append(
-        Replays.id.in_(
-            Descriptions.query.with_entities(Descriptions.id).filter(
-                Descriptions.description.ilike(f'%{search_query}%')
-            )
-        )
     )
 
-    query.append(
-        Replays.id.in_(
-            Replays.query.with_entities(Replays.id).filter(
-                Replays.p1_rank.ilike(f'{p1_rank}'),
-                Replays.p2_rank.ilike(f'{p2_rank}')
-            ).union(
-                Replays.query.with_entities(Replays.id).filter(
-                    Replays.p1_rank.ilike(f'{p2_rank}'),
-                    Replays.p2_rank.ilike(f'{p1_rank}')
-                )
-            )
+    if game_id is not None:
+        query = query.filter(Replays.game == game_id)
+
+    for predicate in [
+        _symmetric(Replays.p1, Replays.p2, p1_name, p2_name),
+        _symmetric(Replays.p1_rank, Replays.p2_rank, p1_rank, p2_rank)
+    ]:
+        if predicate is not None:
+            query = query.filter(predicate)
+
+    characters = _symmetric(Character_detect.p1_char, Character_detect.p2_char, char1, char2)
+    if characters is not None:
+        query = query.filter(
+            db.session.query(Character_detect.id).filter(
+                Character_detect.challenge_id == Replays.id,
+                characters
+            ).exists()
         )
-    )
-
-    if char1 != '%' or char2 != '%':
-        query.append(
-            Replays.id.in_(
-                Character_detect.query.with_entities(Character_detect.challenge_id).filter(
-                    Character_detect.p1_char.ilike(f'{char1}'),
-                    Character_detect.p2_char.ilike(f'{char2}')
-                ).union(
-                    Character_detect.query.with_entities(Character_detect.challenge_id).filter(
-                        Character_detect.p1_char.ilike(f'{char2}'),
-                        Character_detect.p2_char.ilike(f'{char1}')
-                    )
-                )
-            )
-        )
-
-    query.append(
-        Replays.id.in_(
-            Replays.query.with_entities(Replays.id).filter(
-                Replays.p1.ilike(f'{p1_name}'),
-                Replays.p2.ilike(f'{p2_name}')
-            ).union(
-                Replays.query.with_entities(Replays.id).filter(
-                    Replays.p1.ilike(f'{p2_name}'),
-                    Replays.p2.ilike(f'{p1_name}')
-                )
-            )
-        )
-    )
 
-    built_query = Replays.query.filter(*query)
-    return built_query.order_by(_order(order_by))
+    return _listing(query, _sort_column(order_by, matches))
@@ -0,0 +1,136 @@
+"""Cache of rendered responses for anonymous pages.
+
+Responses are keyed by the replays cache generation, path and query
+string, so cached pages are dropped as soon as a replay is created,
+processed or removed. The cache is in process by default, or in redis so
+it is shared between site workers. Cached responses carry an ETag and a
+public Cache-Control header, so browsers and CDNs can cache them too.
+"""
+from cachetools import TTLCache
+from fcreplay.site.cache import current_generation
+from flask import current_app, make_response, request
+from functools import wraps
+from urllib.parse import urlencode
+
+import hashlib
+import json
+import threading
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+RESPONSE_CACHE_DEFAULTS = {
+    'backend': 'memory',
+    'maxsize': 1024,
+    'redis_url': 'redis://localhost:6379/0',
+    'ttl': 300,
+    'max_age': 60
+}
+
+
+class MemoryBackend:
+    """In process LRU cache, entries expire after ttl seconds."""
+
+    def __init__(self, maxsize, ttl):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self._cache.get(key)
+
+    def set(self, key, value):
+        with self._lock:
+            self._cache[key] = value
+
+
+class RedisBackend:
+    """Cache shared between processes in redis, or a redis compatible server."""
+
+    def __init__(self, url, ttl):
+        if redis is None:
+            raise ImportError("The redis response cache backend needs the 'redis' package")
+        self._redis = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def get(self, key):
+        value = self._redis.get(f'fcreplay:response:{key}')
+        if value is None:
+            return None
+        headers, body = value.split(b'\n', 1)
+        return json.loads(headers), body
+
+    def set(self, key, value):
+        headers, body = value
+        self._redis.set(f'fcreplay:response:{key}', json.dumps(headers).encode() + b'\n' + body, ex=self.ttl)
+
+
+def make_backend(settings: dict):
+    """Create the response cache backend.
+
+    Args:
+        settings (dict): Overrides for RESPONSE_CACHE_DEFAULTS
+
+    Raises:
+        ValueError: Raised for an unknown backend
+
+    Returns:
+        Backend, or None when the backend is 'none'
+    """
+    settings = {**RESPONSE_CACHE_DEFAULTS, **settings}
+    if settings['backend'] == 'none':
+        return None
+    if settings['backend'] == 'memory':
+        return MemoryBackend(int(settings['maxsize']), settings['ttl'])
+    if settings['backend'] == 'redis':
+        return RedisBackend(settings['redis_url'], settings['ttl'])
+    raise ValueError(f"Unknown response cache backend: {settings['backend']}")
+
+
+def _backend():
+    if 'fcreplay_response_cache' not in current_app.extensions:
+        current_app.extensions['fcreplay_response_cache'] = make_backend(current_app.config.get('RESPONSE_CACHE', {}))
+    return current_app.extensions['fcreplay_response_cache']
+
+
+def _key(generation):
+    args = sorted(request.args.items(multi=True))
+    return f"{generation}:{request.path}?{urlencode(args)}"
+
+
+def cached_response(view):
+    """Cache the rendered response of a view for anonymous GET requests.
+
+    Only 200 responses that don't set a cookie are cached.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        backend = _backend()
+        settings = {**RESPONSE_CACHE_DEFAULTS, **current_app.config.get('RESPONSE_CACHE', {})}
+
+        cached = None
+        if backend is not None:
+            key = _key(current_generation())
+            cached = backend.get(key)
+
+        if cached is not None:
+            headers, body = cached
+            response = make_response(body)
+            response.content_type = headers['content_type']
+            response.set_etag(headers['etag'])
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200 or 'Set-Cookie' in response.headers or response.is_streamed:
+                return response
+            body = response.get_data()
+            response.set_etag(hashlib.sha1(body).hexdigest())
+            if backend is not None:
+                backend.set(key, ({'content_type': response.content_type, 'etag': response.get_etag()[0]}, body))
+
+        response.cache_control.public = True
+        response.cache_control.max_age = settings['max_age']
+        return response.make_conditional(request)
+
+    return wrapper
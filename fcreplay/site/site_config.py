@@ -7,6 +7,11 @@ class Config(object):
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_DATABASE_URI = config.sql_baseurl
     SECRET_KEY = config.secret_key
+    CACHE_TTL = 300
+    FULLTEXT_SEARCH = config.fulltext_search
+    SITE_URL = config.site_url
+    SITEMAP_DIR = config.sitemap_dir
+    RESPONSE_CACHE = config.response_cache
 
 
 class ProdConfig(Config):
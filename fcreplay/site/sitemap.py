@@ -0,0 +1,124 @@
+"""Sitemaps of the replay video pages.
+
+The sitemap index lists a sitemap of the site pages, and gzipped sitemaps
+of the /video pages of finished replays, URLS_PER_SITEMAP to a file, ordered
+by date_added. The video sitemaps are written to SITEMAP_DIR along with a
+manifest of what each file contains.
+
+Replays are finished with a newer date_added than every replay before them,
+so when the replays cache generation changes only the last, partly filled
+sitemap is written again, and new sitemaps are added after it. Full
+sitemaps are never written again; remove SITEMAP_DIR to rebuild them all,
+eg to drop deleted replays.
+"""
+from fcreplay.site import queries
+from fcreplay.site.cache import current_generation
+from xml.sax.saxutils import escape
+
+import datetime
+import gzip
+import itertools
+import json
+import os
+import threading
+
+URLS_PER_SITEMAP = 50000
+
+MANIFEST = 'sitemaps.json'
+
+_lock = threading.Lock()
+
+
+def sitemap_filename(number):
+    return f'sitemap-videos-{number}.xml.gz'
+
+
+def _load_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _replace(path, write):
+    """Write a file with write(f) and move it into place, so readers never see a partial file."""
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _write_sitemap(path, rows, base_url):
+    """Stream rows into a gzipped sitemap.
+
+    Returns:
+        dict: Number of urls, and the (date_added, id) and lastmod of the last row
+    """
+    sitemap = {'count': 0}
+
+    def write(tmp_path):
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+            f.write('<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+            for challenge_id, date_added in rows:
+                f.write(
+                    f'<url><loc>{escape(base_url)}/video/{escape(challenge_id)}</loc>'
+                    f'<lastmod>{date_added.date().isoformat()}</lastmod></url>\n'
+                )
+                sitemap['count'] += 1
+                sitemap['last'] = [date_added.isoformat(), challenge_id]
+            f.write('</urlset>\n')
+
+    _replace(path, write)
+    sitemap['lastmod'] = datetime.datetime.fromisoformat(sitemap['last'][0]).date().isoformat()
+    return sitemap
+
+
+def update_sitemaps(directory, base_url):
+    """Write the video sitemaps for replays finished since they were last written.
+
+    Args:
+        directory (str): Directory the sitemaps are stored in
+        base_url (str): Url of the site, without a trailing slash
+
+    Returns:
+        dict: Manifest, with a list of the count, last row and lastmod of each sitemap
+    """
+    generation = current_generation()
+
+    with _lock:
+        manifest = _load_manifest(directory)
+        if manifest is not None and manifest['generation'] == generation and manifest['base_url'] == base_url:
+            return manifest
+
+        if manifest is None or manifest['base_url'] != base_url:
+            manifest = {'base_url': base_url, 'sitemaps': []}
+        manifest['generation'] = generation
+        sitemaps = manifest['sitemaps']
+
+        # The last sitemap is written again with the new replays
+        if sitemaps and sitemaps[-1]['count'] < URLS_PER_SITEMAP:
+            sitemaps.pop()
+
+        after = None
+        if sitemaps:
+            last = sitemaps[-1]['last']
+            after = (datetime.datetime.fromisoformat(last[0]), last[1])
+
+        os.makedirs(directory, exist_ok=True)
+        rows = iter(queries.finished_replay_dates(after).yield_per(1000))
+        for first in rows:
+            chunk = itertools.chain([first], itertools.islice(rows, URLS_PER_SITEMAP - 1))
+            path = os.path.join(directory, sitemap_filename(len(sitemaps)))
+            sitemaps.append(_write_sitemap(path, chunk, base_url))
+
+        def write_manifest(tmp_path):
+            with open(tmp_path, 'w') as f:
+                json.dump(manifest, f)
+
+        _replace(os.path.join(directory, MANIFEST), write_manifest)
+        return manifest
@@ -24,5 +24,7 @@ class Status:
             "INVALID_URL": "URL is invalid",
             "REPLAY_NOT_FOUND": "Replay was not found in database",
             "BAD_WORDS_CHECKED": "Bad words checked",
-            "BANNED_USER": "One or more of the users in the replay is banned"
+            "BANNED_USER": "One or more of the users in the replay is banned",
+            "SUBMITTED": "Replay submitted, waiting to be checked",
+            "CHECKING": "Checking replay"
         }
@@ -31,3 +31,5 @@ class status:
     REPLAY_NOT_FOUND: str = "REPLAY_NOT_FOUND"
     BAD_WORDS_CHECKED: str = "BAD_WORDS_CHECKED"
     BANNED_USER: str = "BANNED_USER"
+    SUBMITTED: str = "SUBMITTED"
+    CHECKING: str = "CHECKING"
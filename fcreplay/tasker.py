@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 from fcreplay.database import Database
 from fcreplay.getreplay import Getreplay
+from fcreplay.status import status
 import docker
 import os
 import requests
@@ -22,15 +23,9 @@ class Tasker:
             print(f"Maximum number of instances ({self.max_instances}) reached")
             return False
 
+        # The instance claims the replay itself, this only checks there is work to do
         print("Looking for replay")
-        player_replay = self.db.get_oldest_player_replay()
-        if player_replay is not None:
-            print("Found player replay")
-            self.launch_fcreplay()
-            return True
-
-        replay = self.db.get_oldest_replay()
-        if replay is not None:
+        if self.db.has_queued_replay():
             print("Found replay")
             self.launch_fcreplay()
             return True
@@ -231,3 +226,36 @@ class Tasker:
         while True:
             schedule.run_pending()
             time.sleep(1)
+
+    def process_submissions(self) -> int:
+        """Check pending player submissions against the fightcade api.
+
+        Returns:
+            int: Number of submissions processed
+        """
+        processed = 0
+        g = None
+
+        while True:
+            submission = self.db.claim_next_submission()
+            if submission is None:
+                return processed
+
+            try:
+                if g is None:
+                    g = Getreplay()
+                result = g.get_replay(submission.url, player_requested=True)
+            except Exception as e:
+                print(f"Caught exception: {e}, when checking submission {submission.id}")
+                result = status.FAILED
+
+            print(f"Submission {submission.id}: {submission.url} status is: {result}")
+            self.db.set_submission_result(submission.id, result)
+            processed += 1
+
+    def schedule_process_submissions(self):
+        self.process_submissions()
+        schedule.every(2).seconds.do(self.process_submissions)
+        while True:
+            schedule.run_pending()
+            time.sleep(1)
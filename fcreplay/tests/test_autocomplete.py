@@ -0,0 +1,21 @@
+"""Test player autocomplete."""
+import os
+os.environ['FCREPLAY_CONFIG'] = './fcreplay/tests/common/config_test_site.json'
+
+from fcreplay.site.autocomplete import PlayerIndex
+
+
+class TestPlayerIndex:
+    index = PlayerIndex(['Daigo', 'daigo_fan', 'xDaigox', 'Justin', 'Dai', 'ADaigo', None])
+
+    def test_prefix(self):
+        assert self.index.search('dai') == ['Dai', 'Daigo', 'daigo_fan', 'ADaigo', 'xDaigox'], \
+            'Prefix matches should come first, then substring matches by position'
+
+    def test_short_terms_only_match_prefix(self):
+        assert self.index.search('ai') == []
+        assert self.index.search('j') == ['Justin']
+
+    def test_limit(self):
+        assert self.index.search('dai', limit=2) == ['Dai', 'Daigo']
+        assert self.index.search('') == []
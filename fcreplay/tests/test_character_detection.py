@@ -0,0 +1,90 @@
+from fcreplay.character_detection import CharacterDetection
+import datetime
+import json
+import pytest
+
+
+class TestCharacterDetection:
+    def test_get_characters(self, tmp_path):
+        event_log = tmp_path / 'overlay_events.jsonl'
+        events = [
+            {'start_time': '2022-01-01T00:00:00'},
+            {'date': '2022-01-01T00:00:01', 'overlay_type': 'p1name', 'overlay_data': 'PlayerA'},
+            {'date': '2022-01-01T00:00:02', 'overlay_type': 'p1character', 'overlay_data': 'Ryu'},
+            {'date': '2022-01-01T00:00:03', 'overlay_type': 'p2character', 'overlay_data': 'Ken'},
+            {'date': '2022-01-01T00:01:00', 'overlay_type': 'p2character', 'overlay_data': 'Chun-Li'},
+        ]
+        with open(event_log, 'w') as f:
+            for event in events:
+                f.write(json.dumps(event) + '\n')
+            # Cut off by a crash
+            f.write('{"date": "2022-01-01T00:02:00", "overlay_type": "p1char')
+
+        c = CharacterDetection(event_log_path=str(event_log))
+        assert c.get_characters() == [['Ryu', 'Ken', '0:00:03'], ['Ryu', 'Chun-Li', '0:01:00']]
+
+    def test_get_characters_none(self, tmp_path):
+        event_log = tmp_path / 'overlay_events.jsonl'
+        with open(event_log, 'w') as f:
+            f.write(json.dumps({'start_time': '2022-01-01T00:00:00'}) + '\n')
+
+        assert CharacterDetection(event_log_path=str(event_log)).get_characters() == []
+
+    def test_get_characters_formatting(self, tmp_path):
+        event_log = tmp_path / 'overlay_events.jsonl'
+        with open(event_log, 'w') as f:
+            f.write(json.dumps({'start_time': '2022-01-01T00:00:00'}) + '\n')
+            f.write('{"date" : "2022-01-01T00:00:01", "overlay_type" : "p1charact\\u0065r", "overlay_data" : "Ryu"}\n')
+            f.write('{"overlay_data": "Ken", "overlay_type": "p2character", "date": "2022-01-01T00:00:02"}\n')
+            f.write(json.dumps({'date': '2022-01-01T00:00:03', 'overlay_type': 'p1name', 'overlay_data': 'character"'}) + '\n')
+
+        assert CharacterDetection(event_log_path=str(event_log)).get_characters() == [['Ryu', 'Ken', '0:00:02']], \
+            'Events should be matched on overlay_type, not on how the json is formatted'
+
+    def test_get_characters_debounce(self, tmp_path):
+        event_log = tmp_path / 'overlay_events.jsonl'
+        events = [
+            {'start_time': '2022-01-01T00:00:00'},
+            {'date': '2022-01-01T00:00:01', 'overlay_type': 'p1character', 'overlay_data': 'Ryu'},
+            {'date': '2022-01-01T00:00:01', 'overlay_type': 'p2character', 'overlay_data': 'Ken'},
+            {'date': '2022-01-01T00:00:08', 'overlay_type': 'p2character', 'overlay_data': 'Chun-Li'},
+        ]
+        with open(event_log, 'w') as f:
+            for event in events:
+                f.write(json.dumps(event) + '\n')
+
+        assert len(CharacterDetection(event_log_path=str(event_log)).get_characters()) == 2
+        assert CharacterDetection(event_log_path=str(event_log), debounce=10).get_characters() == [
+            ['Ryu', 'Chun-Li', '0:00:08']
+        ], 'A change within the debounce window should replace the previous one'
+
+    def write_synthetic_log(self, event_log, count):
+        start = datetime.datetime(2022, 1, 1)
+        overlay_types = ['p1character', 'p2character', 'p1score', 'p2score']
+
+        with open(event_log, 'w') as f:
+            f.write(json.dumps({'start_time': start.isoformat()}) + '\n')
+            for i in range(count):
+                f.write(json.dumps({
+                    'date': (start + datetime.timedelta(seconds=i * 10)).isoformat(),
+                    'overlay_type': overlay_types[i % 4],
+                    'overlay_data': f'Character{i % 7}'
+                }) + '\n')
+
+    def test_get_characters_many(self, tmp_path):
+        event_log = tmp_path / 'overlay_events.jsonl'
+        self.write_synthetic_log(event_log, 1000)
+
+        timeline = CharacterDetection(event_log_path=str(event_log)).get_characters()
+        assert len(timeline) == 499
+        assert timeline[-1] == [f'Character{996 % 7}', f'Character{997 % 7}', str(datetime.timedelta(seconds=9970))]
+
+    @pytest.mark.slow
+    def test_get_characters_large(self, tmp_path):
+        """Build the timeline from a synthetic log of 100k events."""
+        event_log = tmp_path / 'overlay_events.jsonl'
+        self.write_synthetic_log(event_log, 100000)
+
+        timeline = CharacterDetection(event_log_path=str(event_log)).get_characters()
+        assert len(timeline) == 49999
+        assert timeline[-1] == [f'Character{99996 % 7}', f'Character{99997 % 7}', str(datetime.timedelta(seconds=999970))]
@@ -5,6 +5,7 @@ from json import JSONDecodeError
 from fcreplay.config import Config
 from fcreplay.tests.datadir import datadir
 
+import json
 import os
 
 
@@ -33,3 +34,44 @@ def test_file_not_found(request):
     with pytest.raises(SystemExit) as e:
         Config()
         assert e.type == SystemExit, "Should exit when file doesn't exist"
+
+
+def test_config_is_cached(request):
+    os.environ['FCREPLAY_CONFIG'] = datadir(request, 'config_good.json')
+    assert Config() is Config(), "Config should be loaded once and shared"
+
+
+def test_config_is_read_only(request):
+    os.environ['FCREPLAY_CONFIG'] = datadir(request, 'config_good.json')
+    config = Config()
+    with pytest.raises(AttributeError):
+        config.loglevel = 'INFO'
+
+
+def test_config_reloads_on_change(request):
+    with open(datadir(request, 'config_good.json')) as f:
+        config_data = json.load(f)
+
+    with tempfile.NamedTemporaryFile('w', suffix='.json') as temp_config:
+        json.dump(config_data, temp_config)
+        temp_config.flush()
+        os.environ['FCREPLAY_CONFIG'] = temp_config.name
+
+        config = Config()
+        assert config.loglevel == 'DEBUG'
+
+        config_data['loglevel'] = 'ERROR'
+        temp_config.seek(0)
+        json.dump(config_data, temp_config)
+        temp_config.truncate()
+        temp_config.flush()
+
+        assert Config().loglevel == 'ERROR', "Config should be reloaded when the file changes"
+        assert Config.reload() is not config, "Config.reload() should return a new instance"
+
+
+def test_overlay_event_log_default(request):
+    os.environ['FCREPLAY_CONFIG'] = datadir(request, 'config_good.json')
+    config = Config()
+    assert config.overlay_event_log == '/Fightcade/emulator/fbneo/overlay_events.jsonl', \
+        "The overlay event log should default to the fcadefbneo directory, outside avi"
@@ -1,10 +1,14 @@
 from unittest import mock
+import datetime
 import pytest
 import sys
 from unittest.mock import patch, MagicMock
+from sqlalchemy import text
+from sqlalchemy.orm import Query
 
 sys.modules['pyautogui'] = MagicMock()
-from fcreplay.database import Database
+from fcreplay.database import Database, dispose_engines
+from fcreplay.models import Base, Character_catalogue, Players, Replays
 
 
 class TestDatabase:
@@ -12,10 +16,15 @@ class TestDatabase:
     @patch('fcreplay.database.func')
     @patch('fcreplay.database.Config')
     def setUp(self, mock_config, mock_func, mock_create_engine):
+        dispose_engines()
         db = Database()
 
         mock_create_engine.assert_called(), 'Database should call create_engine'
 
+        Database()
+        assert mock_create_engine.call_count == 1, 'Database should reuse the engine for the same sql_baseurl'
+
+        dispose_engines()
         mock_create_engine.side_effect = Exception
         with pytest.raises(Exception) as e:
             db = Database()
@@ -91,3 +100,175 @@ class TestDatabase:
         db.rerecord_replay(challenge_id=MagicMock())
 
         mock_session.assert_called(), 'Database functions should complete'
+
+
+@pytest.fixture
+def sqlite_db():
+    """Return a Database using a migrated in-memory sqlite database."""
+    with patch('fcreplay.database.Config') as mock_config:
+        mock_config.return_value.sql_baseurl = 'sqlite+pysqlite:///:memory:'
+        dispose_engines()
+        db = Database()
+        db.migrate()
+        yield db
+        dispose_engines()
+
+
+def add_test_replay(db, challenge_id, player_requested=False, minutes_ago=0):
+    db.add_replay(
+        challenge_id=challenge_id,
+        p1_loc='US', p2_loc='JP',
+        p1_rank='1', p2_rank='2',
+        p1='P1', p2='P2',
+        date_replay=datetime.datetime(2022, 1, 1),
+        length=120,
+        created=False,
+        failed=False,
+        status='ADDED',
+        date_added=datetime.datetime.utcnow() - datetime.timedelta(minutes=minutes_ago),
+        player_requested=player_requested,
+        game='sfiii3nr1',
+        emulator='fbneo',
+        video_processed=False
+    )
+
+
+class TestClaimReplay:
+    def test_claim_next_replay(self, sqlite_db):
+        add_test_replay(sqlite_db, 'replay-1', minutes_ago=10)
+        add_test_replay(sqlite_db, 'replay-2', player_requested=True, minutes_ago=20)
+
+        assert sqlite_db.has_queued_replay()
+
+        replay = sqlite_db.claim_next_replay('worker-1')
+        assert replay.id == 'replay-2', 'Player replays should be claimed first'
+        assert replay.status == 'JOB_ADDED', 'Claimed replay should be marked as JOB_ADDED'
+        assert sqlite_db.get_job('replay-2').instance == 'worker-1', 'A job should be added for the worker'
+
+        replay = sqlite_db.claim_next_replay('worker-2', random_replay=True)
+        assert replay.id == 'replay-1', 'Already claimed replays should be skipped'
+
+        assert sqlite_db.claim_next_replay('worker-3') is None, 'Should return None when queue is empty'
+        assert not sqlite_db.has_queued_replay()
+
+    def test_claim_lost_race(self, sqlite_db):
+        add_test_replay(sqlite_db, 'replay-1')
+
+        # Simulate another worker claiming the replay between the select and the update
+        with patch.object(Query, 'update', return_value=0):
+            assert sqlite_db.claim_next_replay('worker-1', attempts=2) is None
+        assert sqlite_db.get_job('replay-1') is None, 'No job should be added when the claim fails'
+
+
+class TestMigrations:
+    @patch('fcreplay.database.Config')
+    def test_migrate(self, mock_config):
+        mock_config.return_value.sql_baseurl = 'sqlite+pysqlite:///:memory:'
+        dispose_engines()
+        db = Database()
+
+        applied = db.migrate()
+        assert applied == list(range(1, len(applied) + 1)), 'All migrations should be applied in order'
+        assert db.get_schema_version() == applied[-1], 'Schema version should be the last migration'
+        assert db.migrate() == [], 'Migrations should only be applied once'
+
+        indexes = [i['index'] for i in db.get_index_usage()]
+        for index in ['ix_replays_queued', 'ix_replays_finished', 'ix_character_detect_challenge_id']:
+            assert index in indexes, f"Index {index} should be created"
+
+        dispose_engines()
+
+    @patch('fcreplay.database.Config')
+    def test_migrate_players(self, mock_config):
+        mock_config.return_value.sql_baseurl = 'sqlite+pysqlite:///:memory:'
+        dispose_engines()
+        db = Database()
+        Base.metadata.create_all(db.engine)
+        db.session.add(Replays(id='replay-1', p1='Player1', p2='Player2'))
+        db.session.add(Replays(id='replay-2', p1='Player2', p2='Player3'))
+        db.session.commit()
+
+        db.migrate()
+        assert [p.name for p in db.session.query(Players).order_by(Players.name)] == ['Player1', 'Player2', 'Player3'], \
+            'Players should be filled from existing replays'
+
+        dispose_engines()
+
+
+class TestRandomReplay:
+    @pytest.mark.parametrize('strategy', ['random_key', 'order_by_random'])
+    def test_get_random_replay(self, sqlite_db, strategy):
+        assert sqlite_db.get_random_replay(strategy) is None, 'Should return None when queue is empty'
+
+        for i in range(20):
+            add_test_replay(sqlite_db, f"replay-{i}")
+
+        picked = set(sqlite_db.get_random_replay(strategy).id for _ in range(50))
+        assert len(picked) > 1, 'Should pick different replays'
+
+    def test_random_key_wraps_around(self, sqlite_db):
+        add_test_replay(sqlite_db, 'replay-1')
+        sqlite_db.session.query(Replays).update({'random_key': 0.1})
+        sqlite_db.session.commit()
+
+        with patch('fcreplay.database.random.random', return_value=0.9):
+            assert sqlite_db.get_random_replay().id == 'replay-1', 'Should wrap around when no key is larger'
+
+    def test_unknown_strategy(self, sqlite_db):
+        with pytest.raises(ValueError):
+            sqlite_db.get_random_replay('unknown')
+
+
+class TestCacheGeneration:
+    def test_bump_cache_generation(self, sqlite_db):
+        add_test_replay(sqlite_db, 'replay-1')
+        assert sqlite_db.get_cache_generation() == 0, 'Adding replays to the queue should not bump the generation'
+
+        sqlite_db.update_created_replay('replay-1')
+        sqlite_db.set_replay_processed('replay-1')
+        assert sqlite_db.get_cache_generation() == 2, 'Creating and processing replays should bump the generation'
+
+        sqlite_db.delete_replay('replay-1')
+        assert sqlite_db.get_cache_generation() == 3
+        assert sqlite_db.get_cache_generation('other') == 0
+
+
+class TestPlayers:
+    def test_add_players(self, sqlite_db):
+        add_test_replay(sqlite_db, 'replay-1')
+        assert [p.name for p in sqlite_db.session.query(Players)] == ['P1', 'P2']
+        assert sqlite_db.get_cache_generation('players') == 1
+
+        add_test_replay(sqlite_db, 'replay-2')
+        assert sqlite_db.get_cache_generation('players') == 1, 'Generation should only change for new players'
+
+        sqlite_db.add_replays([{'id': 'replay-3', 'p1': 'P2', 'p2': 'P3'}, {'id': 'replay-4', 'p1': 'P3', 'p2': None}])
+        assert [p.name for p in sqlite_db.session.query(Players).order_by(Players.name)] == ['P1', 'P2', 'P3']
+        assert sqlite_db.get_cache_generation('players') == 2
+
+
+class TestDescriptionSearch:
+    def test_index_description(self, sqlite_db):
+        add_test_replay(sqlite_db, 'replay-1')
+        sqlite_db.add_description('replay-1', 'Daigo vs Justin')
+
+        def search(term):
+            return [r[0] for r in sqlite_db.session.execute(
+                text('select id from descriptions_fts where descriptions_fts match :term'), {'term': term}
+            )]
+
+        assert search('daigo') == ['replay-1'], 'Descriptions should be added to the full text index'
+
+        sqlite_db.rerecord_replay('replay-1')
+        assert search('daigo') == [], 'Descriptions should be removed from the full text index'
+
+
+class TestCharacterCatalogue:
+    def test_add_characters(self, sqlite_db):
+        sqlite_db.add_detected_characters('replay-1', 'Ryu', 'Ken', '0', 'sfiii3nr1')
+        sqlite_db.add_detected_characters('replay-1', 'Ken', 'Ryu', '10', 'sfiii3nr1')
+        sqlite_db.add_detected_characters('replay-2', 'Ryu', 'Kyo', '0', 'kof98')
+
+        rows = sqlite_db.session.query(Character_catalogue).order_by(Character_catalogue.game, Character_catalogue.character)
+        assert [(r.game, r.character) for r in rows] == [('kof98', 'Kyo'), ('kof98', 'Ryu'), ('sfiii3nr1', 'Ken'), ('sfiii3nr1', 'Ryu')]
+        assert sqlite_db.get_cache_generation('characters') == 2, 'Generation should only change for new characters'
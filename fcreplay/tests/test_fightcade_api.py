@@ -0,0 +1,145 @@
+"""Tests for the fightcade api client, using a local stub server."""
+from fcreplay.fightcade_api import FightcadeApi, HostRateLimiter, MemoryCache, SqliteCache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import pytest
+import threading
+import time
+
+
+class StubApiHandler(BaseHTTPRequestHandler):
+    """Returns one result per page, failing the first request for offset 15.
+
+    Quarkid lookups return the requested replay, unless its id starts with 'new'.
+    """
+
+    requests = []
+    failed_offsets = set()
+
+    def do_POST(self):
+        query = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        StubApiHandler.requests.append(query)
+
+        if query.get('offset') == 15 and 15 not in StubApiHandler.failed_offsets:
+            StubApiHandler.failed_offsets.add(15)
+            self.send_response(500)
+            self.end_headers()
+            return
+
+        if 'quarkid' in query:
+            # Replays fightcade hasn't indexed yet aren't found
+            results = [] if query['quarkid'].startswith('new') else [{'quarkid': query['quarkid']}]
+        else:
+            results = [{'quarkid': f"offset-{query.get('offset')}"}]
+
+        body = json.dumps({
+            'results': {'results': results, 'count': len(results)},
+            'res': 'OK'
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_api():
+    StubApiHandler.requests = []
+    StubApiHandler.failed_offsets = set()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubApiHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/api/"
+    server.shutdown()
+
+
+class TestFightcadeApi:
+    def test_get_data(self, stub_api):
+        api = FightcadeApi({'url': stub_api, 'requests_per_second': 0})
+        r = api.get_data({'req': 'searchquarks', 'offset': 0})
+        assert r['results']['results'][0]['quarkid'] == 'offset-0'
+
+    def test_get_pages(self, stub_api):
+        api = FightcadeApi({'url': stub_api, 'requests_per_second': 0, 'retry_wait_ms': 1, 'concurrency': 4})
+        pages = api.get_pages({'req': 'searchquarks'}, 5)
+
+        assert [p['results']['results'][0]['quarkid'] for p in pages] == [f"offset-{i * 15}" for i in range(5)], \
+            'Pages should be returned in order'
+        assert len(StubApiHandler.requests) == 6, 'Only the failing page should be retried'
+
+    def test_get_data_gives_up(self, stub_api):
+        api = FightcadeApi({'url': stub_api, 'requests_per_second': 0, 'retry_wait_ms': 1, 'retries': 1})
+        with pytest.raises(IOError):
+            api.get_data({'req': 'searchquarks', 'offset': 15})
+
+    def test_get_data_cached(self, stub_api):
+        api = FightcadeApi({'url': stub_api, 'requests_per_second': 0})
+        api.get_data({'req': 'searchquarks', 'quarkid': '1-1'})
+        r = api.get_data({'quarkid': '1-1', 'req': 'searchquarks'})
+
+        assert r['res'] == 'OK'
+        assert len(StubApiHandler.requests) == 1, 'Equal queries should be answered from the cache'
+        assert api.cache.stats() == {'hits': 1, 'misses': 1}
+
+    def test_get_data_cache_shared(self, stub_api):
+        settings = {'url': stub_api, 'requests_per_second': 0}
+        FightcadeApi(settings).get_data({'req': 'searchquarks', 'quarkid': '2-2'})
+        api = FightcadeApi(settings)
+        api.get_data({'req': 'searchquarks', 'quarkid': '2-2'})
+
+        assert len(StubApiHandler.requests) == 1, 'Clients with the same settings should share the cache'
+        assert api.cache.stats() == {'hits': 1, 'misses': 1}
+
+        FightcadeApi({**settings, 'cache': {'maxsize': 10}}).get_data({'req': 'searchquarks', 'quarkid': '2-2'})
+        assert len(StubApiHandler.requests) == 2, 'Clients with other cache settings should have their own cache'
+
+    def test_get_data_not_found_not_cached(self, stub_api):
+        api = FightcadeApi({'url': stub_api, 'requests_per_second': 0})
+        for _ in range(2):
+            r = api.get_data({'req': 'searchquarks', 'quarkid': 'new-1'})
+            assert r['results']['results'] == []
+        assert len(StubApiHandler.requests) == 2, "Lookups that didn't find the replay should not be cached"
+
+    def test_get_data_not_cached(self, stub_api):
+        api = FightcadeApi({'url': stub_api, 'requests_per_second': 0, 'cache': {'ttl': {'searchquarks': 0}}})
+        api.get_data({'req': 'searchquarks', 'offset': 0})
+        api.get_data({'req': 'searchquarks', 'offset': 0})
+        assert len(StubApiHandler.requests) == 2, 'Request types with no ttl should not be cached'
+
+        api = FightcadeApi({'url': stub_api, 'requests_per_second': 0, 'cache': {'backend': 'none'}})
+        assert api.cache is None
+
+
+@pytest.mark.parametrize('backend', ['memory', 'sqlite'])
+def test_response_cache_expires(backend, tmp_path):
+    cache = MemoryCache(maxsize=2) if backend == 'memory' else SqliteCache(str(tmp_path / 'cache.sqlite'))
+
+    cache.set('short', {'res': 'OK'}, ttl=0.05)
+    cache.set('long', {'res': 'OK'}, ttl=60)
+    time.sleep(0.1)
+
+    assert cache.get('short') is None
+    assert cache.get('long') == {'res': 'OK'}
+    assert cache.stats() == {'hits': 1, 'misses': 1}
+
+
+def test_sqlite_cache_shared(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    SqliteCache(path).set('key', {'res': 'OK'}, ttl=60)
+    assert SqliteCache(path).get('key') == {'res': 'OK'}, 'Cached responses should survive a restart'
+
+
+def test_host_rate_limiter():
+    limiter = HostRateLimiter(requests_per_second=20)
+    start = time.monotonic()
+    for _ in range(5):
+        limiter.wait('http://example.com/api/')
+    limiter.wait('http://other.example.com/api/')
+    elapsed = time.monotonic() - start
+
+    assert elapsed >= 4 / 20, 'Requests to the same host should be spaced out'
+    assert elapsed < 1, 'Requests should not be delayed more than needed'
@@ -7,6 +7,7 @@ Returns:
 from fcreplay.getreplay import Getreplay
 from fcreplay.database import Database
 from fcreplay.status import status
+import datetime
 import sys
 from unittest.mock import patch, MagicMock
 
@@ -123,9 +124,114 @@ class TestGetreplay:
             player_replay=True
         ) == status.BANNED_USER, "Should return status.BANNED_USER when when both players are banned"
 
+    @patch('fcreplay.getreplay.Config')
+    def test_add_replays(self, mock_config):
+        """test_add_replays method."""
+        with patch.object(Getreplay, '__init__', return_value=None):
+            g = Getreplay()
+            g.db = FixtureDatabase()
+            g.config = mock_config
+            g.supported_games = {'sfiii3nr1': {}}
+
+        g.config.min_replay_length = 60
+        g.config.max_replay_length = 1000
+        g.config.banned_users = ['BannedPlayer']
+
+        def result(quarkid, gameid='sfiii3nr1', duration=120, player='Player1'):
+            return {
+                "quarkid": quarkid,
+                "date": 1659855001234,
+                "duration": duration,
+                "emulator": "fbneo",
+                "gameid": gameid,
+                "players": [
+                    {"name": player, "country": "US", "rank": 2},
+                    {"name": "Player2", "country": "JP", "rank": None}
+                ]
+            }
+
+        g.add_replay(replay=result('existing'), emulator='fbneo', game='sfiii3nr1', player_replay=False)
+
+        with patch.object(g.db, 'get_single_replay') as mock_get_single_replay:
+            statuses = g.add_replays([
+                result('new-1'),
+                result('new-2'),
+                result('new-2'),
+                result('existing'),
+                result('unsupported', gameid='unsupported'),
+                result('short', duration=10),
+                result('banned', player='BannedPlayer'),
+            ])
+            assert not mock_get_single_replay.called, 'Bulk add should not look up replays one at a time'
+
+        assert statuses == {
+            'new-1': status.ADDED,
+            'new-2': status.ADDED,
+            'existing': status.ALREADY_EXISTS,
+            'unsupported': status.UNSUPPORTED_GAME,
+            'short': status.TOO_SHORT,
+            'banned': status.BANNED_USER,
+        }
+
+        replay = g.db.get_single_replay('new-1')
+        assert replay.p2_rank == '0', 'Missing ranks should be stored as 0'
+        assert replay.random_key is not None, 'Random key should be set'
+        assert g.db.get_single_replay('short') is None
+
     def get_game_replays(self):
         pass
 
+    @patch('fcreplay.getreplay.Config')
+    def test_get_top_weekly_incremental(self, mock_config):
+        """Weekly crawls should resume from the stored cursor and stop at known replays."""
+        with patch.object(Getreplay, '__init__', return_value=None):
+            g = Getreplay()
+            g.db = FixtureDatabase()
+            g.config = mock_config
+            g.supported_games = {'sfiii3nr1': {}}
+            g.api = MagicMock()
+            g.api.concurrency = 2
+            g.api.settings = {'page_size': 2}
+
+        g.config.min_replay_length = 60
+        g.config.max_replay_length = 1000
+        g.config.banned_users = []
+        g.config.get_weekly_replay_pages = 10
+
+        now_ms = int(datetime.datetime.now().timestamp() * 1000)
+
+        def page(*quarkids):
+            return {'results': {'results': [{
+                "quarkid": q,
+                "date": now_ms + n,
+                "duration": 120,
+                "emulator": "fbneo",
+                "gameid": "sfiii3nr1",
+                "players": [{"name": "P1", "country": "US", "rank": 1}, {"name": "P2", "country": "US", "rank": 1}]
+            } for q, n in quarkids]}}
+
+        g.api.get_pages.side_effect = [
+            [page(('a', 1), ('b', 2)), page(('c', 3), ('d', 4))],
+            [page(('e', 5))],
+        ]
+        g.get_top_weekly()
+
+        assert g.api.get_pages.call_count == 2, 'Should stop paging at a short page'
+        assert g.db.get_crawl_cursor('top_weekly').last_date == now_ms + 5, 'Cursor should be the newest replay'
+
+        g.api.get_pages.reset_mock()
+        g.api.get_pages.side_effect = [
+            [page(('f', 6), ('e', 5)), page(('d', 4), ('c', 3))],
+            [page(('b', 2), ('a', 1))],
+        ]
+        g.get_top_weekly()
+
+        query = g.api.get_pages.call_args_list[0][0][0]
+        assert query['since'] == now_ms + 5, 'Should only ask for replays since the cursor'
+        assert g.api.get_pages.call_count == 1, 'Should stop paging when a page only has known replays'
+        assert g.db.get_single_replay('f') is not None
+        assert g.db.get_crawl_cursor('top_weekly').last_date == now_ms + 6
+
     def get_top_weekly(self):
         pass
 
@@ -41,6 +41,29 @@ class TestInstance:
         for f in create_list:
             assert len(os.listdir(f)) == 0, "Directory should be empty"
 
+    @patch('fcreplay.instance.Config')
+    def test_clean_keeps_overlay_event_log(self, mock_config):
+        from fcreplay.character_detection import CharacterDetection
+        instance = self.setUp()
+
+        fcadefbneo_temp_dir = tempfile.TemporaryDirectory()
+        instance.config.fcadefbneo_path = fcadefbneo_temp_dir.name
+        instance.config.fcreplay_dir = fcadefbneo_temp_dir.name
+        pathlib.Path(instance.config.fcadefbneo_path + '/avi').mkdir(parents=True, exist_ok=True)
+
+        event_log = f"{instance.config.fcadefbneo_path}/overlay_events.jsonl"
+        with open(event_log, 'w') as f:
+            f.write('{"start_time": "2022-01-01T00:00:00"}\n')
+            f.write('{"date": "2022-01-01T00:00:02", "overlay_type": "p1character", "overlay_data": "Ryu"}\n')
+            f.write('{"date": "2022-01-01T00:00:03", "overlay_type": "p2character", "overlay_data": "Ken"}\n')
+
+        # The instance is restarted after a crash
+        instance.create_dirs()
+        instance.clean()
+
+        assert CharacterDetection(event_log_path=event_log).get_characters() == [['Ryu', 'Ken', '0:00:03']], \
+            "Events written before a restart should be kept"
+
     @patch('fcreplay.instance.Config')
     def test_create_dir(self, mock_config):
         instance = self.setUp()
@@ -66,7 +89,7 @@ class TestInstance:
 
             instance.main()
 
-            assert mock_replay.add_job.not_called, "Shouldn't process a replay when none is returned"
+            assert mock_replay.record.not_called, "Shouldn't process a replay when none is returned"
             assert e.type == SystemExit, "Should exit no errors"
 
         with pytest.raises(SystemExit) as e:
@@ -146,5 +169,44 @@ class TestInstance:
 
             instance.main()
 
-            assert mock_replay.add_job.called
+            assert mock_replay.record.called
             assert e.type == SystemExit, "Should exit with no errors"
+
+    @patch('fcreplay.instance.Config')
+    def test_pipeline(self, mock_config):
+        instance = Instance()
+        instance.config.upload_to_ia = True
+        instance.config.upload_to_yt = True
+        instance.config.remove_old_avi_files = False
+        replay = MagicMock()
+
+        pipeline = instance.pipeline(replay)
+        assert pipeline.teardown == replay.db.Session.remove, "Each stage should remove its thread's session"
+        assert 'remove_old_avi_files' not in pipeline.stages
+        assert pipeline.stages['upload_to_ia'][1] == ['encode', 'set_description']
+
+        replay.check_bad_words.return_value = False
+        pipeline.run()
+        assert replay.upload_to_ia.called
+        assert not replay.upload_to_yt.called, "Shouldn't upload to YT when bad words are found"
+
+    @patch('fcreplay.instance.Config')
+    @patch('fcreplay.instance.Replay')
+    def test_main_session_closed(self, mock_replay, mock_config):
+        temp_dir = tempfile.TemporaryDirectory()
+        instance = Instance()
+        instance.config.fcreplay_dir = temp_dir.name
+        instance.config.fcadefbneo_path = temp_dir.name
+        session = mock_replay.return_value.db.session
+
+        def run():
+            assert session.expunge.called and session.close.called, \
+                "The main thread's session should be closed before the stages run"
+            return {}
+
+        with patch.object(Instance, 'pipeline') as pipeline, pytest.raises(SystemExit):
+            pipeline.return_value.run.side_effect = run
+            instance.main()
+
+        assert pipeline.return_value.run.called
+        assert not mock_replay.return_value.handle_fail.called
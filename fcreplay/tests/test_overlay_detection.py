@@ -0,0 +1,80 @@
+from collections import namedtuple
+from unittest.mock import patch, MagicMock
+from fcreplay import overlay_detection
+from fcreplay.overlay_detection import OverlayDetection
+import json
+import os
+import time
+
+
+class TestOverlayDetection:
+    @patch('fcreplay.overlay_detection.Config')
+    def overlay(self, tmp_path, mock_config):
+        mock_config.return_value.fcadefbneo_path = str(tmp_path)
+        mock_config.return_value.overlay_event_log = str(tmp_path / 'overlay_events.jsonl')
+        os.mkdir(tmp_path / 'fightcade')
+        return OverlayDetection(poll_interval=0.01)
+
+    def write(self, tmp_path, name, data):
+        with open(tmp_path / 'fightcade' / name, 'w') as f:
+            f.write(data)
+
+    def overlay_dates(self, overlay):
+        with open(overlay.event_log_path) as f:
+            events = [json.loads(line) for line in f]
+        return events[0]['start_time'], [e['date'] for e in events[1:]]
+
+    def overlay_events(self, overlay):
+        with open(overlay.event_log_path) as f:
+            events = [json.loads(line) for line in f]
+        assert 'start_time' in events[0]
+        return [(e['overlay_type'], e['overlay_data']) for e in events[1:]]
+
+    def test_poll(self, tmp_path):
+        with patch.object(overlay_detection, 'INotify', None):
+            overlay = self.overlay(tmp_path)
+            self.write(tmp_path, 'p1name.txt', 'PlayerA')
+            self.write(tmp_path, 'p1country.txt', 'NZ')
+
+            overlay.start()
+            time.sleep(0.1)
+            self.write(tmp_path, 'p1name.txt', 'PlayerB')
+            os.utime(tmp_path / 'fightcade' / 'p1name.txt', (time.time() + 1, time.time() + 1))
+            time.sleep(0.1)
+            overlay.stop()
+
+        assert self.overlay_events(overlay) == [('p1name', 'PlayerA'), ('p1name', 'PlayerB')]
+        assert overlay.counters['reads'] == 2, 'Unchanged files should not be read again'
+        assert overlay.counters['scans'] > 2
+
+    def test_leftover_files(self, tmp_path):
+        with patch.object(overlay_detection, 'INotify', None):
+            overlay = self.overlay(tmp_path)
+            self.write(tmp_path, 'p1name.txt', 'PlayerA')
+            os.utime(tmp_path / 'fightcade' / 'p1name.txt', (time.time() - 3600, time.time() - 3600))
+
+            overlay.start()
+            time.sleep(0.05)
+            overlay.stop()
+
+        start_time, dates = self.overlay_dates(overlay)
+        assert dates == [start_time], 'Files written before the recording should be dated at the start'
+
+    def test_inotify(self, tmp_path):
+        Event = namedtuple('Event', ['wd', 'mask', 'cookie', 'name'])
+        inotify = MagicMock()
+        inotify.__enter__.return_value = inotify
+        inotify.read.side_effect = lambda timeout: [Event(1, 0, 0, 'p2name.txt')] if inotify.read.call_count == 1 else []
+
+        with patch.object(overlay_detection, 'INotify', return_value=inotify), \
+                patch.object(overlay_detection, 'flags', create=True):
+            overlay = self.overlay(tmp_path)
+            self.write(tmp_path, 'p2name.txt', 'PlayerC')
+
+            overlay.start()
+            time.sleep(0.1)
+            overlay.stop()
+
+        assert self.overlay_events(overlay) == [('p2name', 'PlayerC')], 'Unchanged data should not add an event'
+        assert overlay.counters['notifications'] == 1
+        assert overlay.counters['scans'] == 1, 'The directory should only be scanned when the watch is added'
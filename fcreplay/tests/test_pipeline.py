@@ -0,0 +1,68 @@
+from fcreplay.pipeline import Pipeline
+import pytest
+import threading
+
+
+class TestPipeline:
+    def test_order(self):
+        order = []
+        pipeline = Pipeline()
+        pipeline.add('upload', lambda: order.append('upload'), needs=['encode', 'description'])
+        pipeline.add('description', lambda: order.append('description'), needs=['record'])
+        pipeline.add('encode', lambda: order.append('encode'), needs=['record'])
+        pipeline.add('record', lambda: order.append('record'))
+
+        timings = pipeline.run()
+
+        assert order[0] == 'record'
+        assert order[-1] == 'upload'
+        assert sorted(timings) == ['description', 'encode', 'record', 'upload'], 'Every stage should be timed'
+
+    def test_concurrent(self):
+        barrier = threading.Barrier(2, timeout=5)
+        pipeline = Pipeline()
+        pipeline.add('upload_to_ia', barrier.wait)
+        pipeline.add('upload_to_yt', barrier.wait)
+
+        # Deadlocks, and the barrier times out, unless both stages run at once
+        pipeline.run()
+
+    def test_teardown(self):
+        threads = []
+        torn_down = []
+        pipeline = Pipeline(teardown=lambda: torn_down.append(threading.get_ident()))
+        pipeline.add('encode', lambda: threads.append(threading.get_ident()))
+        pipeline.add('thumbnail', lambda: threads.append(threading.get_ident()), needs=['encode'])
+
+        pipeline.run()
+        assert torn_down == threads, 'Teardown should run on the thread of each stage'
+
+    def test_failure(self):
+        ran = []
+
+        def fail():
+            raise IOError('Encoding failed')
+
+        pipeline = Pipeline()
+        pipeline.add('encode', fail)
+        pipeline.add('thumbnail', lambda: ran.append('thumbnail'), needs=['encode'])
+
+        with pytest.raises(IOError):
+            pipeline.run()
+        assert ran == [], 'Stages should not run after a stage they need failed'
+        assert 'encode' in pipeline.timings
+
+    def test_invalid(self):
+        pipeline = Pipeline()
+        pipeline.add('encode', lambda: None, needs=['record'])
+        with pytest.raises(ValueError):
+            pipeline.run()
+
+        pipeline = Pipeline()
+        pipeline.add('a', lambda: None, needs=['b'])
+        pipeline.add('b', lambda: None, needs=['a'])
+        with pytest.raises(ValueError):
+            pipeline.run()
+
+        with pytest.raises(ValueError):
+            pipeline.add('a', lambda: None)
@@ -0,0 +1,29 @@
+import sys
+from unittest.mock import MagicMock
+
+sys.modules['pyautogui'] = MagicMock()
+from fcreplay.record import FramecountLog
+
+
+class TestFramecountLog:
+    def test_read(self, tmp_path):
+        path = tmp_path / 'framecount.log'
+        framecount_log = FramecountLog(str(path))
+
+        assert framecount_log.read() is False, 'Should return false when the log is missing'
+
+        with open(path, 'wb') as f:
+            f.write(b'10\r\n20\n3')
+            f.flush()
+
+            assert framecount_log.read() is True
+            assert framecount_log.frames == 20, 'A partial line should not be read'
+
+            assert framecount_log.read() is False, 'Should return false without new records'
+
+            f.write(b'0\n')
+            f.flush()
+            assert framecount_log.read() is True
+            assert framecount_log.frames == 30, 'The rest of a partial line should be read'
+
+        framecount_log.close()
@@ -6,6 +6,7 @@ from unittest.mock import patch, MagicMock
 
 sys.modules['pyautogui'] = MagicMock()
 from fcreplay.replay import Replay
+from fcreplay.status import status
 
 # Note for future self: decorator @handle_fail does a kill_all if
 # config['kill_all'] is set
@@ -174,3 +175,15 @@ class TestReplay:
 
         sorted_list = r.sort_files(single_list)
         assert sorted_list == good_list, 'List with single file should be sorted'
+
+    @patch('fcreplay.replay.Database')
+    @patch('fcreplay.replay.Config')
+    def test_update_status_order(self, mock_config, mock_database):
+        """Statuses set by stages that finish out of order shouldn't go backwards."""
+        r = Replay()
+        for s in [status.RECORDED, status.DESCRIPTION_CREATED, status.THUMBNAIL_CREATED, status.UPLOADED_TO_IA]:
+            r.update_status(s)
+        r.update_status(status.FAILED)
+
+        statuses = [c.kwargs['status'] for c in r.db.update_status.call_args_list]
+        assert statuses == [status.RECORDED, status.DESCRIPTION_CREATED, status.UPLOADED_TO_IA, status.FAILED]
@@ -6,7 +6,7 @@ from flask import session
 from flask.testing import FlaskClient
 from fcreplay.site.create_app import create_app, db
 from fcreplay.site.site_config import TestConfig
-from unittest.mock import patch, MagicMock
+import datetime
 import xml.etree.ElementTree as ET
 import pytest
 
@@ -50,134 +50,85 @@ class TestSite:
         assert rv.status_code == 200
         assert rv.is_json
 
-    # Need to mock getreplay.get_data
-    @patch('fcreplay.getreplay.requests')
-    @patch('fcreplay.getreplay.Config')
-    @patch('fcreplay.database.Config')
-    def test_submit(self, mock_config_db: MagicMock, mock_config_gr, mock_requests, app: FlaskClient):
-        """Test the submit page."""
-        # Need to test submissions for good data, bad data and banned players
-        mock_sqlite_baseurl = MagicMock()
-        mock_sqlite_baseurl.sql_baseurl = 'sqlite+pysqlite:///:memory:'
-
-        mock_config_db.return_value = mock_sqlite_baseurl
-
-        mock_config_gr_data = MagicMock()
-        mock_config_gr_data.min_replay_length = 1
-        mock_config_gr_data.max_replay_length = 1000
-
-        mock_config_gr.return_value = mock_config_gr_data
-
-        mock_requests.status_code = 200
-
-        mock_post = MagicMock()
-        mock_post.json.return_value = {
-            "results": {
-                "results": [
-                    {
-                        "quarkid": "1234567891234-1234",
-                        "channelname": "Full channel name",
-                        "date": 1659855001234,
-                        "duration": 123.066,
-                        "emulator": "fbneo",
-                        "gameid": "rom_name",
-                        "num_matches": 2,
-                        "players": [
-                            {
-                                "name": "Player1 Name",
-                                "country": "US",
-                                "rank": 2,
-                                "score": 0
-                            },
-                            {
-                                "name": "Player2 Name",
-                                "country": "US",
-                                "rank": 3,
-                                "score": 2
-                            }
-                        ],
-                        "ranked": 3,
-                        "replay_file": "12341234121234-1234-replay.fs"
-                    }
-                ],
-                "count": 15
-            },
-            "res": "OK"
-        }
-        mock_requests.post.return_value = mock_post
+    def test_api_playerlist(self, app: FlaskClient):
+        """Test the player list is sorted and supports ETags."""
+        from fcreplay.site.cache import cache
+        from fcreplay.site.models import Players
+
+        cache.clear()
+        db.session.add_all([Players(name='PlayerB'), Players(name='PlayerA')])
+        db.session.commit()
 
+        rv = app.get('/api/playerlist')
+        assert rv.status_code == 200
+        assert rv.json == ['PlayerA', 'PlayerB']
+        assert rv.headers['ETag']
+
+        rv = app.get('/api/playerlist', headers={'If-None-Match': rv.headers['ETag']})
+        assert rv.status_code == 304, 'Should return 304 when the player list has not changed'
+
+        rv = app.post('/api/playerlist/search', json={'player_id': 'erb'})
+        assert rv.json == ['PlayerB']
+
+        rv = app.get('/api/playerlist/search?q=play')
+        assert rv.json == ['PlayerA', 'PlayerB']
+        assert rv.headers['Cache-Control'] == 'public, max-age=60', 'Autocomplete results should be cacheable'
+        cache.clear()
+
+    def test_api_characters(self, app: FlaskClient):
+        """Test the character catalogue api."""
+        from fcreplay.site.cache import cache
+        from fcreplay.site.models import Character_catalogue
+
+        cache.clear()
+        db.session.add_all([
+            Character_catalogue(game='sfiii3nr1', character='Ryu'),
+            Character_catalogue(game='sfiii3nr1', character='Ken'),
+            Character_catalogue(game='kof98', character='Kyo'),
+        ])
+        db.session.commit()
+
+        rv = app.get('/api/characters/sfiii3nr1')
+        assert rv.json == ['Ken', 'Ryu']
+        rv = app.get('/api/characters/sfiii3nr1', headers={'If-None-Match': rv.headers['ETag']})
+        assert rv.status_code == 304
+
+        assert app.get('/api/characters').json == {'kof98': ['Kyo'], 'sfiii3nr1': ['Ken', 'Ryu']}
+        assert app.get('/api/characters/unknown').json == []
+        assert app.get('/advancedSearch').status_code == 200
+        cache.clear()
+
+    def test_submit(self, app: FlaskClient):
+        """Test the submit page queues submissions."""
         with app:
             rv = app.post('/submitResult', data={
                 "challenge_url": "https://replay.fightcade.com/fbneo/sf2/1234567891234-1234"
             })
 
-            assert session['replay_result'] == 'ADDED', 'Replay result should be ADDED'
+            assert session['replay_result'] == 'SUBMITTED', 'Replay result should be SUBMITTED'
             assert rv.status_code == 302, "Should return 302, redirect"
+            submission_id = session['submission_id']
 
-        with app:
-            rv = app.post('/submitResult', data={
-                "challenge_url": "not a url"
-            })
-
-            assert session['replay_result'] == 'INVALID_URL', 'Replay result should be INVALID_URL'
-            assert rv.status_code == 302, "Should return 302, redirect"
+        rv = app.get(f'/api/submission/{submission_id}')
+        assert rv.status_code == 200
+        assert rv.json['status'] == 'SUBMITTED', 'Submission should be waiting for the worker'
+        assert rv.json['finished'] is False
 
-        mock_post.json.return_value = {
-            "results": {
-                "results": [
-                    {
-                        "quarkid": "1234567891234-1234",
-                        "channelname": "Full channel name",
-                        "date": 1659855001234,
-                        "duration": 123.066,
-                        "emulator": "fbneo",
-                        "gameid": "rom_name",
-                        "num_matches": 2,
-                        "players": [
-                            {
-                                "name": "BannedUser1",
-                                "country": "US",
-                                "rank": 2,
-                                "score": 0
-                            },
-                            {
-                                "name": "BannedUser2",
-                                "country": "US",
-                                "rank": 3,
-                                "score": 2
-                            }
-                        ],
-                        "ranked": 3,
-                        "replay_file": "12341234121234-1234-replay.fs"
-                    }
-                ],
-                "count": 15
-            },
-            "res": "OK"
-        }
-        mock_requests.post.return_value = mock_post
+        rv = app.get('/submitResult')
+        assert rv.status_code == 200
+        assert f'/api/submission/{submission_id}'.encode() in rv.data, 'Result page should poll the submission'
 
         with app:
-            mock_config_gr_data.banned_users = ['BannedUser1']
-            mock_config_gr.return_value = mock_config_gr_data
-
             rv = app.post('/submitResult', data={
-                "challenge_url": "https://replay.fightcade.com/fbneo/sf2/1234567891234-1234"
+                "challenge_url": "not a url"
             })
 
-            assert session['replay_result'] == 'BANNED_USER', 'Replay result should be BANNED_USER'
+            assert session['replay_result'] == 'INVALID_URL', 'Replay result should be INVALID_URL'
+            assert 'submission_id' not in session, 'Invalid urls should not be queued'
             assert rv.status_code == 302, "Should return 302, redirect"
 
-        with app:
-            mock_config_gr_data.banned_users = ['BannedUser2']
-            mock_config_gr.return_value = mock_config_gr_data
-
-            rv = app.post('/submitResult', data={
-                "challenge_url": "https://replay.fightcade.com/fbneo/sf2/1234567891234-1234"
-            })
-
-            assert session['replay_result'] == 'BANNED_USER', 'Replay result should be BANNED_USER'
-            assert rv.status_code == 302, "Should return 302, redirect"
+        rv = app.get('/api/submission/999')
+        assert rv.status_code == 404, 'Unknown submissions should return 404'
 
     def test_submitResult(self, app: FlaskClient):
         """Test the submit page."""
@@ -194,14 +145,263 @@ class TestSite:
 
         assert rv.status_code == 200
 
+    def test_about_counts(self, app: FlaskClient):
+        """Test the about page counts are cached until the generation changes."""
+        from fcreplay.site.blueprint import _about_counts
+        from fcreplay.site.cache import cache
+        from fcreplay.site.models import Cache_generation, Replays
+
+        cache.clear()
+        db.session.add_all([
+            Replays(id='1', game='sfiii3nr1', created=True, failed=False),
+            Replays(id='2', game='sfiii3nr1', created=True, failed=False),
+            Replays(id='3', game='kof98', created=True, failed=False),
+            Replays(id='4', game='kof98', created=False, failed=False),
+            Replays(id='5', game='kof98', created=False, failed=True),
+        ])
+        db.session.commit()
+
+        with app.application.app_context():
+            assert _about_counts() == ({'sfiii3nr1': 2, 'kof98': 1}, 3, 1)
+            assert cache.get('about_counts', _about_counts)[1] == 3
+
+            db.session.add(Replays(id='6', game='kof98', created=True, failed=False))
+            db.session.commit()
+            assert cache.get('about_counts', _about_counts)[1] == 3, 'Counts should be cached'
+
+            db.session.add(Cache_generation(name='replays', generation=1))
+            db.session.commit()
+            assert cache.get('about_counts', _about_counts)[1] == 4, 'Counts should refresh when the generation changes'
+        cache.clear()
+
     def test_advancedSearch(self, app: FlaskClient):
         pass
 
+    def _add_search_replays(self):
+        from fcreplay.site.models import Character_detect, Replays
+
+        for challenge_id, p1, p2, p1_rank, p2_rank, chars in [
+            ('1', 'Daigo', 'Justin', '3', '1', ('Ken', 'Chun-Li')),
+            ('2', 'Justin', 'Daigo', '1', '3', ('Chun-Li', 'Ken')),
+            ('3', 'Tokido', 'Sako', '2', '2', ('Akuma', 'Ryu')),
+        ]:
+            db.session.add(Replays(
+                id=challenge_id, game='sfiii3nr1', created=True, failed=False, video_processed=True,
+                p1=p1, p2=p2, p1_loc='US', p2_loc='JP', p1_rank=p1_rank, p2_rank=p2_rank, length=60,
+                date_replay=datetime.datetime(2022, 1, 1), date_added=datetime.datetime(2022, 1, int(challenge_id))
+            ))
+            db.session.add(Character_detect(id=int(challenge_id), challenge_id=challenge_id, p1_char=chars[0], p2_char=chars[1], game='sfiii3nr1', vid_time='0'))
+        db.session.commit()
+
     def test_advancedSearchResult(self, app: FlaskClient):
-        pass
+        """Test advanced search matches players, ranks and characters in either order."""
+        from fcreplay.site import queries
+        self._add_search_replays()
+
+        def search(**kwargs):
+            args = {'game_id': 'Any', 'p1_rank': 'any', 'p2_rank': 'any', 'search_query': '', 'order_by': 'date_added',
+                    'char1': 'Any', 'char2': 'Any', 'p1_name': '', 'p2_name': ''}
+            args.update(kwargs)
+            return [r.id for r in queries.advanced_search(**args).query]
+
+        with app.application.test_request_context():
+            assert search() == ['3', '2', '1']
+            assert search(p1_name='Justin', p2_name='Daigo') == ['2', '1']
+            assert search(p2_name='Sako') == ['3']
+            assert search(p1_name='daigo', p2_name='JUSTIN') == ['2', '1'], 'Player names should ignore case'
+            assert search(char1='ken', char2='chun-li') == ['2', '1'], 'Characters should ignore case'
+            assert search(p1_rank='1', p2_rank='3') == ['2', '1']
+            assert search(p1_rank='2') == ['3']
+            assert search(char1='Ken', char2='Chun-Li') == ['2', '1']
+            assert search(char1='Ryu', game_id='sfiii3nr1') == ['3']
+            assert search(char1='Ryu', game_id='kof98') == []
+
+        rv = app.get('/advancedSearchResult?game=Any&p1_rank=any&p2_rank=any&char1=Ken&char2=Any&order_by=date_added&search=')
+        assert rv.status_code == 200
+
+    def test_advancedSearchResult_plan(self, app: FlaskClient):
+        """Advanced search should read replays once, and only filter on the fields that are set."""
+        from fcreplay.migrations import _replay_indexes
+        from fcreplay.site import queries
+
+        with db.engine.begin() as connection:
+            _replay_indexes(connection)
+
+        def explain(query):
+            statement = query.statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+            sql = str(statement)
+            plan = [row[-1] for row in db.session.execute(db.text(f'explain query plan {sql}'))]
+            return sql, plan
+
+        with app.application.test_request_context():
+            sql, plan = explain(queries.advanced_search('Any', 'any', 'any', '', 'date_added', p1_name='', p2_name='').query)
+            assert 'UNION' not in sql and 'LIKE' not in sql.upper() and 'EXISTS' not in sql, \
+                'Unconstrained searches should not add predicates'
+            assert len([p for p in plan if 'replays' in p]) == 1, f"Replays should only be read once: {plan}"
+
+            sql, plan = explain(queries.advanced_search('sfiii3nr1', '1', '3', '', 'date_added', 'Ken', 'Chun-Li', 'Daigo', 'Justin').query)
+            assert 'UNION' not in sql, 'Symmetric matches should not use UNION'
+            assert len([p for p in plan if 'replays' in p]) == 1, f"Replays should only be read once: {plan}"
+            assert any('character_detect USING INDEX ix_character_detect_challenge_id' in p for p in plan), \
+                f"Characters should be looked up by challenge id: {plan}"
 
     def test_search(self, app: FlaskClient):
-        pass
+        """Test searching descriptions with the full text index."""
+        from fcreplay.migrations import _description_search
+        from fcreplay.site import queries
+        from fcreplay.site.models import Descriptions, Replays
+
+        with db.engine.begin() as connection:
+            _description_search(connection)
+
+        descriptions = {
+            '1': 'Daigo vs Justin, Ken vs Chun-Li',
+            '2': 'Justin vs Daigo, Daigo wins, Daigo Daigo',
+            '3': 'Tokido vs Sako',
+        }
+        for challenge_id, description in descriptions.items():
+            db.session.add(Replays(
+                id=challenge_id, game='sfiii3nr1', created=True, failed=False, video_processed=True,
+                p1='P1', p2='P2', p1_loc='US', p2_loc='JP', p1_rank='1', p2_rank='2', length=60,
+                date_replay=datetime.datetime(2022, 1, 1), date_added=datetime.datetime(2022, 1, 1)
+            ))
+            db.session.add(Descriptions(id=challenge_id, description=description))
+            db.session.execute(db.text('insert into descriptions_fts (id, description) values (:id, :d)'), {'id': challenge_id, 'd': description})
+        db.session.commit()
+
+        with app.application.test_request_context():
+            assert [r.id for r in queries.basic_search('%', 'daigo justin', 'relevance').query] == ['2', '1'], \
+                'Results should be ranked by relevance'
+            assert [r.id for r in queries.basic_search('%', 'chun-li "', 'date_added').query] == ['1'], \
+                'Search operators should be matched literally'
+            assert {r.id for r in queries.basic_search('%', '', 'date_added').query} == {'1', '2', '3'}
+
+            app.application.config['FULLTEXT_SEARCH'] = False
+            assert [r.id for r in queries.basic_search('%', 'tokido vs', 'date_added').query] == ['3'], \
+                'Should fall back to ilike'
+            app.application.config['FULLTEXT_SEARCH'] = True
+
+        rv = app.get('/search?search=sako&game=Any&order_by=relevance')
+        assert rv.status_code == 200
+
+    def test_keyset_pagination(self, app: FlaskClient):
+        """Walk the replay listing forwards and backwards with cursors."""
+        from fcreplay.site import queries
+        from fcreplay.site.cache import cache
+        from fcreplay.site.models import Replays
+        from fcreplay.site.pagination import KeysetPagination
+
+        cache.clear()
+        for i in range(20):
+            db.session.add(Replays(
+                id=f'replay-{i:02}', game='sfiii3nr1', created=True, failed=False, video_processed=True,
+                p1='P1', p2='P2', p1_loc='US', p2_loc='JP', p1_rank='1', p2_rank='2', length=60,
+                date_replay=datetime.datetime(2022, 1, 1), date_added=datetime.datetime(2022, 1, 1 + i // 3)
+            ))
+        db.session.commit()
+        expected = [r.id for r in queries.all_replays().query]
+
+        with app.application.test_request_context('/'):
+            pages = [KeysetPagination(queries.all_replays(), per_page=9, count_key='all')]
+            while pages[-1].has_next:
+                pages.append(KeysetPagination(queries.all_replays(), cursor=pages[-1].next_cursor, per_page=9))
+            assert [r.id for p in pages for r in p.items] == expected, 'Pages should cover every replay once, in order'
+            assert pages[0].total == 20
+            assert not pages[0].has_prev and pages[1].has_prev
+
+            back = KeysetPagination(queries.all_replays(), cursor=pages[-1].prev_cursor, per_page=9)
+            assert [r.id for r in back.items] == [r.id for r in pages[1].items], 'Previous should return the page before'
+
+            legacy = KeysetPagination(queries.all_replays(), page=2, per_page=9)
+            assert [r.id for r in legacy.items] == expected[9:18], 'Legacy page numbers should still work'
+            assert legacy.has_prev and legacy.has_next
+
+            invalid = KeysetPagination(queries.all_replays(), cursor='not a cursor', per_page=9)
+            assert [r.id for r in invalid.items] == expected[:9], 'Invalid cursors should return the first page'
+
+        from fcreplay.site.pagination import encode_cursor
+        crafted = [
+            encode_cursor('next', 'not a date', 'replay-10'),
+            encode_cursor('next', [1, 2], 'replay-10'),
+            encode_cursor('next', {'dt': 5}, 'replay-10'),
+            encode_cursor('next', datetime.datetime(2022, 1, 3), ['replay-10']),
+            encode_cursor('prev', None, 'replay-10'),
+        ]
+        for cursor in crafted:
+            rv = app.get(f'/?cursor={cursor}')
+            assert rv.status_code == 200, 'Crafted cursors should show the first page'
+            assert expected[0].encode() in rv.data
+
+        rv = app.get('/?page=2')
+        assert rv.status_code == 200
+        assert b'cursor=' in rv.data, 'Pages should link with cursors'
+        cache.clear()
+
+    def test_keyset_pagination_nulls(self, app: FlaskClient):
+        """Replays without a value for the sort column are left out of the listing."""
+        from fcreplay.site import queries
+        from fcreplay.site.cache import cache
+        from fcreplay.site.models import Replays
+        from fcreplay.site.pagination import KeysetPagination
+
+        cache.clear()
+        for i in range(6):
+            db.session.add(Replays(
+                id=f'replay-{i:02}', game='sfiii3nr1', created=True, failed=False, video_processed=True,
+                p1='P1', p2='P2', length=None if i % 2 else 60 + i,
+                date_replay=datetime.datetime(2022, 1, 1), date_added=datetime.datetime(2022, 1, 1)
+            ))
+        db.session.commit()
+
+        with app.application.test_request_context('/'):
+            listing = queries.advanced_search('Any', 'any', 'any', '', 'length')
+            first = KeysetPagination(listing, per_page=2)
+            second = KeysetPagination(listing, cursor=first.next_cursor, per_page=2)
+            assert [r.id for r in first.items + second.items] == ['replay-04', 'replay-02', 'replay-00']
+            assert not second.has_next
+            assert listing.query.count() == 3, 'Replays without a length should not be listed by length'
+        cache.clear()
+
+    def test_feeds(self, app: FlaskClient):
+        """Test feeds are cached and support conditional requests."""
+        from fcreplay.site.cache import cache
+        from fcreplay.site.models import Cache_generation, Replays
+
+        cache.clear()
+        db.session.add(Replays(
+            id='replay-1', game='sfiii3nr1', created=True, failed=False, video_processed=True,
+            p1='P1', p2='P2', p1_loc='US', p2_loc='JP', date_added=datetime.datetime(2022, 1, 1)
+        ))
+        db.session.commit()
+
+        for url, content_type in [('/feed/atom', 'application/atom+xml'), ('/feed/rss', 'application/rss+xml')]:
+            rv = app.get(url)
+            assert rv.status_code == 200
+            assert rv.content_type.startswith(content_type)
+            assert ET.fromstring(rv.data)
+            assert rv.headers['Last-Modified'] == 'Sat, 01 Jan 2022 00:00:00 GMT'
+
+            assert app.get(url, headers={'If-None-Match': rv.headers['ETag']}).status_code == 304
+            assert app.get(url, headers={'If-Modified-Since': rv.headers['Last-Modified']}).status_code == 304
+
+        rss = ET.fromstring(app.get('/feed/rss').data)
+        assert rss.find('channel/lastBuildDate').text == 'Sat, 01 Jan 2022 00:00:00 +0000', \
+            'The rss build date should not change between renders'
+
+        etag = app.get('/feed/atom').headers['ETag']
+        db.session.add(Replays(
+            id='replay-2', game='sfiii3nr1', created=True, failed=False, video_processed=True,
+            p1='P3', p2='P4', p1_loc='US', p2_loc='JP', date_added=datetime.datetime(2022, 1, 2)
+        ))
+        db.session.commit()
+        assert app.get('/feed/atom').headers['ETag'] == etag, 'Feeds should be cached'
+
+        db.session.add(Cache_generation(name='replays', generation=1))
+        db.session.commit()
+        rv = app.get('/feed/atom')
+        assert rv.headers['ETag'] != etag, 'Feeds should be rendered again when the generation changes'
+        assert b'replay-2' in rv.data
+        cache.clear()
 
     def test_robots_and_ads(self, app: FlaskClient):
         """Test the robots.txt and ads.txt."""
@@ -211,8 +411,9 @@ class TestSite:
         assert rv_ads.status_code == 200
         assert rv_robots.status_code == 200
 
-    def test_sitemap(self, app: FlaskClient):
+    def test_sitemap(self, app: FlaskClient, tmp_path):
         """Test the sitemap."""
+        app.application.config['SITEMAP_DIR'] = str(tmp_path)
         rv = app.get('/sitemap.xml')
 
         assert rv.status_code == 200
@@ -224,3 +425,117 @@ class TestSite:
             assert False, "Bad xml should have thrown an exception"
         except ET.ParseError:
             assert True
+
+    def test_sitemap_videos(self, app: FlaskClient, tmp_path, monkeypatch):
+        """Test video sitemaps are split, gzipped and only written again when they have new replays."""
+        import gzip
+        from fcreplay.site import sitemap
+        from fcreplay.site.models import Cache_generation, Replays
+
+        monkeypatch.setattr(sitemap, 'URLS_PER_SITEMAP', 2)
+        app.application.config['SITEMAP_DIR'] = str(tmp_path)
+        app.application.config['SITE_URL'] = 'http://localhost/'
+        ns = {'s': 'http://www.sitemaps.org/schemas/sitemap/0.9'}
+
+        def add_replays(days):
+            for day in days:
+                db.session.add(Replays(
+                    id=f'replay-{day}', game='sfiii3nr1', created=True, failed=False, video_processed=True,
+                    date_added=datetime.datetime(2022, 1, day)
+                ))
+            db.session.add(Replays(id=f'failed-{days[0]}', created=True, failed=True, video_processed=True,
+                                   date_added=datetime.datetime(2022, 1, days[0])))
+
+        def video_urls(number):
+            rv = app.get(f'/sitemap-videos-{number}.xml.gz')
+            assert rv.status_code == 200
+            urls = ET.fromstring(gzip.decompress(rv.data))
+            return [u.find('s:loc', ns).text for u in urls]
+
+        add_replays([1, 2, 3])
+        db.session.commit()
+
+        index = ET.fromstring(app.get('/sitemap.xml').data)
+        locs = [s.find('s:loc', ns).text for s in index]
+        assert locs == [
+            'http://localhost/sitemap-pages.xml',
+            'http://localhost/sitemap-videos-0.xml.gz',
+            'http://localhost/sitemap-videos-1.xml.gz'
+        ]
+        assert video_urls(0) == ['http://localhost/video/replay-1', 'http://localhost/video/replay-2']
+        assert video_urls(1) == ['http://localhost/video/replay-3']
+        assert app.get('/sitemap-videos-2.xml.gz').status_code == 404
+        assert ET.fromstring(app.get('/sitemap-pages.xml').data)
+
+        first_sitemap = os.stat(tmp_path / 'sitemap-videos-0.xml.gz').st_ino
+
+        add_replays([4, 5])
+        db.session.add(Cache_generation(name='replays', generation=1))
+        db.session.commit()
+
+        index = ET.fromstring(app.get('/sitemap.xml').data)
+        assert len(index) == 4
+        assert index[-1].find('s:lastmod', ns).text == '2022-01-05'
+        assert os.stat(tmp_path / 'sitemap-videos-0.xml.gz').st_ino == first_sitemap, 'Full sitemaps should not be written again'
+        assert video_urls(1) == ['http://localhost/video/replay-3', 'http://localhost/video/replay-4']
+        assert video_urls(2) == ['http://localhost/video/replay-5']
+
+        last_sitemap = os.stat(tmp_path / 'sitemap-videos-2.xml.gz').st_ino
+        index = ET.fromstring(app.get('/sitemap.xml', headers={'Host': 'evil.example.com'}).data)
+        assert index[0].find('s:loc', ns).text == 'http://localhost/sitemap-pages.xml', 'Urls should not use the Host header'
+        assert os.stat(tmp_path / 'sitemap-videos-2.xml.gz').st_ino == last_sitemap, 'Another host should not write sitemaps again'
+        assert video_urls(2) == ['http://localhost/video/replay-5']
+
+    def test_response_cache(self, app: FlaskClient):
+        """Test pages are cached until the replays generation changes."""
+        from fcreplay.site.models import Cache_generation, Replays
+
+        def add_replay(challenge_id):
+            db.session.add(Replays(
+                id=challenge_id, game='sfiii3nr1', created=True, failed=False, video_processed=True,
+                p1='P1', p2='P2', p1_loc='US', p2_loc='JP', p1_rank='1', p2_rank='2', length=60,
+                date_replay=datetime.datetime(2022, 1, 1), date_added=datetime.datetime(2022, 1, 1)
+            ))
+            db.session.commit()
+
+        add_replay('replay-1')
+        rv = app.get('/')
+        assert rv.status_code == 200
+        assert b'replay-1' in rv.data
+        assert rv.headers['ETag']
+        assert rv.cache_control.public and rv.cache_control.max_age == 60
+
+        assert app.get('/', headers={'If-None-Match': rv.headers['ETag']}).status_code == 304
+
+        add_replay('replay-2')
+        assert b'replay-2' not in app.get('/').data, 'The page should be cached'
+        assert b'replay-2' in app.get('/?page=1').data, 'The query string should be part of the key'
+
+        db.session.add(Cache_generation(name='replays', generation=1))
+        db.session.commit()
+        assert b'replay-2' in app.get('/').data, 'The page should be rendered again when the generation changes'
+
+    def test_response_cache_disabled(self, app: FlaskClient):
+        """Test pages are rendered for every request when the cache is disabled."""
+        from fcreplay.site.models import Replays
+
+        app.application.config['RESPONSE_CACHE'] = {'backend': 'none', 'max_age': 10}
+        assert app.get('/').cache_control.max_age == 10
+
+        db.session.add(Replays(
+            id='replay-1', game='sfiii3nr1', created=True, failed=False, video_processed=True,
+            p1='P1', p2='P2', p1_loc='US', p2_loc='JP', p1_rank='1', p2_rank='2', length=60,
+            date_replay=datetime.datetime(2022, 1, 1), date_added=datetime.datetime(2022, 1, 1)
+        ))
+        db.session.commit()
+        assert b'replay-1' in app.get('/').data
+
+    def test_response_cache_redis_missing(self, monkeypatch):
+        """Test the redis backend needs the redis package."""
+        from fcreplay.site import response_cache
+
+        monkeypatch.setattr(response_cache, 'redis', None)
+        with pytest.raises(ImportError):
+            response_cache.make_backend({'backend': 'redis'})
+        with pytest.raises(ValueError):
+            response_cache.make_backend({'backend': 'memcached'})
@@ -18,6 +18,10 @@ class TestSupprtedGames:
                 if not isinstance(ar, int):
                     assert False, f"Aspect ratio for {gameid} is not int"
 
+            debounce = supported_games[gameid].get('character_debounce', 0)
+            if not isinstance(debounce, int) or debounce < 0:
+                assert False, f"Character debounce for {gameid} is not a positive int"
+
     def test_duplicated_games(self):
         with open(pkg_resources.resource_filename('fcreplay', 'data/supported_games.json')) as f:
             supported_games = json.load(f)
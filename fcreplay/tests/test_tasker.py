@@ -1,5 +1,9 @@
 from unittest.mock import patch
+from fcreplay.database import dispose_engines
+from fcreplay.models import Submissions
+from fcreplay.status import status
 from fcreplay.tasker import Tasker
+import datetime
 
 
 class TestTasker:
@@ -17,19 +21,77 @@ class TestTasker:
 
         with patch.object(Tasker, 'number_of_instances', return_value=0):
             with patch.object(Tasker, 'launch_fcreplay') as launch_fcreplay:
-                tasker.db.get_oldest_player_replay.return_value = True
+                tasker.db.has_queued_replay.return_value = True
                 assert tasker.check_for_replay() is True, 'Should return true'
                 capture = capsys.readouterr()
-                assert 'Found player replay' in capture.out, 'Should find player replay'
+                assert 'Found replay' in capture.out, 'Should find replay'
                 assert launch_fcreplay.assert_called, 'Should launch fcreplay'
 
-                tasker.db.get_oldest_player_replay.return_value = None
-                tasker.db.get_oldest_replay.return_value = True
-                assert tasker.check_for_replay() is True, 'Should return true'
-                capture = capsys.readouterr()
-                assert 'Found replay' in capture.out, 'Should find player replay'
-                assert launch_fcreplay.assert_called, 'Should launch fcreplay'
-
-                tasker.db.get_oldest_player_replay.return_value = None
-                tasker.db.get_oldest_replay.return_value = None
+                tasker.db.has_queued_replay.return_value = False
                 assert tasker.check_for_replay() is False, 'Should return false'
+
+    @patch('fcreplay.getreplay.FightcadeApi')
+    @patch('fcreplay.getreplay.Config')
+    @patch('fcreplay.database.Config')
+    def test_process_submissions(self, mock_config_db, mock_config_gr, mock_api):
+        mock_config_db.return_value.sql_baseurl = 'sqlite+pysqlite:///:memory:'
+        mock_config_db.return_value.sql_pool = {}
+        mock_config_gr.return_value.min_replay_length = 1
+        mock_config_gr.return_value.max_replay_length = 1000
+        mock_config_gr.return_value.banned_users = ['BannedUser1']
+
+        def get_data(query):
+            players = {
+                '1234567891234-1234': ['Player1 Name', 'Player2 Name'],
+                '1234567891234-1235': ['BannedUser1', 'Player2 Name'],
+            }[query['quarkid']]
+            return {'results': {'results': [{
+                "quarkid": query['quarkid'],
+                "date": 1659855001234,
+                "duration": 123.066,
+                "emulator": "fbneo",
+                "gameid": "sf2",
+                "players": [{"name": p, "country": "US", "rank": 2} for p in players]
+            }]}, 'res': 'OK'}
+        mock_api.return_value.get_data.side_effect = get_data
+
+        dispose_engines()
+        tasker = Tasker()
+        tasker.db.migrate()
+        for url in ['https://replay.fightcade.com/fbneo/sf2/1234567891234-1234', 'https://replay.fightcade.com/fbneo/sf2/1234567891234-1235']:
+            tasker.db.session.add(Submissions(url=url, status=status.SUBMITTED, date_added=datetime.datetime.utcnow()))
+        tasker.db.session.commit()
+
+        assert tasker.process_submissions() == 2, 'Should process every pending submission'
+        assert tasker.process_submissions() == 0, 'Submissions should only be processed once'
+
+        results = [s.status for s in tasker.db.session.query(Submissions).order_by(Submissions.id)]
+        assert results == [status.ADDED, status.BANNED_USER]
+        assert tasker.db.get_single_replay('1234567891234-1234').player_requested is True
+        dispose_engines()
+
+    @patch('fcreplay.tasker.Getreplay')
+    @patch('fcreplay.database.Config')
+    def test_process_submissions_failures(self, mock_config_db, mock_getreplay):
+        mock_config_db.return_value.sql_baseurl = 'sqlite+pysqlite:///:memory:'
+        mock_config_db.return_value.sql_pool = {}
+        mock_config_db.return_value.loglevel = 'INFO'
+        mock_getreplay.side_effect = IOError('Unable to create the api client')
+
+        dispose_engines()
+        tasker = Tasker()
+        tasker.db.migrate()
+        now = datetime.datetime.utcnow()
+        tasker.db.session.add_all([
+            Submissions(url='submitted', status=status.SUBMITTED, date_added=now),
+            Submissions(url='abandoned', status=status.CHECKING, date_added=now, date_claimed=now - datetime.timedelta(hours=1)),
+            Submissions(url='checking', status=status.CHECKING, date_added=now, date_claimed=now),
+        ])
+        tasker.db.session.commit()
+
+        assert tasker.process_submissions() == 2, 'Abandoned submissions should be claimed again'
+
+        results = [s.status for s in tasker.db.session.query(Submissions).order_by(Submissions.id)]
+        assert results == [status.FAILED, status.FAILED, status.CHECKING], \
+            'Submissions should be failed when Getreplay cannot be created'
+        dispose_engines()
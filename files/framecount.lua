@@ -1,4 +1,9 @@
 INITIAL_FRAME=-1
+TOTAL_FRAMES=0
+
+-- framecount.log is append only. Every record is a whole line written in a
+-- single write and flushed, so the reader never sees a partial frame count.
+LOG = io.open("framecount.log", "w")
 
 function g_framecount()
     if(INITIAL_FRAME == -1)
@@ -9,11 +14,12 @@ function g_framecount()
     -- Write out the frame count ever 0.1 seconds ( roughly )
     if TOTAL_FRAMES % 10 == 0 then
         print(TOTAL_FRAMES)
-        file = io.open("framecount.txt", "w")
-        file:write(TOTAL_FRAMES)
-        file:close()
+        LOG:write(TOTAL_FRAMES .. "\n")
+        LOG:flush()
     end
 end
 
--- Frame count doesn't reset after f3
+-- Frame count doesn't reset after f3. The emulator doesn't report when a
+-- stream finishes, per frame callbacks just stop, so Record stops recording
+-- when the frame count stops increasing
 emu.registerafter(function() g_framecount() end)